@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of row normalisation: the per-value `Normalisation` loop
+that `insert_data` used against `RowNormaliser` row and batch APIs.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_normalisation --rows 100000
+"""
+
+import argparse
+import random
+import timeit
+
+from scripts.setup_db import Normalisation, RowNormaliser
+
+# information_schema metadata of the `students` table
+STUDENT_COLUMNS = [
+    ("id", "integer", "NO"),
+    ("birthday", "date", "YES"),
+    ("name", "text", "NO"),
+    ("room", "integer", "NO"),
+    ("sex", "character varying", "YES"),
+]
+
+
+def make_rows(count: int, seed: int = 0) -> list[dict]:
+    rnd = random.Random(seed)
+    return [
+        {
+            "id": index,
+            "birthday": f"{rnd.randint(1950, 2015)}-0{rnd.randint(1, 9)}-1"
+            f"{rnd.randint(0, 9)}T00:00:00.000000",
+            "name": f"Student {index}",
+            "room": rnd.randint(0, 999),
+            "sex": rnd.choice("MF"),
+        }
+        for index in range(count)
+    ]
+
+
+def per_value(norm_dict: dict[str, Normalisation], rows: list[dict]) -> list[tuple]:
+    # the loop insert_data ran before RowNormaliser
+    insertion_list = []
+    for row in rows:
+        fail = False
+        insertion_tuple = ()
+        for key in norm_dict.keys():
+            try:
+                insertion_tuple += (norm_dict[key].normalise_value(row[key]),)
+            except (ValueError, TypeError):
+                fail = True
+                break
+        if not fail:
+            insertion_list.append(insertion_tuple)
+    return insertion_list
+
+
+def per_row(normaliser: RowNormaliser, rows: list[dict]) -> list[tuple]:
+    insertion_list = []
+    for row in rows:
+        try:
+            insertion_list.append(normaliser.normalise_row(row))
+        except (ValueError, TypeError):
+            pass
+    return insertion_list
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    norm_dict = {
+        parameter[0]: Normalisation(parameter) for parameter in STUDENT_COLUMNS
+    }
+    normaliser = RowNormaliser(STUDENT_COLUMNS)
+    expected = per_value(norm_dict, rows)
+    assert per_row(normaliser, rows) == expected
+    assert normaliser.normalise_batch(rows)[0] == expected
+
+    candidates = {
+        "Normalisation.normalise_value": lambda: per_value(norm_dict, rows),
+        "RowNormaliser.normalise_row": lambda: per_row(normaliser, rows),
+        "RowNormaliser.normalise_batch": lambda: normaliser.normalise_batch(rows),
+    }
+    baseline = None
+    for label, candidate in candidates.items():
+        best = min(timeit.repeat(candidate, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print(
+            f"{label:32} {best:8.3f}s {args.rows / best:12,.0f} rows/s"
+            f" x{baseline / best:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+End-to-end benchmark of the pipeline stages against a local PostgreSQL.
+
+For every scale, generates a dataset with `benchmarks.generate`, rebuilds
+the schema and times each stage in a fresh process:
+
+    ingest     insert_data('rooms') and insert_data('students')
+    normalise  RowNormaliser over the students files, no database
+    refresh    refresh_view() of the `ages` materialized view
+    json       report_to_json(force=True)
+    xml        report_to_xml(force=True)
+    csv        report_to_csv(force=True)
+    ndjson     report_to_ndjson(force=True)
+
+Wall time, CPU time, throughput and peak resident memory of every stage
+are written to a JSON results file. Passing an earlier file as
+`--baseline` prints the ratio per stage and exits with 1 when a stage got
+slower than `--tolerance`.
+
+The .env database parameters are used, the database is recreated.
+Run from the repository root:
+
+    python -m benchmarks.bench_pipeline --scale 10k --scale 1m
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.generate import generate
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+STAGES = ("ingest", "normalise", "refresh", "json", "xml", "csv", "ndjson")
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _setup() -> None:
+    from scripts.setup_db import grant_priveleges, migrate, reset_parameters
+
+    reset_parameters()
+    grant_priveleges()
+    migrate()
+
+
+def _ingest() -> None:
+    from scripts.setup_db import insert_data
+
+    insert_data("rooms")
+    insert_data("students")
+
+
+def _normalise() -> None:
+    from benchmarks.bench_normalisation import STUDENT_COLUMNS
+    from scripts.reader import JsonArrayReader, batched
+    from scripts.setup_db import BATCH_SIZE, RowNormaliser
+
+    normaliser = RowNormaliser(STUDENT_COLUMNS)
+    for file_name in sorted(os.listdir("datasets/parsed")):
+        if file_name.startswith("students"):
+            path = os.path.join("datasets/parsed", file_name)
+            for batch in batched(JsonArrayReader(path), BATCH_SIZE):
+                normaliser.normalise_batch(batch)
+
+
+def _refresh() -> None:
+    from scripts.setup_db import refresh_view
+
+    refresh_view()
+
+
+def _json() -> None:
+    from scripts.report import report_to_json
+
+    report_to_json(force=True)
+
+
+def _xml() -> None:
+    from scripts.report import report_to_xml
+
+    report_to_xml(force=True)
+
+
+def _csv() -> None:
+    from scripts.report import report_to_csv
+
+    report_to_csv(force=True)
+
+
+def _ndjson() -> None:
+    from scripts.report import report_to_ndjson
+
+    report_to_ndjson(force=True)
+
+
+RUNNERS = {
+    "setup": _setup,
+    "ingest": _ingest,
+    "normalise": _normalise,
+    "refresh": _refresh,
+    "json": _json,
+    "xml": _xml,
+    "csv": _csv,
+    "ndjson": _ndjson,
+}
+
+
+def _peak_rss_kb() -> int:
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS
+
+
+def _run_stage(stage: str, workdir: str, results: multiprocessing.Queue) -> None:
+    os.chdir(workdir)
+    sys.path.insert(0, REPO)
+    started, started_cpu = time.perf_counter(), time.process_time()
+    RUNNERS[stage]()
+    results.put(
+        {
+            "seconds": time.perf_counter() - started,
+            "cpu_seconds": time.process_time() - started_cpu,
+            "peak_rss_kb": _peak_rss_kb(),
+        }
+    )
+
+
+def run_stage(stage: str, workdir: str) -> dict:
+    """
+    Runs one stage in a fresh process, so its peak memory is its own.
+
+    Raises
+    ------
+    RuntimeError
+        If the stage process fails.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_stage, args=(stage, workdir, results))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Stage {stage} failed with exit code {process.exitcode}")
+    return results.get()
+
+
+def prepare_workdir(data: str) -> str:
+    """
+    Creates a working directory with `sql/`, `reports/` and a `datasets/`
+    holding hard links to the generated files, as `insert_data` moves the
+    files it loads.
+    """
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.symlink(os.path.join(REPO, "sql"), os.path.join(workdir, "sql"))
+    os.makedirs(os.path.join(workdir, "datasets"))
+    os.makedirs(os.path.join(workdir, "reports"))
+    for file_name in os.listdir(data):
+        os.link(
+            os.path.join(data, file_name), os.path.join(workdir, "datasets", file_name)
+        )
+    return workdir
+
+
+def server_version() -> str:
+    from scripts.connection import pooled_connection
+
+    with pooled_connection() as connection:
+        row = connection.execute("SHOW server_version").fetchone()
+    return row[0] if row else ""
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> bool:
+    """Prints time ratios against `baseline`, returns False on a regression."""
+    previous = {(row["scale"], row["stage"]): row for row in baseline}
+    ok = True
+    for row in results:
+        before = previous.get((row["scale"], row["stage"]))
+        if not before or not before["seconds"]:
+            continue
+        ratio = row["seconds"] / before["seconds"]
+        slower = ratio > 1 + tolerance
+        ok = ok and not slower
+        print(
+            f"{row['scale']:>4} {row['stage']:10} x{ratio:.2f}"
+            + ("  REGRESSION" if slower else "")
+        )
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", action="append", choices=SCALES)
+    parser.add_argument("--stage", action="append", choices=STAGES)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.01)
+    parser.add_argument("--invalid-ratio", type=float, default=0.01)
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument(
+        "--data-dir", default=os.path.join(tempfile.gettempdir(), "bench-data")
+    )
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    stages = [stage for stage in STAGES if stage in (args.stage or STAGES)]
+
+    results = []
+    for scale in args.scale or ["10k"]:
+        students = SCALES[scale]
+        # generated files are kept and reused for the same parameters
+        data = os.path.join(
+            args.data_dir,
+            f"{scale}-r{args.rooms}-s{args.seed}-d{args.duplicate_ratio}"
+            f"-i{args.invalid_ratio}-f{args.files}",
+        )
+        if not os.path.isdir(data):
+            generate(
+                data,
+                students,
+                args.rooms,
+                args.seed,
+                args.duplicate_ratio,
+                args.invalid_ratio,
+                args.files,
+            )
+        workdir = prepare_workdir(data)
+        run_stage("setup", workdir)
+        # normalise reads the files ingest moved to datasets/parsed
+        for stage in ["ingest"] + [stage for stage in stages if stage != "ingest"]:
+            measured = run_stage(stage, workdir)
+            rows = students + args.rooms if stage == "ingest" else students
+            row = {
+                "scale": scale,
+                "stage": stage,
+                "rows": rows,
+                **measured,
+                "rows_per_second": rows / measured["seconds"],
+            }
+            print(
+                f"{scale:>4} {stage:10} {row['seconds']:9.3f}s"
+                f" {row['rows_per_second']:14,.0f} rows/s"
+                f" {row['peak_rss_kb'] / 1024:9.1f} MiB"
+            )
+            if stage in stages:
+                results.append(row)
+
+    output = args.output or os.path.join(
+        REPO,
+        "benchmarks",
+        "results",
+        f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json",
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, mode="w") as w_file:
+        json.dump(
+            {
+                "revision": git_revision(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "postgres": server_version(),
+                "cpus": os.cpu_count(),
+                "parameters": {
+                    key: value for key, value in vars(args).items() if key != "baseline"
+                },
+                "results": results,
+            },
+            w_file,
+            indent=4,
+        )
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="UTF-8") as file:
+            baseline = json.load(file)["results"]
+        return 0 if compare(results, baseline, args.tolerance) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of XML report writing: `dicttoxml` + `minidom` pretty
+printing that `report_to_xml` used against the streaming `write_xml_rows`.
+
+Time is the best of `--repeat` runs, memory the peak traced by
+`tracemalloc` in one run (the rows themselves excluded). Run from the
+repository root:
+
+    python -m benchmarks.bench_xml --rows 20000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import timeit
+import tracemalloc
+from typing import Callable
+
+from scripts.xmlwriter import write_xml_rows
+
+
+def make_rows(count: int, seed: int = 0) -> list[dict]:
+    # shaped like the `sql/reporting` results, json_agg decoded
+    rnd = random.Random(seed)
+    return [
+        {
+            "id": index,
+            "name": f"Room #{index} <{rnd.choice('MF')}> & co",
+            "average_age": rnd.randint(1000, 9000) / 100,
+            "count": rnd.randint(0, 40),
+        }
+        for index in range(count)
+    ]
+
+
+def minidom_pretty(path: str, rows: list[dict]) -> None:
+    # the path report_to_xml ran before write_xml_rows
+    from dicttoxml import dicttoxml
+    from xml.dom.minidom import parseString
+
+    raw_xml = dicttoxml(
+        rows,
+        custom_root="report",
+        item_func=lambda _: "row",
+        attr_type=False,
+        return_bytes=False,
+    )
+    with open(path, mode="w") as w_file:
+        w_file.write(parseString(raw_xml).toprettyxml(indent="   "))
+
+
+def streaming(path: str, rows: list[dict], indent: str | None = "   ") -> None:
+    with open(path, mode="w") as w_file:
+        write_xml_rows(w_file, "report", rows, indent)
+
+
+def peak_memory(candidate: Callable[[], None]) -> int:
+    tracemalloc.start()
+    try:
+        candidate()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    with tempfile.TemporaryDirectory() as directory:
+        expected, actual = (os.path.join(directory, name) for name in ("old", "new"))
+        minidom_pretty(expected, rows)
+        streaming(actual, rows)
+        with open(expected) as old, open(actual) as new:
+            assert old.read() == new.read(), "write_xml_rows output differs"
+
+        candidates = {
+            "dicttoxml + minidom": lambda: minidom_pretty(actual, rows),
+            "write_xml_rows": lambda: streaming(actual, rows),
+            "write_xml_rows (no indent)": lambda: streaming(actual, rows, None),
+        }
+        baseline = None
+        for label, candidate in candidates.items():
+            best = min(timeit.repeat(candidate, number=1, repeat=args.repeat))
+            baseline = baseline or best
+            print(
+                f"{label:28} {best:8.3f}s {args.rows / best:12,.0f} rows/s"
+                f" x{baseline / best:6.2f} {peak_memory(candidate) / 2**20:10.2f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
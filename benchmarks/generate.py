@@ -0,0 +1,186 @@
+"""
+Deterministic generator of `rooms` / `students` dataset files.
+
+Files follow the schema and layout of the files in `datasets/` (a JSON
+array, 4-space indent, sorted keys) and are written as a stream, so 10M
+students need no more memory than 10k. The same arguments always produce
+byte-identical files.
+
+Run from the repository root:
+
+    python -m benchmarks.generate --students 1000000 --out /tmp/datasets
+"""
+
+import argparse
+import os
+import random
+from datetime import date, timedelta
+from typing import Iterator
+
+FIRST_NAMES = (
+    "Amy", "Ben", "Carla", "Dan", "Eva", "Frank", "Gina", "Hugo", "Ida", "Jack",
+    "Kate", "Leo", "Mia", "Nick", "Olga", "Paul", "Rita", "Sam", "Tina", "Victor",
+)  # fmt: skip
+LAST_NAMES = (
+    "Adams", "Brown", "Clark", "Davis", "Evans", "Foster", "Green", "Hall",
+    "Irwin", "Jones", "King", "Lewis", "Moore", "Nash", "Owens", "Price",
+)  # fmt: skip
+FIRST_BIRTHDAY = date(1950, 1, 1)
+BIRTHDAY_SPAN = (date(2015, 12, 31) - FIRST_BIRTHDAY).days
+
+# values `RowNormaliser` rejects, one per invalid row in turn
+INVALID_VALUES = (
+    ("birthday", "not a date"),
+    ("room", None),
+    ("id", "not a number"),
+    ("name", None),
+)
+
+ROOM_ITEM = '    {{\n        "id": {id},\n        "name": "Room #{id}"\n    }}'
+STUDENT_ITEM = (
+    "    {{\n"
+    '        "birthday": {birthday},\n'
+    '        "id": {id},\n'
+    '        "name": {name},\n'
+    '        "room": {room},\n'
+    '        "sex": {sex}\n'
+    "    }}"
+)
+
+
+def _literal(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, int):
+        return str(value)
+    return f'"{value}"'
+
+
+def _write_array(path: str, items: Iterator[str]) -> None:
+    with open(path, mode="w", encoding="UTF-8") as w_file:
+        separator = "[\n"
+        for item in items:
+            w_file.write(separator)
+            w_file.write(item)
+            separator = ",\n"
+        w_file.write("\n]" if separator == ",\n" else "[]")
+
+
+def room_items(count: int) -> Iterator[str]:
+    for index in range(count):
+        yield ROOM_ITEM.format(id=index)
+
+
+def student_rows(
+    count: int,
+    rooms: int,
+    seed: int = 0,
+    duplicate_ratio: float = 0.0,
+    invalid_ratio: float = 0.0,
+) -> Iterator[dict]:
+    """
+    Yields `count` raw student rows.
+
+    A `duplicate_ratio` share of the rows repeat the id of an earlier row
+    (with other values, the first occurrence wins on insert), an
+    `invalid_ratio` share hold a value the normaliser rejects. Every valid
+    row references one of `rooms` rooms.
+
+    Raises
+    ------
+    ValueError
+        If the ratios are negative or add up to more than 1.
+    """
+    if duplicate_ratio < 0 or invalid_ratio < 0 or duplicate_ratio + invalid_ratio > 1:
+        raise ValueError("Ratios must be non-negative and add up to at most 1")
+    rnd = random.Random(seed)
+    next_id = 0
+    invalid = 0
+    for _ in range(count):
+        draw = rnd.random()
+        if draw < duplicate_ratio and next_id:
+            student_id = rnd.randrange(next_id)
+        else:
+            student_id = next_id
+            next_id += 1
+        row = {
+            "birthday": (
+                FIRST_BIRTHDAY + timedelta(rnd.randrange(BIRTHDAY_SPAN))
+            ).isoformat()
+            + "T00:00:00.000000",
+            "id": student_id,
+            "name": f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+            "room": rnd.randrange(rooms),
+            "sex": rnd.choice("MF"),
+        }
+        if duplicate_ratio <= draw < duplicate_ratio + invalid_ratio:
+            key, value = INVALID_VALUES[invalid % len(INVALID_VALUES)]
+            row[key] = value
+            invalid += 1
+        yield row
+
+
+def generate(
+    out: str,
+    students: int,
+    rooms: int = 1000,
+    seed: int = 0,
+    duplicate_ratio: float = 0.0,
+    invalid_ratio: float = 0.0,
+    files: int = 1,
+) -> list[str]:
+    """
+    Writes `rooms (1).json` and `students (1..files).json` into `out`,
+    students split evenly across `files`, and returns their paths.
+
+    Raises
+    ------
+    ValueError
+        If the ratios are out of range or `files` is less than 1.
+    """
+    if files < 1:
+        raise ValueError("files must be at least 1")
+    os.makedirs(out, exist_ok=True)
+    paths = [os.path.join(out, "rooms (1).json")]
+    _write_array(paths[0], room_items(rooms))
+    rows = student_rows(students, rooms, seed, duplicate_ratio, invalid_ratio)
+    for index in range(files):
+        share = students // files + (index < students % files)
+        path = os.path.join(out, f"students ({index + 1}).json")
+        _write_array(
+            path,
+            (
+                STUDENT_ITEM.format(
+                    **{key: _literal(value) for key, value in row.items()}
+                )
+                for _, row in zip(range(share), rows)
+            ),
+        )
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--out", default="datasets")
+    parser.add_argument("--students", type=int, default=10_000)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--invalid-ratio", type=float, default=0.0)
+    parser.add_argument("--files", type=int, default=1)
+    args = parser.parse_args()
+    for path in generate(
+        args.out,
+        args.students,
+        args.rooms,
+        args.seed,
+        args.duplicate_ratio,
+        args.invalid_ratio,
+        args.files,
+    ):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
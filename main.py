@@ -1,16 +1,28 @@
 # main.py
+import argparse
 import re
 import os
+import signal
+import threading
 
 from scripts.setup_db import (
     reset_parameters,
+    ensure_database,
     grant_priveleges,
-    create_tables,
-    load_functions,
+    migrate,
     insert_data,
-    load_indexes,
 )
-from scripts.report import report_to_json, report_to_xml
+from scripts.report import (
+    report_to_json,
+    report_to_xml,
+    report_to_csv,
+    report_to_ndjson,
+    report_to_formats,
+)
+from scripts.metrics import write_metrics
+from scripts.profiling import write_profiles
+from scripts.watch import watch
+from scripts.logger import configure_logging
 
 
 def run(label, fn, *args):
@@ -21,15 +33,15 @@ def run(label, fn, *args):
         print(f"{label}: FAILED -> {e}")
 
 
-def run_setup():
-    run("reset_parameters", reset_parameters)
-    run("grant_priveleges", grant_priveleges)
-    run("create_tables", create_tables)
-    run("load_funtions", load_functions)
-    run("load_indexes", load_indexes)
-    # defaults for seeding
-    insert_data.need_report_json = False  # type: ignore[attr-defined]
-    insert_data.need_report_xml = False  # type: ignore[attr-defined]
+def run_setup(reset=False):
+    # only an explicit --reset drops the database, otherwise keep the data
+    # and apply the sql/ scripts that changed since the last start
+    if reset:
+        run("reset_parameters", reset_parameters)
+        run("grant_priveleges", grant_priveleges)
+    else:
+        run("ensure_database", ensure_database)
+    run("migrate", migrate)
     print("setup: done")
 
 
@@ -44,14 +56,14 @@ ACTIONS = {
     ),
     "3": ("report_to_json()", lambda: run("report_to_json", report_to_json)),
     "4": ("report_to_xml()", lambda: run("report_to_xml", report_to_xml)),
+    # one query run feeds both encoders
     "5": (
         "report both",
-        lambda: (
-            run("report_to_json", report_to_json),
-            run("report_to_xml", report_to_xml),
-        ),
+        lambda: run("report_to_formats(json, xml)", report_to_formats, ("json", "xml")),
     ),
-    "6": ("rerun full setup", run_setup),
+    "6": ("rerun setup", run_setup),
+    "7": ("report_to_csv()", lambda: run("report_to_csv", report_to_csv)),
+    "8": ("report_to_ndjson()", lambda: run("report_to_ndjson", report_to_ndjson)),
 }
 
 
@@ -62,16 +74,41 @@ def print_menu():
     print("3. report_to_json()")
     print("4. report_to_xml()")
     print("5. report both (json+xml)")
-    print("6. rerun full setup")
+    print("6. rerun setup (apply changed sql scripts)")
+    print("7. report_to_csv()")
+    print("8. report_to_ndjson()")
     print("0. exit")
     print("Tip: you can enter multiple actions like: 1 3 4 or 1,3,4\n")
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Students/rooms pipeline menu")
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="drop and recreate the database before setup (deletes all data)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="no menu: load files landing in datasets/ and refresh the reports "
+        "until interrupted (WATCH_FRESHNESS, WATCH_INTERVAL, WATCH_REPORTS)",
+    )
+    args = parser.parse_args(argv)
+
     os.system("echo -n > logger.log")  # clean the log file
-    run_setup()  # auto-run at start
+    configure_logging()  # LOG_ASYNC/LOG_LEVEL/LOG_RATE_LIMIT of this run
+    run_setup(reset=args.reset)  # auto-run at start
+
+    if args.watch:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())  # docker stop
+        try:
+            watch(stop)
+        except KeyboardInterrupt:
+            print()
 
-    while True:
+    while not args.watch:
         print_menu()
         try:
             raw = input("select action(s): ").strip()
@@ -101,6 +138,12 @@ def main():
                 continue
             action[1]()  # run the callable
 
+    path = write_metrics()  # timings and counters of this run
+    if path:
+        print(f"metrics: {path}")
+    profiles = write_profiles()  # PROFILE functions of this run, if any
+    if profiles:
+        print(f"profiles: {profiles}")
     print("bye")
     return 0
 
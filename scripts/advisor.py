@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Any, Iterator, NamedTuple
+
+from psycopg import Cursor, sql
+
+from scripts import catalog
+from scripts.connection import pooled_connection
+from scripts.logger import logger
+
+PLANS_DIR = "reports/plans"
+# rows a sequential scan may read before it is flagged
+ADVISOR_SEQ_SCAN_ROWS = int(os.getenv("ADVISOR_SEQ_SCAN_ROWS", 10000))
+# share of execution time a candidate index must save to be recommended
+ADVISOR_MIN_GAIN = float(os.getenv("ADVISOR_MIN_GAIN", 0.2))
+# runs per measurement, the fastest one counts
+ADVISOR_REPEAT = int(os.getenv("ADVISOR_REPEAT", 3))
+
+
+class Candidate(NamedTuple):
+    table: str
+    columns: tuple[str, ...]
+
+    def ddl(self) -> str:
+        return f"CREATE INDEX ON {self.table} ({', '.join(self.columns)})"
+
+
+# covering index for the per-room aggregates over students (room_stats
+# rebuild, ages), always measured
+STATIC_CANDIDATES = (Candidate("students", ("room", "sex", "birthday")),)
+
+
+def advisor_queries() -> list[tuple[str, str]]:
+    """Returns the reporting queries and the query behind the `ages` view."""
+    from scripts.report import reporting_queries
+
+    view = catalog.script_text("sql/create_ages_view.sql")
+    definition = re.split(r"\bAS\b", view, maxsplit=1, flags=re.IGNORECASE)[1]
+    return reporting_queries() + [("ages", definition.strip())]
+
+
+def explain(cursor: Cursor, query: str) -> dict:
+    """Runs `query` under EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)."""
+    cursor.execute(
+        sql.SQL("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {}").format(
+            sql.SQL(query)  # type:ignore
+        )
+    )
+    row = cursor.fetchone()
+    if not row:
+        raise ValueError("EXPLAIN returned no plan")
+    return row[0][0]
+
+
+def plan_nodes(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def plan_findings(plan: dict) -> list[str]:
+    """Flags large sequential scans and sorts or hashes spilling to disk."""
+    findings = []
+    for node in plan_nodes(plan["Plan"]):
+        node_type = node["Node Type"]
+        loops = node.get("Actual Loops", 1)
+        read = (
+            node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)
+        ) * loops
+        if node_type == "Seq Scan" and read >= ADVISOR_SEQ_SCAN_ROWS:
+            findings.append(f"Seq Scan on {node['Relation Name']} reads {read} rows")
+        if node_type == "Sort" and node.get("Sort Space Type") == "Disk":
+            findings.append(
+                f"Sort on {', '.join(node.get('Sort Key', []))} spills"
+                f" {node.get('Sort Space Used')} kB to disk"
+            )
+        if node_type == "Hash" and node.get("Hash Batches", 1) > 1:
+            findings.append(f"Hash spills to disk in {node['Hash Batches']} batches")
+    return findings
+
+
+def _columns(expressions: list[str], columns: set[str]) -> tuple[str, ...]:
+    found: list[str] = []
+    for expression in expressions:
+        for word in re.findall(r"[a-z_][a-z0-9_]*", expression):
+            if word in columns and word not in found:
+                found.append(word)
+    return tuple(found)
+
+
+def plan_candidates(cursor: Cursor, plan: dict) -> set[Candidate]:
+    """
+    Proposes indexes from the plan: the filter columns of sequential scans
+    and plain column sort or group keys over a single table.
+    """
+    candidates = set()
+    nodes = list(plan_nodes(plan["Plan"]))
+    relations = {node["Relation Name"] for node in nodes if "Relation Name" in node}
+    table_columns = {
+        name: {column[0] for column in catalog.table_columns(cursor, name)}
+        for name in relations
+    }
+    for node in nodes:
+        if node["Node Type"] == "Seq Scan" and "Filter" in node:
+            name = node["Relation Name"]
+            columns = _columns([node["Filter"]], table_columns[name])
+            if columns:
+                candidates.add(Candidate(name, columns))
+        keys = node.get("Sort Key") or node.get("Group Key") or []
+        for name, columns_of in table_columns.items():
+            columns = _columns(keys, columns_of)
+            # every key must be a plain column of this table
+            if columns and len(columns) == len(keys):
+                candidates.add(Candidate(name, columns))
+    return candidates
+
+
+def measure(cursor: Cursor, query: str, candidate: Candidate) -> dict[str, Any]:
+    """
+    Times `query` against a scratch copy of the candidate table, without
+    and with the candidate index.
+
+    The copy is a temporary table of the same name, with the same primary
+    key and indexes, which shadows the real one for this session only, and
+    everything is rolled back, so the real table is neither locked nor
+    changed.
+    """
+
+    def best_time() -> tuple[float, dict]:
+        plans = [explain(cursor, query) for _ in range(max(1, ADVISOR_REPEAT))]
+        fastest = min(plans, key=lambda plan: plan["Execution Time"])
+        return fastest["Execution Time"], fastest
+
+    table = sql.Identifier(candidate.table)
+    source = sql.Identifier("public", candidate.table)
+    with cursor.connection.transaction(force_rollback=True):
+        # keeps the primary key and indexes, the "before" plan is the one
+        # the real table gets
+        cursor.execute(
+            sql.SQL(
+                "CREATE TEMP TABLE {} (LIKE {} INCLUDING INDEXES) ON COMMIT DROP"
+            ).format(table, source)
+        )
+        cursor.execute(sql.SQL("INSERT INTO {} SELECT * FROM {}").format(table, source))
+        cursor.execute(sql.SQL("ANALYZE {}").format(table))
+        before, _ = best_time()
+        cursor.execute(
+            sql.SQL("CREATE INDEX advisor_candidate ON {} ({})").format(
+                table, sql.SQL(", ").join(map(sql.Identifier, candidate.columns))
+            )
+        )
+        cursor.execute(sql.SQL("ANALYZE {}").format(table))
+        after, plan = best_time()
+    used = any(
+        node.get("Index Name") == "advisor_candidate"
+        for node in plan_nodes(plan["Plan"])
+    )
+    return {"before_ms": before, "after_ms": after, "index_used": used}
+
+
+@logger
+def advise(output_dir: str = PLANS_DIR) -> list[dict[str, Any]]:
+    """
+    Captures the plans of the reporting queries and of the `ages` view and
+    measures candidate indexes for them.
+
+    Every query runs under EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON); the plan
+    is saved to `output_dir` and checked for large sequential scans and
+    sorts spilling to disk. Candidate indexes (from the plan plus
+    `STATIC_CANDIDATES`) are measured on scratch copies of their table (see
+    `measure`) and recommended when the index is used and saves at least
+    ADVISOR_MIN_GAIN of the execution time. The findings are written to
+    `advice<time>.json` in `output_dir`.
+
+    Returns
+    -------
+    list[dict]
+        Per query: name, execution time, plan file, findings and measured
+        candidates with their recommendation.
+
+    Raises
+    ------
+    ConnectionError
+        If the database connection fails.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    advice = []
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            for name, query in advisor_queries():
+                with connection.transaction(force_rollback=True):
+                    plan = explain(cursor, query)
+                    candidates = plan_candidates(cursor, plan)
+                path = f"{output_dir}/{name}{datetime.now()}.json"
+                with open(path, mode="w") as w_file:
+                    w_file.write(json.dumps(plan, indent=4))
+                relations = {
+                    node["Relation Name"]
+                    for node in plan_nodes(plan["Plan"])
+                    if "Relation Name" in node
+                }
+                candidates.update(
+                    candidate
+                    for candidate in STATIC_CANDIDATES
+                    if candidate.table in relations
+                )
+                measured = []
+                for candidate in sorted(candidates):
+                    result = measure(cursor, query, candidate)
+                    gain = 1 - result["after_ms"] / max(result["before_ms"], 1e-9)
+                    recommended = result["index_used"] and gain >= ADVISOR_MIN_GAIN
+                    measured.append(
+                        {
+                            "index": candidate.ddl(),
+                            **result,
+                            "gain": gain,
+                            "recommended": recommended,
+                        }
+                    )
+                    if recommended:
+                        logging.info(
+                            "[ADVISOR] %s: %s saves %.0f%% (%.2f -> %.2f ms)",
+                            name,
+                            candidate.ddl(),
+                            gain * 100,
+                            result["before_ms"],
+                            result["after_ms"],
+                        )
+                findings = plan_findings(plan)
+                for finding in findings:
+                    logging.warning("[ADVISOR] %s: %s", name, finding)
+                advice.append(
+                    {
+                        "query": name,
+                        "execution_ms": plan["Execution Time"],
+                        "plan": path,
+                        "findings": findings,
+                        "candidates": measured,
+                    }
+                )
+    with open(f"{output_dir}/advice{datetime.now()}.json", mode="w") as w_file:
+        w_file.write(json.dumps(advice, indent=4))
+    return advice
+
+
+if __name__ == "__main__":
+    for entry in advise():
+        print(f"{entry['query']}: {entry['execution_ms']:.2f} ms")
+        for finding in entry["findings"]:
+            print(f"  ! {finding}")
+        for candidate in entry["candidates"]:
+            verdict = "RECOMMENDED" if candidate["recommended"] else "no gain"
+            print(
+                f"  {candidate['index']}: {candidate['before_ms']:.2f} ->"
+                f" {candidate['after_ms']:.2f} ms ({verdict})"
+            )
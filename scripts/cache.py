@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import os
+from typing import Any, Callable
+
+from psycopg import Cursor, sql
+from psycopg.types.json import Jsonb
+
+from scripts import metrics
+from scripts.connection import pooled_connection, required_versions
+
+# tables read by each reporting query, by query hash (EXPLAIN is not free)
+_query_tables: dict[str, list[str]] = {}
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("UTF-8")).hexdigest()
+
+
+def _relations(plan: Any) -> set[str]:
+    if isinstance(plan, list):
+        return set().union(*map(_relations, plan))
+    if isinstance(plan, dict):
+        found = {plan["Relation Name"]} if "Relation Name" in plan else set()
+        return found.union(*map(_relations, plan.values()))
+    return set()
+
+
+def query_tables(cursor: Cursor, query: str) -> list[str]:
+    """Returns the tables and materialized views `query` reads (from its plan)."""
+    key = query_hash(query)
+    if key not in _query_tables:
+        explain = sql.SQL("EXPLAIN (FORMAT JSON) {}").format(
+            sql.SQL(query)  # type:ignore
+        )
+        cursor.execute(explain)
+        row = cursor.fetchone()
+        _query_tables[key] = sorted(_relations(row[0] if row else []))
+    return _query_tables[key]
+
+
+def data_versions(cursor: Cursor, tables: list[str]) -> dict[str, int]:
+    """
+    Returns the `table_versions` change counter of every table, 0 for
+    tables that never changed.
+    """
+    cursor.execute(
+        "SELECT table_name, version FROM table_versions WHERE table_name = ANY(%s)",
+        (tables,),
+    )
+    versions = dict.fromkeys(tables, 0)
+    versions.update(cursor.fetchall())
+    return versions
+
+
+def cached_reports(
+    encoders: dict[str, Callable[[str, Any], str]],
+    fetch: Callable[[str], Any],
+    force: bool = False,
+) -> Callable[[str, str], None]:
+    """
+    Wraps report encoders sharing one query run with the persistent report
+    cache.
+
+    The returned task looks up, for every format of `encoders`, whether
+    `report_cache` holds a file for this report written from the same query
+    text and the same data versions of the tables the query reads. When
+    some formats are stale it calls `fetch(query)` once and passes the
+    result to the encoder of each of them, recording the new files. The
+    cache lives in the database, so it survives restarts and is shared by
+    every loader process. The lookup and the record go to the primary, the
+    versions are handed to `read_connection` through `required_versions`
+    while the report is fetched and written.
+
+    Parameters
+    ----------
+    encoders : dict[str, Callable[[str, Any], str]]
+        Format key of the cache entries (json, xml, ...) mapped to a
+        function writing the report for (name, fetched result) and
+        returning the file path.
+    fetch : Callable[[str], Any]
+        Runs the query text, at most once per report.
+    force : bool
+        Run every encoder, still recording the results.
+    """
+
+    def task(name: str, query: str) -> None:
+        key = query_hash(query)
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                versions = data_versions(cursor, query_tables(cursor, query))
+                cursor.execute(
+                    """SELECT format, path FROM report_cache
+                    WHERE report=%s AND format=ANY(%s) AND query_hash=%s
+                    AND versions=%s""",
+                    (name, list(encoders), key, Jsonb(versions)),
+                )
+                cached = dict(cursor.fetchall())
+        stale = []
+        for report_format in encoders:
+            path = cached.get(report_format)
+            if not force and path and os.path.exists(path):
+                logging.info("[CACHE] Report %s.%s is up-to-date", name, report_format)
+                metrics.count("reports_cached")
+            else:
+                stale.append(report_format)
+        if not stale:
+            return
+        # a read host serves the query only once it replayed these versions
+        token = required_versions.set(versions)
+        try:
+            result = fetch(query)
+            entries = []
+            for report_format in stale:
+                path = encoders[report_format](name, result)
+                metrics.count("reports_written")
+                metrics.count("bytes_written", os.path.getsize(path))
+                entries.append((name, report_format, key, Jsonb(versions), path))
+        finally:
+            required_versions.reset(token)
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    """INSERT INTO report_cache
+                    (report, format, query_hash, versions, path)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (report, format) DO UPDATE
+                    SET query_hash=EXCLUDED.query_hash, versions=EXCLUDED.versions,
+                        path=EXCLUDED.path, created_at=now()""",
+                    entries,
+                )
+
+    return task
+
+
+def cached_report(
+    report_format: str, writer: Callable[[str, str], str], force: bool = False
+) -> Callable[[str, str], None]:
+    """
+    Wraps a report writer that runs the query itself, `writer(name, query
+    text)` returning the file path, with the persistent report cache (see
+    `cached_reports`).
+    """
+    return cached_reports({report_format: writer}, lambda query: query, force)
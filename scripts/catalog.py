@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+
+import sqlparse
+from psycopg import Cursor, errors
+
+# in-process caches of the sql/ scripts and of the table column metadata.
+# Scripts are re-read only when their mtime/size changed and re-parsed only
+# when their content did; columns are re-queried when the schema version
+# recorded by `migrate` moved on.
+
+_lock = threading.Lock()
+
+
+class _Script:
+    def __init__(self, stamp: tuple[int, int], text: str) -> None:
+        self.stamp = stamp
+        self.text = text
+        self.checksum = hashlib.sha256(text.encode("UTF-8")).hexdigest()
+        self._statements: tuple[str, ...] | None = None
+
+    @property
+    def statements(self) -> tuple[str, ...]:
+        if self._statements is None:
+            statements = (q.strip() for q in sqlparse.split(self.text))
+            self._statements = tuple(filter(None, statements))
+        return self._statements
+
+
+_scripts: dict[str, _Script] = {}
+_columns: dict[str, tuple[str, list[tuple[str, str, str]]]] = {}
+_foreign_keys: dict[str, tuple[str, list[tuple[str, str, str]]]] = {}
+
+
+def _script(path: str) -> _Script:
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _scripts.get(path)
+    if cached is not None and cached.stamp == stamp:
+        return cached
+    with open(path, encoding="UTF-8") as file:
+        script = _Script(stamp, file.read())
+    if cached is not None and cached.checksum == script.checksum:
+        cached.stamp = stamp  # touched but not changed, keep the parsed copy
+        return cached
+    with _lock:
+        _scripts[path] = script
+    return script
+
+
+def script_text(path: str) -> str:
+    """
+    Returns the content of the SQL file at `path`.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the file does not exist.
+    """
+    return _script(path).text
+
+
+def script_checksum(path: str) -> str:
+    """Returns the sha256 hex digest of the SQL file at `path`."""
+    return _script(path).checksum
+
+
+def script_statements(path: str) -> tuple[str, ...]:
+    """Returns the non-empty statements of the SQL file at `path`."""
+    return _script(path).statements
+
+
+def schema_version(cursor: Cursor) -> str:
+    """
+    Returns the version of the schema applied by `migrate`: changes
+    whenever a script is (re)applied, from any process.
+    """
+    try:
+        with cursor.connection.transaction():  # savepoint if the table is missing
+            cursor.execute(
+                "SELECT count(*), max(applied_at)::TEXT FROM schema_migrations"
+            )
+            row = cursor.fetchone()
+    except errors.UndefinedTable:
+        return ""
+    return f"{row[0]}:{row[1]}" if row else ""
+
+
+def table_columns(cursor: Cursor, name: str) -> list[tuple[str, str, str]]:
+    """
+    Returns (column_name, data_type, is_nullable) of every column of
+    table `name` in `public`, in column order, from `information_schema`
+    the first time and from the cache while the schema version is the same.
+    """
+    version = schema_version(cursor)
+    with _lock:
+        cached = _columns.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    cursor.execute(
+        """SELECT column_name, data_type, is_nullable
+                    FROM information_schema.columns
+                    WHERE table_schema=%s and table_name=%s
+                    ORDER BY ordinal_position""",
+        params=("public", name),
+    )
+    column_parameters = cursor.fetchall()
+    with _lock:
+        _columns[name] = (version, column_parameters)
+    return column_parameters
+
+
+def table_foreign_keys(cursor: Cursor, name: str) -> list[tuple[str, str, str]]:
+    """
+    Returns (column_name, referenced table, referenced column) of every
+    single column foreign key of table `name` in `public`, cached like
+    `table_columns`.
+    """
+    version = schema_version(cursor)
+    with _lock:
+        cached = _foreign_keys.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    cursor.execute(
+        """SELECT a.attname, r.relname, ra.attname
+                    FROM pg_constraint c
+                    JOIN pg_class t ON t.oid = c.conrelid
+                    JOIN pg_namespace n ON n.oid = t.relnamespace
+                    JOIN pg_class r ON r.oid = c.confrelid
+                    JOIN pg_attribute a
+                        ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+                    JOIN pg_attribute ra
+                        ON ra.attrelid = c.confrelid AND ra.attnum = c.confkey[1]
+                    WHERE c.contype = 'f' AND cardinality(c.conkey) = 1
+                    AND n.nspname = %s AND t.relname = %s
+                    ORDER BY c.conname""",
+        params=("public", name),
+    )
+    foreign_keys = cursor.fetchall()
+    with _lock:
+        _foreign_keys[name] = (version, foreign_keys)
+    return foreign_keys
+
+
+def clear_columns() -> None:
+    """
+    Drops the cached column and foreign key metadata, for schema changes
+    outside `migrate`.
+    """
+    with _lock:
+        _columns.clear()
+        _foreign_keys.clear()
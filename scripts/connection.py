@@ -1,28 +1,97 @@
 import psycopg
+from psycopg_pool import ConnectionPool, PoolTimeout
 from dotenv import load_dotenv
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+import atexit
+import itertools
+import math
 import os
 import logging
-from scripts.logger import logger
+import threading
+import time
+from scripts.logger import logger, notice_handler
 
 load_dotenv()
 
+# bounds of every connection pool (one pool per set of credentials)
+POOL_MIN_SIZE = int(os.getenv("POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.getenv("POOL_MAX_SIZE", 5))
+# seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.getenv("POOL_TIMEOUT", 30))
+
+# read-only endpoints (`host` or `host:port`, comma separated) serving the
+# report queries (see `read_connection`), empty sends them to HOST
+READ_HOSTS = [
+    host.strip() for host in os.getenv("READ_HOSTS", "").split(",") if host.strip()
+]
+# seconds a read host that could not be reached is left out of the rotation
+READ_HOST_RETRY = float(os.getenv("READ_HOST_RETRY", 30))
+# seconds to wait for a connection of a read host before trying the next one
+READ_HOST_TIMEOUT = float(os.getenv("READ_HOST_TIMEOUT", 5))
+
+# shut up the pool since it logs every borrowed connection
+logging.getLogger("psycopg.pool").setLevel(logging.WARNING)
+
+_pools: dict[tuple[bool, bool, str | None], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+_read_turn = itertools.count()
+_read_down: dict[str, float] = {}  # read host -> monotonic time to retry it
+
+# `table_versions` (see `cache.data_versions`) a read host must have
+# replayed before `read_connection` uses it, set for the reads of a report
+required_versions: ContextVar[dict[str, int]] = ContextVar(
+    "required_versions", default={}
+)
+
+
+def connection_parameters(
+    admin: bool = False, admin_db: bool = False, host: str | None = None
+) -> dict:
+    """
+    Builds `psycopg.connect` keyword arguments from the .env parameters.
+
+    Parameters
+    ----------
+    admin : bool
+        Use ADMIN/ADMIN_PASSWORD instead of DBUSER/PASSWORD.
+    admin_db : bool
+        Connect to ADMIN_DBNAME instead of DBNAME.
+    host : str | None
+        `host` or `host:port` to connect to instead of HOST (a read host),
+        with READ_HOST_TIMEOUT as connection timeout.
+    """
+    db_name = os.getenv("DBNAME")
+    user = os.getenv("DBUSER")
+    password = os.getenv("PASSWORD")
+    if admin:
+        user = os.getenv("ADMIN")
+        password = os.getenv("ADMIN_PASSWORD")
+    if admin_db:
+        db_name = os.getenv("ADMIN_DBNAME")
+    if host is None:
+        return dict(
+            dbname=db_name, user=user, password=password, host=os.getenv("HOST")
+        )
+    name, _, port = host.partition(":")
+    parameters = dict(dbname=db_name, user=user, password=password, host=name)
+    if port:
+        parameters["port"] = port
+    # an unreachable read host must not hang for the OS TCP timeout
+    # (libpq takes whole seconds, at least 2)
+    parameters["connect_timeout"] = str(max(2, math.ceil(READ_HOST_TIMEOUT)))
+    return parameters
+
 
 @logger
 def server_connect(
-    admin: bool = False, admin_db: bool = False
+    admin: bool = False, admin_db: bool = False, host: str | None = None
 ) -> psycopg.Connection | None:
     try:
-        db_name = os.getenv("DBNAME")
-        user = os.getenv("DBUSER")
-        password = os.getenv("PASSWORD")
-        host = os.getenv("HOST")
-        if admin:
-            user = os.getenv("ADMIN")
-            password = os.getenv("ADMIN_PASSWORD")
-        if admin_db:
-            db_name = os.getenv("ADMIN_DBNAME")
         connection: psycopg.Connection = psycopg.connect(
-            dbname=db_name, user=user, password=password, host=host
+            **connection_parameters(admin, admin_db, host)
         )
         return connection
     except Exception as _ex:
@@ -38,3 +107,182 @@ def server_disconnect(connection: psycopg.Connection | None) -> None:
         )
     else:
         connection.close()
+
+
+async def async_connect(
+    admin: bool = False, admin_db: bool = False
+) -> psycopg.AsyncConnection:
+    """
+    Opens an asyncio connection with the .env parameters. Not pooled, the
+    caller closes it.
+
+    Raises
+    ------
+    ConnectionError
+        If the server cannot be reached.
+    """
+    try:
+        connection = await psycopg.AsyncConnection.connect(
+            **connection_parameters(admin, admin_db)
+        )
+    except Exception as _ex:
+        raise ConnectionError(f"Exception {_ex} ocurred during connection to server")
+    connection.add_notice_handler(notice_handler)
+    return connection
+
+
+def _configure(connection: psycopg.Connection) -> None:
+    connection.add_notice_handler(notice_handler)
+
+
+def _reset(connection: psycopg.Connection) -> None:
+    # admin steps switch to autocommit for CREATE/DROP DATABASE
+    connection.autocommit = False
+
+
+@logger
+def get_pool(
+    admin: bool = False, admin_db: bool = False, host: str | None = None
+) -> ConnectionPool:
+    """
+    Returns the connection pool for the given credentials and `host`
+    (HOST when None), creating it on first use.
+
+    Pools keep between POOL_MIN_SIZE and POOL_MAX_SIZE open sessions and
+    check a connection is alive before lending it, so callers reuse server
+    sessions instead of paying a handshake per step.
+
+    Raises
+    ------
+    ConnectionError
+        If the server cannot be reached with these credentials.
+    """
+    key = (admin, admin_db, host)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            kwargs = connection_parameters(admin, admin_db, host)
+            # fail fast, the pool itself would keep retrying in background
+            server_disconnect(server_connect(admin, admin_db, host))
+            pool = ConnectionPool(
+                kwargs=kwargs,
+                min_size=POOL_MIN_SIZE,
+                max_size=max(POOL_MIN_SIZE, POOL_MAX_SIZE),
+                timeout=POOL_TIMEOUT,
+                check=ConnectionPool.check_connection,
+                configure=_configure,
+                reset=_reset,
+                name=f"{kwargs['user']}@{kwargs['dbname']}"
+                + (f"@{host}" if host else ""),
+                open=True,
+            )
+            _pools[key] = pool
+    return pool
+
+
+@contextmanager
+def pooled_connection(
+    admin: bool = False, admin_db: bool = False
+) -> Iterator[psycopg.Connection]:
+    """
+    Borrows a connection from the pool for the duration of a `with` block.
+
+    The transaction is committed when the block succeeds and rolled back
+    when it raises, then the connection goes back to the pool.
+
+    Raises
+    ------
+    ConnectionError
+        If the server cannot be reached or no connection frees up in time.
+    """
+    try:
+        with get_pool(admin, admin_db).connection() as connection:
+            yield connection
+    except PoolTimeout as _ex:
+        raise ConnectionError(f"Exception {_ex} ocurred during connection to server")
+
+
+def _read_hosts() -> list[str]:
+    # READ_HOSTS in turn from the next one, without the hosts that failed
+    # less than READ_HOST_RETRY seconds ago
+    start = next(_read_turn)
+    hosts = [READ_HOSTS[(start + i) % len(READ_HOSTS)] for i in range(len(READ_HOSTS))]
+    now = time.monotonic()
+    return [host for host in hosts if _read_down.get(host, 0) <= now]
+
+
+def _caught_up(connection: psycopg.Connection, host: str) -> bool:
+    versions = required_versions.get()
+    if not versions:
+        return True
+    from scripts.cache import data_versions
+
+    with connection.cursor() as cursor:
+        replayed = data_versions(cursor, list(versions))
+    # a read transaction is left open by the check, end it on the pool side
+    connection.rollback()
+    behind = [table for table, version in versions.items() if replayed[table] < version]
+    if behind:
+        logging.info("[READ] %s has not replayed %s yet", host, ", ".join(behind))
+    return not behind
+
+
+@contextmanager
+def read_connection() -> Iterator[psycopg.Connection]:
+    """
+    Borrows a connection for read-only queries (reports) for the duration
+    of a `with` block.
+
+    The connection goes to one of READ_HOSTS, in turn (round robin), with
+    the app credentials. A host that cannot be reached within
+    READ_HOST_TIMEOUT, or fails the version check, is logged and left out
+    for READ_HOST_RETRY seconds; a host that has not replayed the
+    `required_versions` of the tables yet is skipped, so a report is never
+    older than the data the report cache recorded for it. When no read host qualifies, or
+    READ_HOSTS is empty, the connection comes from the primary, like
+    `pooled_connection`.
+
+    Raises
+    ------
+    ConnectionError
+        If the primary cannot be reached either.
+    """
+    with ExitStack() as stack:
+        connection = None
+        for host in _read_hosts() if READ_HOSTS else ():
+            attempt = ExitStack()
+            try:
+                candidate = attempt.enter_context(
+                    get_pool(host=host).connection(timeout=READ_HOST_TIMEOUT)
+                )
+                _read_down.pop(host, None)
+                if _caught_up(candidate, host):
+                    connection = candidate
+                    stack.push(attempt.pop_all())
+                    break
+            except (ConnectionError, PoolTimeout, psycopg.Error) as _ex:
+                logging.warning("[READ] %s is unavailable: %s", host, _ex)
+                _read_down[host] = time.monotonic() + READ_HOST_RETRY
+            finally:
+                attempt.close()
+        if connection is None:
+            if READ_HOSTS:
+                logging.info("[READ] No read host available, reading from the primary")
+            connection = stack.enter_context(pooled_connection())
+        yield connection
+
+
+def close_pools() -> None:
+    """
+    Closes every pool. Next borrow opens a fresh one.
+
+    Needed before the app database is dropped, since pooled sessions
+    would be terminated under the pool.
+    """
+    with _pools_lock:
+        while _pools:
+            _, pool = _pools.popitem()
+            pool.close()
+
+
+atexit.register(close_pools)
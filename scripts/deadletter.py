@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+from collections import Counter
+from typing import Any
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# where the rejected rows of every dataset file are written
+DEAD_LETTER_DIR = os.getenv("DEAD_LETTER_DIR", "datasets/rejected")
+
+
+class DeadLetter:
+    """
+    Dead-letter file of one dataset file: `<DEAD_LETTER_DIR>/<file>.ndjson`
+    with one JSON object per rejected row, holding the byte offset of the
+    row in the source file, the first column that failed, the reason and
+    the raw row.
+
+    Rows are written a batch at a time with one write, so a reject costs
+    no log line. A new load of the file (`resume` False) starts a new
+    dead-letter file; a resumed one appends to it. A batch is added before
+    it commits, so after a crash the rejects of the batch in flight may
+    appear twice (same offsets).
+    """
+
+    def __init__(self, file: str, resume: bool = False) -> None:
+        self.file = file
+        self.path = os.path.join(DEAD_LETTER_DIR, f"{file}.ndjson")
+        self.counts: Counter[str] = Counter()
+        if not resume and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def add(
+        self,
+        rows: list[Any],
+        offsets: list[int],
+        rejected: list[tuple[int, str, Exception]],
+    ) -> None:
+        """
+        Writes the `rejected` rows of a batch (index in `rows`, column,
+        error as returned by `RowNormaliser.normalise_batch`).
+        """
+        if not rejected:
+            return
+        lines = "".join(
+            json.dumps(
+                {
+                    "offset": offsets[index],
+                    "column": column,
+                    "reason": f"{type(error).__name__}: {error}",
+                    "row": rows[index],
+                },
+                ensure_ascii=False,
+                default=str,
+            )
+            + "\n"
+            for index, column, error in rejected
+        )
+        os.makedirs(DEAD_LETTER_DIR, exist_ok=True)
+        with open(self.path, mode="a", encoding="UTF-8") as a_file:
+            a_file.write(lines)
+        self.counts.update(column for _, column, _ in rejected)
+
+    def summary(self) -> Counter[str]:
+        """Logs the rejects of the file once, by column, and returns the counts."""
+        if self.counts:
+            logging.info(
+                "[REJECTED] %s: %s rows rejected (%s), written to %s",
+                self.file,
+                self.counts.total(),
+                ", ".join(f"{column} {count}" for column, count in self.counts.items()),
+                self.path,
+            )
+        return self.counts
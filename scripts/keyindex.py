@@ -0,0 +1,186 @@
+import logging
+import os
+from operator import itemgetter
+from typing import Iterable
+
+from dotenv import load_dotenv
+from psycopg import Cursor, sql
+
+from scripts import catalog, metrics
+
+load_dotenv()
+
+# 1 filters batches against the keys of the tables before they are sent
+# (see `KeyFilter`), 0 leaves duplicates and orphans to the server
+KEY_INDEX = os.getenv("KEY_INDEX", "0") == "1"
+
+# key types a `KeyIndex` can hold
+INTEGER_TYPES = ("smallint", "integer", "bigint")
+
+_CHUNK_BITS = 16
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+
+
+class KeyIndex:
+    """
+    Set of integer keys as bitmaps of 2**16 keys (8 KiB), allocated only
+    for the ranges that hold keys. Dense serial ids cost about one bit per
+    key instead of the ~60 bytes of an int in a `set`.
+    """
+
+    def __init__(self, keys: Iterable[int] = ()) -> None:
+        self._chunks: dict[int, bytearray] = {}
+        self._size = 0
+        self.update(keys)
+
+    def __contains__(self, key: int) -> bool:
+        chunk = self._chunks.get(key >> _CHUNK_BITS)
+        return chunk is not None and bool(
+            chunk[(key & _CHUNK_MASK) >> 3] & (1 << (key & 7))
+        )
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the bitmaps."""
+        return sum(len(chunk) for chunk in self._chunks.values())
+
+    def add(self, key: int) -> bool:
+        """Adds `key`, returns False when it was already there."""
+        chunk = self._chunks.get(key >> _CHUNK_BITS)
+        if chunk is None:
+            chunk = self._chunks[key >> _CHUNK_BITS] = bytearray(1 << (_CHUNK_BITS - 3))
+        byte, bit = (key & _CHUNK_MASK) >> 3, 1 << (key & 7)
+        if chunk[byte] & bit:
+            return False
+        chunk[byte] |= bit
+        self._size += 1
+        return True
+
+    def update(self, keys: Iterable[int]) -> None:
+        for key in keys:
+            self.add(key)
+
+    @classmethod
+    def load(cls, cursor: Cursor, table: str, column: str) -> "KeyIndex":
+        """
+        Reads the non-null values of `table.column` with one
+        `COPY ... TO STDOUT`, block by block.
+        """
+        index = cls()
+        query = sql.SQL(
+            "COPY (SELECT {column} FROM {table} WHERE {column} IS NOT NULL) TO STDOUT"
+        ).format(column=sql.Identifier(column), table=sql.Identifier(table))
+        rest = b""
+        with cursor.copy(query) as copy:
+            for block in copy:
+                lines = (rest + bytes(block)).split(b"\n")
+                rest = lines.pop()
+                index.update(map(int, lines))
+        return index
+
+
+class KeyFilter:
+    """
+    Pre-filters the normalised batches of table `name` against its primary
+    key and single column foreign keys, so that rows the server would skip
+    or refuse are never sent.
+
+    The keys are loaded once, when the filter is built, with one `COPY`
+    per table (see `KeyIndex.load`); only integer keys are indexed. A row
+    whose primary key is already in the table, or earlier in the load
+    (same file or not), is dropped and counted as `rows_skipped`, like the
+    server's `ON CONFLICT DO NOTHING` would. A row whose foreign key is
+    not in the referenced table is rejected with a `LookupError`, instead
+    of failing the whole batch with a foreign key violation.
+
+    Kept keys are added to the index as the batch is filtered. Every load
+    path stops at the first failed batch, so the index never outlives a
+    rollback. Rows written by other sessions after the keys were loaded are
+    not seen; the server still checks them.
+    """
+
+    def __init__(
+        self, cursor: Cursor, name: str, column_parameters: list[tuple[str, str, str]]
+    ) -> None:
+        columns = [parameter[0] for parameter in column_parameters]
+        types = {parameter[0]: parameter[1] for parameter in column_parameters}
+        self.primary: KeyIndex | None = None
+        if types[columns[0]] in INTEGER_TYPES:
+            self.primary = KeyIndex.load(cursor, name, columns[0])
+        self.foreign: list[tuple[int, str, str, KeyIndex]] = []
+        for column, table, referenced in catalog.table_foreign_keys(cursor, name):
+            if types.get(column) not in INTEGER_TYPES:
+                continue
+            if table == name and referenced == columns[0] and self.primary is not None:
+                index = self.primary
+            else:
+                index = KeyIndex.load(cursor, table, referenced)
+            self.foreign.append((columns.index(column), column, table, index))
+        self.skipped = 0
+        logging.info(
+            "[KEYINDEX] %s: %s primary keys, foreign keys: %s (%s KiB)",
+            name,
+            len(self.primary or ()),
+            ", ".join(f"{column} {len(index)}" for _, column, _, index in self.foreign)
+            or "none",
+            sum(index.nbytes for index in self.indexes()) // 1024,
+        )
+
+    def indexes(self) -> list[KeyIndex]:
+        """Distinct indexes of the filter."""
+        indexes = [self.primary] if self.primary is not None else []
+        for *_, index in self.foreign:
+            if all(index is not other for other in indexes):
+                indexes.append(index)
+        return indexes
+
+    def filter(
+        self,
+        rows: list[tuple],
+        rejected: list[tuple[int, str, Exception]],
+        count: int,
+    ) -> tuple[list[tuple], list[tuple[int, str, Exception]]]:
+        """
+        Filters `rows` as returned by `RowNormaliser.normalise_batch` for a
+        batch of `count` items, whose `rejected` hold indices in that batch.
+
+        Returns
+        -------
+        tuple[list[tuple], list[tuple[int, str, Exception]]]
+            The rows to send and the rejected rows, orphans added.
+        """
+        if rejected:
+            dropped = {index for index, _, _ in rejected}
+            positions: Iterable[int] = (i for i in range(count) if i not in dropped)
+        else:
+            positions = range(count)
+        kept: list[tuple] = []
+        orphans: list[tuple[int, str, Exception]] = []
+        skipped = 0
+        for position, row in zip(positions, rows):
+            # a known key is skipped before its foreign keys are looked at,
+            # the server never checks them on a conflict either
+            if self.primary is not None and row[0] in self.primary:
+                skipped += 1
+                continue
+            for index, column, table, keys in self.foreign:
+                value = row[index]
+                if value is not None and value not in keys:
+                    orphans.append(
+                        (position, column, LookupError(f"{value} not in {table}"))
+                    )
+                    break
+            else:
+                if self.primary is not None:
+                    self.primary.add(row[0])
+                kept.append(row)
+        if skipped:
+            self.skipped += skipped
+            metrics.count("rows_skipped", skipped)
+        if orphans:
+            metrics.count("rows_rejected", len(orphans))
+            rejected = sorted(rejected + orphans, key=itemgetter(0))
+        return kept, rejected
@@ -1,24 +1,182 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+import time
+from dotenv import load_dotenv
 from psycopg.errors import Diagnostic
 from psycopg import Connection
+from scripts import metrics, profiling
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("logger.log", encoding="utf-8"),
+load_dotenv()
+
+LOG_FILE = "logger.log"
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+# minimum level written, DEBUG keeps everything as before
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+# 1 writes log records from a background thread (see `configure_logging`)
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+# records per second allowed for one message template, 0 disables the limit
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 100))
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `rate` records per second for every message
+    template (the format string before %-formatting, with its first
+    argument) and logs how many were dropped once the next second starts.
+
+    Hot paths log with a constant template and lazy arguments, so a flood
+    of the same warning is cut while distinct messages are untouched.
+    """
+
+    def __init__(self, rate: int) -> None:
+        super().__init__()
+        self.rate = rate
+        self._windows: dict[tuple, list] = {}  # [second, passed, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0:
+            return True
+        first = record.args[0] if isinstance(record.args, tuple) and record.args else ""
+        key = (record.levelno, str(record.msg), str(first))
+        second = int(record.created)
+        with self._lock:
+            window = self._windows.setdefault(key, [second, 0, 0])
+            dropped = 0
+            if window[0] != second:
+                dropped = window[2]
+                window[:] = [second, 0, 0]
+            window[1] += 1
+            passed = window[1] <= self.rate
+            if not passed:
+                window[2] += 1
+        if dropped:
+            self._report(key, dropped)
+        return passed
+
+    def flush(self) -> None:
+        """Logs the records dropped in the current windows."""
+        with self._lock:
+            dropped = [(key, window[2]) for key, window in self._windows.items()]
+            self._windows.clear()
+        for key, count in dropped:
+            if count:
+                self._report(key, count)
+
+    @staticmethod
+    def _report(key: tuple, count: int) -> None:
+        logging.log(
+            key[0],
+            "[RATE-LIMIT] %s more records like %r (%s) dropped",
+            count,
+            key[1],
+            key[2],
+        )
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # the listener thread formats the record, not the logging caller
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def stop_logging() -> None:
+    """
+    Writes out the queued records and switches back to synchronous
+    handlers, so records logged afterwards (e.g. at exit) are not lost.
+    """
+    global _listener
+    root = logging.getLogger()
+    for log_filter in root.filters:
+        if isinstance(log_filter, RateLimitFilter):
+            log_filter.flush()
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in listener.handlers:
+            root.addHandler(handler)
+
+
+def configure_logging(
+    background: bool = LOG_ASYNC,
+    level: str = LOG_LEVEL,
+    rate_limit: int = LOG_RATE_LIMIT,
+) -> None:
+    """
+    (Re)configures the root logger: `logger.log` plus stdout.
+
+    With `background` the caller only puts records on a queue and a
+    `QueueListener` thread formats and writes them, so file and console
+    I/O stay off the pipeline threads. The queue is drained by
+    `stop_logging`, registered at exit.
+
+    Parameters
+    ----------
+    background : bool
+        Write records from a background thread (LOG_ASYNC).
+    level : str
+        Minimum level name (LOG_LEVEL).
+    rate_limit : int
+        Records per second per message template (LOG_RATE_LIMIT), 0 for no
+        limit.
+    """
+    stop_logging()
+    root = logging.getLogger()
+    for log_filter in root.filters[:]:
+        if isinstance(log_filter, RateLimitFilter):
+            root.removeFilter(log_filter)
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers: list[logging.Handler] = [
+        logging.FileHandler(LOG_FILE, encoding="utf-8"),
         logging.StreamHandler(sys.stdout),  # console
-    ],
-    force=True,
-)
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if background:
+        global _listener
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(records, *handlers)
+        _listener.start()
+        handlers = [_DeferredQueueHandler(records)]
+    logging.basicConfig(level=level, handlers=handlers, force=True)
+    root.addFilter(RateLimitFilter(rate_limit))
+    # shut up the dicttoxml since it produces too many unnecessary info
+    logging.getLogger("dicttoxml").setLevel(logging.WARNING)
+
+
+# synchronous on import, runs opt into the background writer
+configure_logging(background=False)
+atexit.register(stop_logging)
+
+
+def notice_handler(diag: Diagnostic) -> None:
+    """Logs PostgreSQL server messages (NOTICE, WARNING, ...) of a connection."""
+    tag = f"PG-{diag.severity}"
+    if diag.severity in ("INFO", "NOTICE"):
+        logging.info("[%s] %s", tag, diag.message_primary)
+    else:
+        logging.warning("[%s] %s", tag, diag.message_primary)
 
 
 def logger(func):
     """
     Decorator that wraps a function with logging of Python and PostgreSQL notice handling.
 
-    - Logs when the function starts and finishes.
+    - Logs when the function starts and finishes, with its duration.
+    - Records wall and CPU time of the call in `scripts.metrics`; counters
+      reported with `metrics.count` inside the call are attributed to it.
+    - Profiles the calls when PROFILE names the function (see
+      `scripts.profiling`), at no cost otherwise.
     - If the wrapped function returns a psycopg.Connection object,
       attaches a notice handler to log PostgreSQL server messages.
     - Catches ValueError, ConnectionError, and other exceptions,
@@ -37,64 +195,47 @@ def logger(func):
         The wrapped function with logging and notice handling.
     """
 
+    call = profiling.profiled(func)
+
     def wrapper(*args, **kwargs):
+        logging.info("Function %s is opened", func.__name__)
 
-        # shut up the dicttoxml since it produces too many unnecessary info
-        logging.getLogger("dicttoxml").setLevel(logging.WARNING)
-        logging.info(f"""Function {func.__name__} is opened""")
-
-        def handler(diag: Diagnostic) -> None:
-            tag = f"PG-{diag.severity}"
-            if diag.severity in ("INFO", "NOTICE"):
-                logging.info("[%s] %s", tag, diag.message_primary)
-            else:
-                logging.warning("[%s] %s", tag, diag.message_primary)
-
-        if "report_to_json" == func.__name__:
-            from scripts.setup_db import insert_data
-
-            if not insert_data.need_report_json:  # type:ignore
-                logging.info(
-                    """No need for reporting.\
-                        Reports are up-to-date"""
-                )
-                return None
-            else:
-                insert_data.need_report_json = False  # type:ignore
-        if "report_to_xml" == func.__name__:
-            from scripts.setup_db import insert_data
-
-            if not insert_data.need_report_xml:  # type:ignore
-                logging.info(
-                    """No need for reporting.\
-                        Reports are up-to-date"""
-                )
-                return None
-            else:
-                insert_data.need_report_xml = False  # type:ignore
+        started, started_cpu = time.perf_counter(), time.thread_time()
         try:
-            result = func(*args, **kwargs)
-            logging.info(f"""Function {func.__name__} finished successfully""")
+            with metrics.current_function(func.__name__):
+                result = call(*args, **kwargs)
+            logging.info(
+                "Function %s finished successfully in %.3fs",
+                func.__name__,
+                time.perf_counter() - started,
+            )
             if isinstance(result, Connection):
-                result.add_notice_handler(handler)
+                result.add_notice_handler(notice_handler)
             return result
         except FileNotFoundError:
             logging.info("""[FILE] No files to read from.Skip""")
             return None
         except ValueError as _err:
             logging.warning(
-                f"""[VALUE] Function {func.__name__} ran with value error: {_err}"""
+                "[VALUE] Function %s ran with value error: %s", func.__name__, _err
             )
         except ConnectionError as _err:
             logging.warning(
-                f"""[CONNECTION] Function {func.__name__}\
-                    ran with connection error: {_err}"""
+                "[CONNECTION] Function %s ran with connection error: %s",
+                func.__name__,
+                _err,
             )
             raise _err
         except BaseException as _ex:
             logging.error(
-                f"""[UNKNOWN] Function {func.__name__} ran with exception: {_ex}"""
+                "[UNKNOWN] Function %s ran with exception: %s", func.__name__, _ex
             )
             raise
+        finally:
+            metrics.observe(
+                func.__name__,
+                time.perf_counter() - started,
+                time.thread_time() - started_cpu,
+            )
 
     return wrapper
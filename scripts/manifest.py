@@ -0,0 +1,70 @@
+import hashlib
+import os
+import shutil
+from typing import NamedTuple
+
+from psycopg import Cursor
+
+PARSED_DIR = "datasets/parsed"
+
+# parameters: items loaded, byte offset, content hash
+CHECKPOINT_QUERY = """UPDATE ingest_manifest
+        SET items_done=items_done+%s, byte_offset=%s, updated_at=now()
+        WHERE content_hash=%s"""
+FINISH_QUERY = """UPDATE ingest_manifest SET done=TRUE, updated_at=now()
+        WHERE content_hash=%s"""
+
+
+class ManifestEntry(NamedTuple):
+    file_name: str
+    items_done: int
+    byte_offset: int
+    done: bool
+
+
+def file_hash(path: str) -> str:
+    """Returns the sha256 hex digest of the file bytes (read, not parsed)."""
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def start_file(
+    cursor: Cursor, content_hash: str, table_name: str, path: str
+) -> ManifestEntry:
+    """
+    Registers a dataset file in `ingest_manifest` unless its content is
+    already there, and returns the entry of that content: where a previous
+    interrupted load stopped, or whether it was fully loaded (possibly
+    under another file name).
+    """
+    cursor.execute(
+        """INSERT INTO ingest_manifest (content_hash, table_name, file_name, file_size)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (content_hash) DO NOTHING""",
+        (content_hash, table_name, os.path.basename(path), os.path.getsize(path)),
+    )
+    cursor.execute(
+        """SELECT file_name, items_done, byte_offset, done
+        FROM ingest_manifest WHERE content_hash=%s""",
+        (content_hash,),
+    )
+    return ManifestEntry(*cursor.fetchone())  # type:ignore
+
+
+def checkpoint(cursor: Cursor, content_hash: str, items: int, byte_offset: int) -> None:
+    """
+    Records `items` more array items as loaded, up to `byte_offset`. Run
+    in the transaction that writes them, so the checkpoint commits with
+    the rows.
+    """
+    cursor.execute(CHECKPOINT_QUERY, (items, byte_offset, content_hash))
+
+
+def finish_file(cursor: Cursor, content_hash: str) -> None:
+    cursor.execute(FINISH_QUERY, (content_hash,))
+
+
+def archive(file_name: str) -> None:
+    """Moves a processed dataset file to `datasets/parsed`, replacing one there."""
+    os.makedirs(PARSED_DIR, exist_ok=True)
+    shutil.move(f"datasets/{file_name}", os.path.join(PARSED_DIR, file_name))
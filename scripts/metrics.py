@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# where `write_metrics` exports by default, `.json` suffix for JSON,
+# Prometheus text format otherwise. Empty disables the export
+METRICS_FILE = os.getenv("METRICS_FILE", "metrics.prom")
+
+# upper bounds (seconds) of the latency histogram buckets, +Inf is implied
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+# innermost `@logger` call of the current thread/task, counters go to it
+_function: ContextVar[str] = ContextVar("function", default="")
+
+
+class _Function:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.counters: dict[str, float] = {}
+
+
+_functions: dict[str, _Function] = {}
+_lock = threading.Lock()
+
+
+def _get(name: str) -> _Function:
+    function = _functions.get(name)
+    if function is None:
+        function = _functions.setdefault(name, _Function())
+    return function
+
+
+@contextmanager
+def current_function(name: str) -> Iterator[None]:
+    """Attributes the `count` calls of the block to function `name`."""
+    token = _function.set(name)
+    try:
+        yield
+    finally:
+        _function.reset(token)
+
+
+def observe(name: str, seconds: float, cpu_seconds: float) -> None:
+    """Records the wall and CPU time of one call of function `name`."""
+    with _lock:
+        function = _get(name)
+        function.calls += 1
+        function.seconds += seconds
+        function.cpu_seconds += cpu_seconds
+        function.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+
+def count(counter: str, value: float = 1) -> None:
+    """
+    Adds `value` to `counter` (rows_parsed, bytes_written, ...) of the
+    innermost `@logger` function running in this context.
+    """
+    with _lock:
+        counters = _get(_function.get()).counters
+        counters[counter] = counters.get(counter, 0) + value
+
+
+def reset() -> None:
+    with _lock:
+        _functions.clear()
+
+
+def snapshot() -> dict:
+    """Returns the metrics recorded so far as a JSON serialisable dict."""
+    with _lock:
+        result = {}
+        for name, function in sorted(_functions.items()):
+            cumulative, buckets = 0, {}
+            for bound, hits in zip((*map(str, BUCKETS), "+Inf"), function.buckets):
+                cumulative += hits
+                buckets[bound] = cumulative
+            result[name] = {
+                "calls": function.calls,
+                "seconds": function.seconds,
+                "cpu_seconds": function.cpu_seconds,
+                "buckets": buckets,
+                "counters": dict(sorted(function.counters.items())),
+            }
+        return result
+
+
+def to_prometheus(metrics: dict) -> str:
+    """Renders a `snapshot` in the Prometheus text exposition format."""
+    lines = [
+        "# HELP pipeline_call_seconds Wall time of @logger decorated calls.",
+        "# TYPE pipeline_call_seconds histogram",
+    ]
+    for name, function in metrics.items():
+        for bound, hits in function["buckets"].items():
+            lines.append(
+                f'pipeline_call_seconds_bucket{{function="{name}",le="{bound}"}} {hits}'
+            )
+        lines.append(
+            f'pipeline_call_seconds_sum{{function="{name}"}} {function["seconds"]}'
+        )
+        lines.append(
+            f'pipeline_call_seconds_count{{function="{name}"}} {function["calls"]}'
+        )
+    lines.append(
+        "# HELP pipeline_call_cpu_seconds_total CPU time of the calling thread."
+    )
+    lines.append("# TYPE pipeline_call_cpu_seconds_total counter")
+    for name, function in metrics.items():
+        lines.append(
+            f'pipeline_call_cpu_seconds_total{{function="{name}"}}'
+            f' {function["cpu_seconds"]}'
+        )
+    counters = sorted(
+        {key for function in metrics.values() for key in function["counters"]}
+    )
+    for counter in counters:
+        lines.append(f"# TYPE pipeline_{counter}_total counter")
+        for name, function in metrics.items():
+            if counter in function["counters"]:
+                lines.append(
+                    f'pipeline_{counter}_total{{function="{name}"}}'
+                    f' {function["counters"][counter]}'
+                )
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str = METRICS_FILE) -> str | None:
+    """
+    Exports the metrics of this run to `path`, as JSON when it ends with
+    `.json` and in Prometheus text format otherwise. Returns the path, or
+    None when `path` is empty.
+    """
+    if not path:
+        return None
+    metrics = snapshot()
+    with open(path, mode="w", encoding="UTF-8") as w_file:
+        if path.endswith(".json"):
+            json.dump(metrics, w_file, indent=4)
+        else:
+            w_file.write(to_prometheus(metrics))
+    return path
@@ -0,0 +1,186 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from scripts import metrics
+from scripts.connection import POOL_MAX_SIZE, pooled_connection
+from scripts.deadletter import DeadLetter
+from scripts.keyindex import KeyFilter
+from scripts.reader import JsonArrayReader, batched
+from scripts.setup_db import RowNormaliser, copy_rows, insert_rows
+
+# batches waiting per writer before the reader blocks
+WRITER_QUEUE_SIZE = 2
+
+
+class _Writer(threading.Thread):
+    """
+    Writes the batches of its queue through one pooled connection until the
+    queue is closed with `None`, then waits for the other writers at
+    `barrier`: every writer commits once all of them wrote their share,
+    or all roll back when one failed (`abort` set).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        column_parameters: list[tuple[str, str, str]],
+        method: str,
+        abort: threading.Event,
+        barrier: threading.Barrier,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.queue: queue.Queue[list[tuple] | None] = queue.Queue(WRITER_QUEUE_SIZE)
+        self.error: BaseException | None = None
+        self._name = name
+        self._column_parameters = column_parameters
+        self._columns = [parameter[0] for parameter in column_parameters]
+        self._method = method
+        self._abort = abort
+        self._barrier = barrier
+        self._closed = False  # `None` was taken from the queue
+        self._waited = False  # reached `barrier`
+
+    def _settle(self) -> None:
+        self._waited = True
+        self._barrier.wait()
+
+    def run(self) -> None:
+        try:
+            with pooled_connection() as connection:
+                with connection.cursor() as cursor:
+                    while (rows := self.queue.get()) is not None:
+                        if self._method == "copy":
+                            copy_rows(cursor, self._name, self._column_parameters, rows)
+                        else:
+                            insert_rows(cursor, self._name, self._columns, rows)
+                    self._closed = True
+                # no writer commits before the others wrote their share
+                self._settle()
+                if self._abort.is_set():
+                    connection.rollback()
+        except BaseException as _ex:
+            self.error = _ex
+            self._abort.set()
+            # keep draining so the reader never blocks on a dead writer
+            while not self._closed and self.queue.get() is not None:
+                pass
+            if not self._waited:
+                self._settle()
+
+
+def parallel_insert(
+    name: str,
+    paths: list[str],
+    column_parameters: list[tuple[str, str, str]],
+    workers: int,
+    batch_size: int,
+    method: str = "copy",
+    key_filter: KeyFilter | None = None,
+) -> Counter[str]:
+    """
+    Loads dataset files into table `name` using several processes and
+    connections.
+
+    The files are read as a stream of `batch_size` chunks; worker processes
+    normalise the chunks with `RowNormaliser` and the results are written by
+    up to `workers` connections concurrently. Each row is routed to a writer
+    by its primary key and every writer receives chunks in file order, so the
+    first occurrence of a key always wins, like in the serial path.
+
+    The writers commit together once all files are read and every writer
+    wrote its share; a failure of any of them rolls every writer back.
+    Only a commit failing itself (e.g. the connection dropping at that
+    moment) can leave the rows of the other writers committed. Files are
+    not committed one by one as in the serial path and `insert_data` marks
+    them done in the manifest only once this returns, so after any failure
+    they are loaded again from their start, rows already there being
+    skipped by their primary key. Rejected rows go to the dead-letter file
+    of their dataset file (see `DeadLetter`), started anew on every run. A
+    `key_filter` filters the chunks in file order, before they are routed
+    to writers.
+
+    Returns
+    -------
+    Counter[str]
+        Rejected rows per column.
+
+    Raises
+    ------
+    ConnectionError
+        If a writer cannot borrow a connection.
+    ValueError
+        If a file is not a JSON array. Raised rather than logged so that
+        `insert_data` never marks the files of a failed load as done.
+    """
+    normaliser = RowNormaliser(column_parameters)
+    abort = threading.Event()
+    if workers >= POOL_MAX_SIZE:
+        logging.warning(
+            "[PARALLEL] POOL_MAX_SIZE=%s limits writers to %s connections",
+            POOL_MAX_SIZE,
+            POOL_MAX_SIZE - 1,
+        )
+    count = max(1, min(workers, POOL_MAX_SIZE - 1))
+    barrier = threading.Barrier(count)
+    writers = [
+        _Writer(name, column_parameters, method, abort, barrier) for _ in range(count)
+    ]
+    for writer in writers:
+        writer.start()
+
+    dead_letters = {path: DeadLetter(os.path.basename(path)) for path in paths}
+
+    def dispatch(pending_batch: tuple[Future, str, tuple, tuple]) -> None:
+        future, path, offsets, items = pending_batch
+        rows, rejected = future.result()
+        metrics.count("rows_parsed", len(rows) + len(rejected))
+        metrics.count("rows_rejected", len(rejected))
+        if key_filter is not None:
+            rows, rejected = key_filter.filter(rows, rejected, len(items))
+        dead_letters[path].add(items, offsets, rejected)
+        shares: list[list[tuple]] = [[] for _ in writers]
+        for row in rows:
+            shares[hash(row[0]) % len(writers)].append(row)
+        for writer, share in zip(writers, shares):
+            if share:
+                writer.queue.put(share)
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            pending: deque[tuple[Future, str, tuple, tuple]] = deque()
+            for path in paths:
+                for batch in batched(JsonArrayReader(path).with_offsets(), batch_size):
+                    if abort.is_set():
+                        break
+                    offsets, items = zip(*batch)
+                    future = executor.submit(normaliser.normalise_batch, list(items))
+                    pending.append((future, path, offsets, items))
+                    # bounded read-ahead keeps memory flat
+                    if len(pending) > 2 * workers:
+                        dispatch(pending.popleft())
+            while pending and not abort.is_set():
+                dispatch(pending.popleft())
+            for future, *_ in pending:
+                future.cancel()
+    except BaseException:
+        abort.set()
+        raise
+    finally:
+        for writer in writers:
+            writer.queue.put(None)
+        for writer in writers:
+            writer.join()
+    for writer in writers:
+        if writer.error:
+            raise writer.error
+    rejects: Counter[str] = Counter()
+    for dead_letter in dead_letters.values():
+        rejects.update(dead_letter.summary())
+    return rejects
@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, NamedTuple
+
+from psycopg import AsyncConnection, AsyncCursor
+
+from scripts import manifest, metrics
+from scripts.deadletter import DeadLetter
+from scripts.connection import async_connect
+from scripts.keyindex import KeyFilter
+from scripts.logger import logger
+from scripts.reader import JsonArrayReader, batched
+from scripts.setup_db import (
+    CopyStatements,
+    RowNormaliser,
+    copy_statements,
+    insert_statement,
+    log_merged,
+)
+
+# batches waiting between two stages before the earlier one blocks
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 2))
+
+
+class _Batch(NamedTuple):
+    file: str
+    content_hash: str
+    count: int  # array items read, rejected ones included
+    position: int  # byte offset after the last item
+    rows: list[Any] | None  # None marks the end of the file
+    items: tuple[Any, ...] = ()  # raw items, for the dead-letter file
+    offsets: tuple[int, ...] = ()  # byte offset of every raw item
+    rejected: list[tuple[int, str, Exception]] | None = None
+
+
+class _Busy:
+    """Seconds each stage spent working rather than waiting on a queue."""
+
+    def __init__(self) -> None:
+        self.seconds = {"read": 0.0, "normalise": 0.0, "write": 0.0}
+
+    async def run(self, stage: str, awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.seconds[stage] += time.perf_counter() - started
+
+
+async def _read(
+    files: dict[str, tuple[str, manifest.ManifestEntry]],
+    batch_size: int,
+    outbox: asyncio.Queue,
+    busy: _Busy,
+) -> None:
+    for file, (content_hash, entry) in files.items():
+        if entry.byte_offset:
+            logging.info(
+                "[MANIFEST] Resuming %s after %s items", file, entry.items_done
+            )
+        reader = JsonArrayReader("datasets/" + file, start=entry.byte_offset)
+        batches = batched(reader.with_offsets(), batch_size)
+        # parsing runs in a thread so the loop keeps feeding the writer
+        while batch := await busy.run("read", asyncio.to_thread(next, batches, None)):
+            offsets, items = zip(*batch)
+            await outbox.put(
+                _Batch(
+                    file,
+                    content_hash,
+                    len(batch),
+                    reader.position,
+                    list(items),
+                    items,
+                    offsets,
+                )
+            )
+        await outbox.put(_Batch(file, content_hash, 0, reader.position, None))
+    await outbox.put(None)
+
+
+async def _normalise(
+    normaliser: RowNormaliser,
+    inbox: asyncio.Queue,
+    outbox: asyncio.Queue,
+    busy: _Busy,
+    key_filter: KeyFilter | None = None,
+) -> None:
+    def normalise(items: list[Any]) -> tuple[list[tuple], list]:
+        rows, rejected = normaliser.normalise_batch(items)
+        metrics.count("rows_rejected", len(rejected))
+        if key_filter is not None:
+            # only this stage's thread touches the key index
+            rows, rejected = key_filter.filter(rows, rejected, len(items))
+        return rows, rejected
+
+    while (batch := await inbox.get()) is not None:
+        if batch.rows is not None:
+            rows, rejected = await busy.run(
+                "normalise", asyncio.to_thread(normalise, batch.rows)
+            )
+            metrics.count("rows_parsed", batch.count)
+            batch = batch._replace(rows=rows, rejected=rejected)
+        await outbox.put(batch)
+    await outbox.put(None)
+
+
+async def _copy(
+    cursor: AsyncCursor, name: str, statements: CopyStatements, rows: list[tuple]
+) -> None:
+    await cursor.execute(statements.create)
+    async with cursor.copy(statements.copy) as copy:
+        if statements.types:
+            copy.set_types(statements.types)
+        for row in rows:
+            await copy.write_row(row)
+    await cursor.execute(statements.merge)
+    log_merged(name, len(rows), cursor.rowcount)
+    await cursor.execute(statements.truncate)
+
+
+async def _write(
+    connection: AsyncConnection,
+    name: str,
+    files: dict[str, tuple[str, manifest.ManifestEntry]],
+    column_parameters: list[tuple[str, str, str]],
+    method: str,
+    inbox: asyncio.Queue,
+    busy: _Busy,
+) -> Counter[str]:
+    statements = copy_statements(name, column_parameters)
+    insert = insert_statement(name, [parameter[0] for parameter in column_parameters])
+
+    async def write_batch(cursor: AsyncCursor, batch: _Batch) -> None:
+        if batch.rows is None:
+            await cursor.execute(manifest.FINISH_QUERY, (batch.content_hash,))
+        elif not batch.rows:
+            pass  # only the checkpoint is left to commit
+        elif method == "copy":
+            await _copy(cursor, name, statements, batch.rows)
+        else:
+            await cursor.executemany(insert, batch.rows)
+            metrics.count("rows_written", cursor.rowcount)
+        if batch.rows is not None:
+            # the checkpoint commits together with the batch
+            await cursor.execute(
+                manifest.CHECKPOINT_QUERY,
+                (batch.count, batch.position, batch.content_hash),
+            )
+        await cursor.connection.commit()
+
+    rejects: Counter[str] = Counter()
+    dead_letters: dict[str, DeadLetter] = {}
+    async with connection.cursor() as cursor:
+        while (batch := await inbox.get()) is not None:
+            dead_letter = dead_letters.get(batch.file)
+            if dead_letter is None:
+                resume = bool(files[batch.file][1].byte_offset)
+                dead_letter = dead_letters[batch.file] = DeadLetter(batch.file, resume)
+            dead_letter.add(batch.items, batch.offsets, batch.rejected or [])
+            await busy.run("write", write_batch(cursor, batch))
+            if batch.rows is None:
+                manifest.archive(batch.file)
+                rejects.update(dead_letters.pop(batch.file).summary())
+    return rejects
+
+
+async def _pipeline(
+    name: str,
+    files: dict[str, tuple[str, manifest.ManifestEntry]],
+    column_parameters: list[tuple[str, str, str]],
+    batch_size: int,
+    method: str,
+    busy: _Busy,
+    key_filter: KeyFilter | None,
+) -> Counter[str]:
+    parsed: asyncio.Queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    normalised: asyncio.Queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    normaliser = RowNormaliser(column_parameters)
+    # connected before the stages start: psycopg ignores a cancellation
+    # that arrives while connecting, the writer would then wait forever.
+    # Leaving the block rolls back the batch in flight when a stage failed
+    async with await async_connect() as connection:
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(_read(files, batch_size, parsed, busy))
+                group.create_task(
+                    _normalise(normaliser, parsed, normalised, busy, key_filter)
+                )
+                writer = group.create_task(
+                    _write(
+                        connection,
+                        name,
+                        files,
+                        column_parameters,
+                        method,
+                        normalised,
+                        busy,
+                    )
+                )
+        except BaseExceptionGroup as _group:
+            # the stage that failed first, the others were cancelled
+            raise _group.exceptions[0]
+    return writer.result()
+
+
+@logger
+def pipelined_insert(
+    name: str,
+    files: dict[str, tuple[str, manifest.ManifestEntry]],
+    column_parameters: list[tuple[str, str, str]],
+    batch_size: int,
+    method: str = "copy",
+    key_filter: KeyFilter | None = None,
+) -> Counter[str]:
+    """
+    Loads dataset files into table `name` with reading, normalising and
+    writing overlapped.
+
+    Three asyncio stages joined by queues of PIPELINE_QUEUE_SIZE batches:
+    the reader parses `batch_size` items with `JsonArrayReader` and the
+    normaliser converts them with `RowNormaliser`, both in worker threads,
+    while the writer sends the previous batch through an async psycopg
+    connection. A full queue blocks the stage before it, so at most a few
+    batches are held in memory, and the total time tends to the slowest
+    stage instead of the sum of all three.
+
+    Batches are written in file order with the same statements as
+    `copy_rows`/`insert_rows`; each commits together with its
+    `ingest_manifest` checkpoint and a file is marked done and archived
+    once its last batch committed, exactly as in the serial path. Rejected
+    rows go to the dead-letter file of their dataset file (see
+    `DeadLetter`) before their batch commits.
+
+    Parameters
+    ----------
+    name : str
+        Target table name.
+    files : dict[str, tuple[str, ManifestEntry]]
+        Dataset file names in `datasets` mapped to their content hash and
+        manifest entry (where to resume).
+    column_parameters : list[tuple[str, str, str]]
+        Column metadata of the table, primary key first.
+    batch_size : int
+        Array items per batch.
+    method : str
+        "copy" or "executemany".
+    key_filter : KeyFilter | None
+        Filters every batch before it is written, in the normaliser stage.
+
+    Returns
+    -------
+    Counter[str]
+        Rejected rows per column.
+
+    Raises
+    ------
+    ValueError
+        If a file is not a JSON array.
+    ConnectionError
+        If the database connection fails.
+    """
+    busy = _Busy()
+    started = time.perf_counter()
+    try:
+        return asyncio.run(
+            _pipeline(
+                name, files, column_parameters, batch_size, method, busy, key_filter
+            )
+        )
+    finally:
+        for stage, seconds in busy.seconds.items():
+            metrics.count(f"{stage}_seconds", seconds)
+        logging.info(
+            "[PIPELINE] %.3fs total, busy: read %.3fs, normalise %.3fs, write %.3fs",
+            time.perf_counter() - started,
+            *busy.seconds.values(),
+        )
@@ -0,0 +1,295 @@
+"""
+Opt-in profiling of chosen functions.
+
+    PROFILE=insert_data,report_to_xml python main.py
+    python -m scripts.profiling insert_data,RowNormaliser.normalise_batch main.py
+
+Every `@logger` function and the functions marked `@profiled` can be
+named in PROFILE, by `__name__` or `__qualname__`. Their calls gather
+cProfile stats, the tracemalloc peak with the top allocation sites and
+sampled stacks; at exit (or `write_profiles`) each function gets, per
+process, in `<PROFILE_DIR>/<UTC time>-<pid>/`:
+
+- `<function>.<pid>.prof`: pstats dump (snakeviz, `python -m pstats`),
+- `<function>.<pid>.collapsed`: folded stacks for flamegraph.pl or
+  speedscope,
+- `<function>.<pid>.txt`: calls, time, memory peak, allocation sites and
+  the functions taking the most cumulative time.
+
+cProfile and the sampled stacks follow the thread running the call, work
+handed to other threads shows under the profiled functions running there
+(e.g. `RowNormaliser.normalise_batch` for the pipeline's normaliser).
+A process runs one cProfile at a time (Python 3.12 and later allow no
+more): profiled calls of other threads running meanwhile only gather
+sampled stacks, time and memory.
+Functions not named are not wrapped at all, so profiling costs nothing
+when disabled.
+"""
+
+import argparse
+import atexit
+import cProfile
+import logging
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+from types import CodeType
+from typing import Callable, Iterator, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# functions profiled (`__name__` or `__qualname__`, comma separated),
+# empty disables profiling
+PROFILE = {name.strip() for name in os.getenv("PROFILE", "").split(",") if name.strip()}
+# where the profile directory of every run is created
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# seconds between two stack samples of a profiled call
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+# allocation sites and cProfile entries listed in the summaries
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", 20))
+
+# shared with the worker processes a run spawns
+if PROFILE and "PROFILE_RUN_DIR" not in os.environ:
+    os.environ["PROFILE_RUN_DIR"] = os.path.join(
+        PROFILE_DIR,
+        f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{os.getpid()}",
+    )
+
+F = TypeVar("F", bound=Callable)
+
+
+class _Profile:
+    """What the profiled calls of one function gathered in this process."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.stats: pstats.Stats | None = None
+        self.peak = 0  # bytes above the traced memory at the call start
+        self.sites: list[tracemalloc.Statistic] = []  # at the highest peak
+        self.stacks: Counter[str] = Counter()
+
+
+_profiles: dict[str, _Profile] = {}
+_lock = threading.Lock()
+_local = threading.local()  # `active`: a profiled call runs in the thread
+_running: dict[int, tuple[str, CodeType]] = {}  # thread id -> sampled call
+_wake = threading.Event()  # set while `_running` is not empty
+_sampler: threading.Thread | None = None
+_calls = 0  # profiled calls running, tracemalloc is on while above 0
+_started_tracing = False
+_profiler: int | None = None  # thread id of the call running the cProfile
+
+
+def wanted(func: Callable) -> bool:
+    """Tells whether PROFILE names `func`."""
+    return func.__name__ in PROFILE or func.__qualname__ in PROFILE
+
+
+def _frame_name(code: CodeType) -> str:
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def _sample() -> None:
+    # folds the stack of every thread in a profiled call, from that call down
+    while True:
+        _wake.wait()
+        time.sleep(PROFILE_INTERVAL)
+        with _lock:
+            running = dict(_running)
+        frames = sys._current_frames()
+        for thread, (name, code) in running.items():
+            frame = frames.get(thread)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                if frame.f_code is code:
+                    break
+                frame = frame.f_back
+            if stack:
+                with _lock:
+                    entry = _profiles.setdefault(name, _Profile())
+                    entry.stacks[";".join(reversed(stack))] += 1
+
+
+@contextmanager
+def _profiling(name: str, code: CodeType) -> Iterator[None]:
+    global _calls, _sampler, _started_tracing, _profiler
+    thread = threading.get_ident()
+    # a profiled call inside another one in the same thread is covered by
+    # the outer cProfile and sampler, only its calls/time/memory are added
+    outer = getattr(_local, "active", False)
+    profile = None
+    with _lock:
+        _profiles.setdefault(name, _Profile())
+        if _calls == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _calls += 1
+        if _calls == 1:
+            tracemalloc.reset_peak()
+        if not outer:
+            _running[thread] = (name, code)
+            _wake.set()
+            if _profiler is None:
+                _profiler = thread
+                profile = cProfile.Profile()
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample, name="profiler", daemon=True)
+            _sampler.start()
+    _local.active = True
+    memory = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    if profile is not None:
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiling tool (a debugger, coverage) is active
+            profile = None
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] - memory
+        _local.active = outer
+        with _lock:
+            entry = _profiles.setdefault(name, _Profile())
+            entry.calls += 1
+            entry.seconds += seconds
+            if profile is not None:
+                if entry.stats is None:
+                    entry.stats = pstats.Stats(profile)
+                else:
+                    entry.stats.add(profile)
+            highest = peak > entry.peak or not entry.sites
+            entry.peak = max(entry.peak, peak)
+            if not outer:
+                _running.pop(thread, None)
+                if not _running:
+                    _wake.clear()
+                if _profiler == thread:
+                    _profiler = None
+        if highest:
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                    tracemalloc.Filter(False, cProfile.__file__),
+                    tracemalloc.Filter(False, pstats.__file__),
+                )
+            )
+            entry.sites = snapshot.statistics("lineno")[:PROFILE_TOP]
+        with _lock:
+            _calls -= 1
+            if _calls == 0 and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+
+
+def profiled(func: F) -> F:
+    """
+    Profiles the calls of `func` when PROFILE names it, returns `func`
+    itself otherwise. `logger` applies it to every function it wraps, hot
+    functions without `@logger` are marked with it directly.
+    """
+    if not PROFILE or not wanted(func):
+        return func
+    name, code = func.__qualname__, func.__code__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _profiling(name, code):
+            return func(*args, **kwargs)
+
+    return wrapper  # type:ignore
+
+
+def _write_summary(path: str, name: str, entry: _Profile) -> None:
+    with open(path, mode="w", encoding="UTF-8") as w_file:
+        w_file.write(
+            f"{name} (pid {os.getpid()}): {entry.calls} calls, {entry.seconds:.3f}s\n"
+            f"tracemalloc peak: {entry.peak / 2**20:.2f} MiB above the call start\n"
+            f"stack samples: {entry.stacks.total()} every {PROFILE_INTERVAL}s\n"
+            "\nallocation sites alive after the call with the highest peak:\n"
+        )
+        for statistic in entry.sites:
+            w_file.write(f"{statistic}\n")
+        if entry.stats is not None:
+            w_file.write("\n")
+            entry.stats.stream = w_file  # type:ignore
+            entry.stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+
+def write_profiles() -> str | None:
+    """
+    Writes what the profiled calls of this process gathered so far (see
+    the module documentation) and starts over. Registered at exit.
+
+    Returns
+    -------
+    str | None
+        The profile directory of the run, None when nothing was profiled.
+    """
+    with _lock:
+        profiles = {name: entry for name, entry in _profiles.items() if entry.calls}
+        for name in profiles:
+            _profiles[name] = _Profile()
+    if not profiles:
+        return None
+    directory = os.environ["PROFILE_RUN_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    for name, entry in profiles.items():
+        base = os.path.join(directory, f"{name}.{os.getpid()}")
+        if entry.stats is not None:
+            entry.stats.dump_stats(base + ".prof")
+        with open(base + ".collapsed", mode="w", encoding="UTF-8") as w_file:
+            for stack, samples in sorted(entry.stacks.items()):
+                w_file.write(f"{stack} {samples}\n")
+        _write_summary(base + ".txt", name, entry)
+        logging.info(
+            "[PROFILE] %s: %s calls, %.3fs, peak %.2f MiB, written to %s.*",
+            name,
+            entry.calls,
+            entry.seconds,
+            entry.peak / 2**20,
+            base,
+        )
+    return directory
+
+
+if PROFILE:
+    atexit.register(write_profiles)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Run a script with PROFILE set, e.g. "
+        "python -m scripts.profiling insert_data,report_to_xml main.py"
+    )
+    parser.add_argument("functions", help="comma separated function names")
+    parser.add_argument("script", help="python script to run")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="script arguments")
+    args = parser.parse_args(argv)
+    # read by `scripts.profiling` when the script imports it
+    os.environ["PROFILE"] = args.functions
+    sys.argv = [args.script, *args.args]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    runpy.run_path(args.script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+WHITESPACE = " \t\n\r"
+# characters a JSON number starts with, and can go on with
+NUMBER_START = "-0123456789"
+NUMBER_CHARS = "0123456789.eE+-"
+CHUNK_SIZE = 1 << 16
+
+
+class JsonArrayReader:
+    """
+    Incrementally reads the items of a top-level JSON array file.
+
+    The file is read in `chunk_size` blocks and decoded one item at a time
+    with `json.JSONDecoder.raw_decode`, so memory is bounded by the chunk
+    size and the largest single item instead of the file size.
+
+    `position` is the byte offset right after the last yielded item. Passing
+    it back as `start` resumes reading with the next item.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a well-formed JSON array.
+    """
+
+    def __init__(self, path: str, chunk_size: int = CHUNK_SIZE, start: int = 0) -> None:
+        self._path = path
+        self._chunk_size = chunk_size
+        self._start = start
+        self._decoder = json.JSONDecoder()
+        self.position = start
+
+    def __iter__(self) -> Iterator[Any]:
+        for _, item in self.with_offsets():
+            yield item
+
+    def with_offsets(self) -> Iterator[tuple[int, Any]]:
+        """Yields (byte offset of the item, item) pairs."""
+        with open(self._path, "rb") as file:
+            file.seek(self._start)
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            buffer = ""
+            ascii_buffer = True  # byte and character offsets match
+            pos = 0
+            offset = self._start  # byte offset of buffer[pos]
+            eof = False
+            # "[" -> opening bracket, "first" -> item or "]",
+            # "item" -> item after a comma, "," -> comma or "]"
+            expect = "[" if self._start == 0 else ","
+
+            while True:
+                while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                    pos += 1
+                    offset += 1
+                if pos == len(buffer):
+                    if eof:
+                        raise ValueError(
+                            f"Unexpected end of JSON array in {self._path}"
+                        )
+                    chunk = file.read(self._chunk_size)
+                    eof = not chunk
+                    buffer = decoder.decode(chunk, final=eof)
+                    ascii_buffer = buffer.isascii()
+                    pos = 0
+                    continue
+
+                char = buffer[pos]
+                if expect == "[":
+                    if char != "[":
+                        raise ValueError(f"{self._path} is not a JSON array")
+                    expect = "first"
+                    pos += 1
+                    offset += 1
+                elif expect == ",":
+                    pos += 1
+                    offset += 1
+                    if char == "]":
+                        # position stays after the last item: resuming from
+                        # it reads the "]" again and yields nothing
+                        return
+                    if char != ",":
+                        raise ValueError(f"Expected ',' or ']' in {self._path}")
+                    expect = "item"
+                elif expect == "first" and char == "]":
+                    return
+                else:
+                    try:
+                        item, end = self._decoder.raw_decode(buffer, pos)
+                        # a number or literal ending the buffer may be cut
+                        # short, a number also before a fraction or exponent
+                        # (`1.` decodes as 1)
+                        complete = eof or (
+                            end < len(buffer)
+                            and not (
+                                buffer[pos] in NUMBER_START
+                                and buffer[end] in NUMBER_CHARS
+                            )
+                        )
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                        complete = False
+                    if not complete:
+                        chunk = file.read(self._chunk_size)
+                        eof = not chunk
+                        buffer = buffer[pos:] + decoder.decode(chunk, final=eof)
+                        ascii_buffer = buffer.isascii()
+                        pos = 0
+                        continue
+                    start = offset
+                    if ascii_buffer:
+                        offset += end - pos
+                    else:
+                        offset += len(buffer[pos:end].encode())
+                    pos = end
+                    expect = ","
+                    self.position = offset
+                    yield start, item
+
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    """
+    Groups `iterable` into lists of at most `size` items.
+
+    Raises
+    ------
+    ValueError
+        If `size` is less than one.
+    """
+    if size < 1:
+        raise ValueError("Batch size must be at least one")
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
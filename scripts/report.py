@@ -1,10 +1,19 @@
-from scripts.connection import server_connect, server_disconnect
-from psycopg import Connection
+from scripts.connection import POOL_MAX_SIZE, pooled_connection, read_connection
+from scripts.setup_db import sync_room_stats
+from scripts.cache import cached_report, cached_reports
+from scripts import catalog
 from psycopg import sql
 from scripts.logger import logger
+from scripts.xmlwriter import write_xml_rows
 import os
+import gzip
 import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
+from typing import IO, Any, Callable, Iterable, Iterator
+from uuid import uuid4
 
 
 @logger
@@ -13,35 +22,266 @@ def create_ages_view() -> None:
     Creates the `ages` view in the connected PostgreSQL database.
 
     Reads and executes the SQL script from `sql/create_ages_view.sql`.
-    Commits the transaction and closes the connection when done.
+    Commits the transaction and returns the connection to the pool when done.
 
-    This function is also used as a prerequisite check in other parts
-    of the application: it ensures the `ages_view` exists and creates it
-    if it is missing.
+    Used as a prerequisite check by `refresh_view`: it ensures the
+    `ages` view exists and creates it if it is missing.
 
     Raises
     ------
     ConnectionError
         If a database connection cannot be established.
     """
-    with open("sql/create_ages_view.sql", encoding="UTF-8") as file:
-        query = file.read().strip()
-        connection: Connection | None = server_connect()
-        if not connection:
-            raise ConnectionError
+    query = catalog.script_text("sql/create_ages_view.sql").strip()
+    with pooled_connection() as connection:
         with connection.cursor() as cursor:
             cursor.execute(query)  # type:ignore
-            connection.commit()
-        server_disconnect(connection)
+
+
+# reporting queries run at the same time (bounded by the pool size)
+REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", 4))
+# write JSON reports through a server-side cursor instead of json_agg
+REPORT_STREAM = os.getenv("REPORT_STREAM", "0") == "1"
+# rows fetched per round trip by streaming reports
+REPORT_FETCH_SIZE = int(os.getenv("REPORT_FETCH_SIZE", 1000))
+# gzip CSV/NDJSON reports while they are written (.gz suffix)
+REPORT_GZIP = os.getenv("REPORT_GZIP", "0") == "1"
+# indent XML reports (as minidom.toprettyxml did), 0 writes them on one line
+REPORT_XML_PRETTY = os.getenv("REPORT_XML_PRETTY", "1") == "1"
+DIR = "sql/reporting"
+
+# report formats written from one `fetch_json_agg` result, see
+# `register_encoder`
+ENCODERS: dict[str, Callable[[str, Any], str]] = {}
+
+
+def register_encoder(
+    report_format: str,
+) -> Callable[[Callable[[str, Any], str]], Callable[[str, Any], str]]:
+    """
+    Decorator registering `encoder(report name, rows) -> file path` as the
+    writer of `report_format` in `report_to_formats`.
+
+    `rows` is the `json_agg` result of the query (a list of dicts, None
+    when there are no rows); the encoder writes it under
+    `reports/<report_format>/`, which `report_to_formats` creates.
+    """
+
+    def register(encoder: Callable[[str, Any], str]) -> Callable[[str, Any], str]:
+        ENCODERS[report_format] = encoder
+        return encoder
+
+    return register
+
+
+def reporting_queries() -> list[tuple[str, str]]:
+    """
+    Returns (report name, query) for every `.sql` file in `sql/reporting`.
+    Files are read again only when they changed (see `catalog`).
+    """
+    return [
+        (
+            file_name.removesuffix(".sql"),
+            catalog.script_text(f"{DIR}/{file_name}").strip(),
+        )
+        for file_name in sorted(os.listdir(path=DIR))
+    ]
+
+
+def run_reports(task: Callable[[str, str], None], concurrency: int) -> None:
+    """
+    Runs `task(report name, query)` for every reporting query, up to
+    `concurrency` at a time.
+
+    Each task borrows its own pooled connection, so queries execute in
+    parallel on the server while finished results are being serialised.
+
+    Raises
+    ------
+    Exception
+        The first exception raised by a task, after all tasks finished.
+    """
+    concurrency = max(1, min(concurrency, POOL_MAX_SIZE))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # tasks run in the caller context, so their metrics count for it
+        futures = [
+            executor.submit(contextvars.copy_context().run, task, *query)
+            for query in reporting_queries()
+        ]
+    for future in futures:
+        future.result()
+
+
+def fetch_json_agg(query: str) -> Any:
+    """
+    Runs `query` wrapped in `json_agg` on a read connection (see
+    `read_connection`).
+
+    The statement is prepared on the server, so every pooled connection
+    parses and plans each report once instead of on every run.
+
+    Raises
+    ------
+    ValueError
+        If the query returns no results.
+    """
+    wrapped_query = sql.SQL("SELECT json_agg(t) FROM ({}) AS t").format(
+        sql.SQL(query)  # type:ignore
+    )
+    with read_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(wrapped_query, prepare=True)
+            result = cursor.fetchone()
+    if not result:
+        raise ValueError("No value was returned")
+    return result[0]
+
+
+def stream_json_rows(query: str) -> Iterator[Any]:
+    """
+    Yields the rows of `query` as JSON values (`row_to_json`) read through
+    a named server-side cursor, REPORT_FETCH_SIZE rows per round trip.
+    """
+    with read_connection() as connection:
+        with connection.cursor(name=f"report_{uuid4().hex}") as cursor:
+            cursor.itersize = REPORT_FETCH_SIZE
+            cursor.execute(
+                sql.SQL("SELECT row_to_json(t) FROM ({}) AS t").format(
+                    sql.SQL(query)  # type:ignore
+                )
+            )
+            for (row,) in cursor:
+                yield row
+
+
+def write_json_array(w_file: IO[str], rows: Iterable[Any]) -> None:
+    """
+    Writes `rows` as a JSON array one element at a time.
+
+    Output is identical to `json.dumps(list(rows), indent=4)`, except that
+    no rows give `null`, like `json_agg` over an empty result.
+    """
+    first = True
+    for row in rows:
+        w_file.write("[\n    " if first else ",\n    ")
+        # JSON strings never hold raw newlines, so this only indents lines
+        w_file.write(json.dumps(row, indent=4).replace("\n", "\n    "))
+        first = False
+    w_file.write("null" if first else "\n]")
+
+
+@register_encoder("json")
+def encode_json(name: str, rows: Any) -> str:
+    path = f"reports/json/{name}{datetime.now()}.json"
+    with open(path, mode="w") as w_file:
+        w_file.write(json.dumps(rows, indent=4))
+    return path
+
+
+def write_json_report(name: str, query: str, stream: bool = False) -> str:
+    if not stream:
+        return encode_json(name, fetch_json_agg(query))
+    path = f"reports/json/{name}{datetime.now()}.json"
+    with open(path, mode="w") as w_file:
+        write_json_array(w_file, stream_json_rows(query))
+    return path
+
+
+def copy_statement(query: str, report_format: str) -> sql.Composed:
+    """
+    Returns the `COPY ... TO STDOUT` statement writing the rows of `query`
+    as CSV with a header line, or as NDJSON (one `row_to_json` per line).
+
+    Raises
+    ------
+    ValueError
+        If `report_format` is neither "csv" nor "ndjson".
+    """
+    if report_format == "csv":
+        return sql.SQL("COPY ({}) TO STDOUT (FORMAT CSV, HEADER)").format(
+            sql.SQL(query)  # type:ignore
+        )
+    if report_format == "ndjson":
+        # TEXT format would escape the backslashes of the JSON. The JSON of
+        # a row holds no raw control characters, so CSV quoting on \x01
+        # with a \x02 delimiter passes every line through untouched
+        return sql.SQL(
+            "COPY (SELECT row_to_json(t) FROM ({}) AS t) TO STDOUT"
+            " (FORMAT CSV, QUOTE E'\\x01', DELIMITER E'\\x02')"
+        ).format(
+            sql.SQL(query)  # type:ignore
+        )
+    raise ValueError(f"Unknown COPY report format {report_format}")
+
+
+def write_copy_report(
+    name: str, query: str, report_format: str, compress: bool = False
+) -> str:
+    """
+    Streams the output of `COPY (query) TO STDOUT` into a report file, in
+    the blocks the server sends, gzipped on the fly with `compress`. No
+    row is decoded on the client.
+    """
+    path = f"reports/{report_format}/{name}{datetime.now()}.{report_format}"
+    if compress:
+        path += ".gz"
+    opener = partial(gzip.open, compresslevel=6) if compress else open
+    with read_connection() as connection:
+        with connection.cursor() as cursor:
+            with cursor.copy(copy_statement(query, report_format)) as copy:
+                with opener(path, mode="wb") as w_file:
+                    for block in copy:
+                        w_file.write(block)
+    return path
+
+
+@register_encoder("xml")
+def encode_xml(name: str, rows: Any, pretty: bool = REPORT_XML_PRETTY) -> str:
+    """
+    Writes `rows` as XML, one `row` element per row under a root element
+    named after the report (see `write_xml_rows`), indented with `pretty`.
+
+    Raises
+    ------
+    TypeError
+        If a value cannot be written as XML.
+    """
+    path = f"reports/xml/{name}{datetime.now()}.xml"
+    with open(path, mode="w") as w_file:
+        write_xml_rows(w_file, name, rows, "   " if pretty else None)
+    return path
+
+
+def write_xml_report(name: str, query: str, stream: bool = False) -> str:
+    if not stream:
+        return encode_xml(name, fetch_json_agg(query))
+    path = f"reports/xml/{name}{datetime.now()}.xml"
+    with open(path, mode="w") as w_file:
+        write_xml_rows(
+            w_file, name, stream_json_rows(query), "   " if REPORT_XML_PRETTY else None
+        )
+    return path
 
 
 @logger
-def report_to_json() -> None:
+def report_to_json(
+    concurrency: int = REPORT_CONCURRENCY,
+    stream: bool = REPORT_STREAM,
+    force: bool = False,
+) -> None:
     """
     Generates JSON reports from SQL files in `sql/reporting`.
 
-    Runs each `.sql` as a `json_agg` query,
-    and saves results as timestamped `.json` files in `reports/json`.
+    Runs each `.sql` as a `json_agg` query, up to `concurrency` queries
+    at a time, and saves results as timestamped `.json` files in
+    `reports/json`.
+
+    With `stream` rows are read through a server-side cursor and written
+    one by one (see `write_json_array`), so neither the server nor the
+    client holds the whole report in memory.
+
+    Reports whose query and input tables did not change since the last
+    written file are skipped (see `cached_report`), unless `force`.
 
     Raises
     ------
@@ -50,43 +290,34 @@ def report_to_json() -> None:
     ValueError
         If a query returns no results.
     """
-    create_ages_view()  # ensure view exists
-    connection: Connection | None = server_connect()
-    if not connection:
-        raise ConnectionError
-    DIR = "sql/reporting"
-    REPORT_DIR = "reports/json"
+    sync_room_stats()  # ensure room statistics are up to date
     # ensures that reporting directory exists
-    os.makedirs(REPORT_DIR, exist_ok=True)
-    for file_name in os.listdir(path=DIR):
-        file_name_no_suff = file_name.removesuffix(".sql")
-        with open(f"{DIR}/{file_name}", encoding="UTF-8") as file:
-            query = sql.SQL(file.read().strip())  # type:ignore
-            wrapped_query = sql.SQL(
-                "SELECT json_agg(t) \
-                                    FROM ({}) AS t"
-            ).format(query)
-            with connection.cursor() as cursor:
-                cursor.execute(wrapped_query)
-                result = cursor.fetchone()
-            if result:
-                with open(
-                    f"{REPORT_DIR}/{file_name_no_suff}{datetime.now()}.json", mode="w"
-                ) as w_file:
-                    w_file.write(json.dumps(result[0], indent=4))
-            else:
-                raise ValueError("No value was returned")
-    server_disconnect(connection)
+    os.makedirs("reports/json", exist_ok=True)
+    run_reports(
+        cached_report("json", partial(write_json_report, stream=stream), force),
+        concurrency,
+    )
 
 
 @logger
-def report_to_xml() -> None:
+def report_to_xml(
+    concurrency: int = REPORT_CONCURRENCY,
+    stream: bool = REPORT_STREAM,
+    force: bool = False,
+) -> None:
     """
     Generates XML reports from SQL files in `sql/reporting`.
 
-    Runs each `.sql` as a `json_agg` query,
-    converts results to XML, and saves them as timestamped `.xml` files
-    in `reports/xml`.
+    Runs each `.sql` as a `json_agg` query, up to `concurrency` queries
+    at a time, writes results as XML element by element (see
+    `write_xml_rows`), and saves them as timestamped `.xml` files in
+    `reports/xml`.
+
+    With `stream` rows are read through a server-side cursor, as in
+    `report_to_json`, so the report is never held in memory.
+
+    Reports whose query and input tables did not change since the last
+    written file are skipped (see `cached_report`), unless `force`.
 
     Raises
     ------
@@ -95,45 +326,113 @@ def report_to_xml() -> None:
     ValueError
         If a query returns no results.
     TypeError
-        If the XML serialization does not return a string.
-    """
-    create_ages_view()  # ensure view exists
-    connection: Connection | None = server_connect()
-    if not connection:
-        raise ConnectionError
-    DIR = "sql/reporting"
-    REPORT_DIR = "reports/xml"
+        If a value cannot be written as XML.
+    """
+    sync_room_stats()  # ensure room statistics are up to date
     # ensures that reporting directory exists
-    os.makedirs(REPORT_DIR, exist_ok=True)
-    for file_name in os.listdir(DIR):
-        file_name_no_suff = file_name.removesuffix(".sql")
-        with open(f"{DIR}/{file_name}", encoding="UTF-8") as file:
-            query = sql.SQL(file.read().strip())  # type:ignore
-            with connection.cursor() as cursor:
-                wrapped_query = sql.SQL("SELECT json_agg(t) FROM ({}) AS t").format(
-                    query
-                )
-                cursor.execute(wrapped_query)
-                result = cursor.fetchone()
-                if result:
-                    from dicttoxml import dicttoxml
-
-                    with open(
-                        f"{REPORT_DIR}/{file_name_no_suff}{datetime.now()}.xml",
-                        mode="w",
-                    ) as w_file:
-                        from xml.dom.minidom import parseString
-
-                        raw_xml = dicttoxml(
-                            result[0],
-                            custom_root=file_name_no_suff,
-                            item_func=lambda _: "row",
-                            attr_type=False,
-                            return_bytes=False,
-                        )
-                        to_write = parseString(raw_xml).toprettyxml(indent="   ")
-                        # ensure that reporting directory exists
-                        if isinstance(to_write, str):
-                            w_file.write(to_write)
-                        else:
-                            raise TypeError
+    os.makedirs("reports/xml", exist_ok=True)
+    run_reports(
+        cached_report("xml", partial(write_xml_report, stream=stream), force),
+        concurrency,
+    )
+
+
+@logger
+def report_to_formats(
+    formats: Iterable[str] | None = None,
+    concurrency: int = REPORT_CONCURRENCY,
+    force: bool = False,
+) -> None:
+    """
+    Generates the reports of `sql/reporting` in several formats from one
+    run of every query.
+
+    Each query runs once as `json_agg` (see `fetch_json_agg`) and its
+    result goes to the encoder of every format (all registered with
+    `register_encoder` when `formats` is None: json, xml, ...), so the
+    database load does not grow with the number of formats. Only formats
+    whose cached file is stale are encoded, and the query is not run at
+    all when none is (see `cached_reports`), unless `force`.
+
+    Raises
+    ------
+    ValueError
+        If a format has no registered encoder or a query returns no
+        results.
+    ConnectionError
+        If the database connection fails.
+    TypeError
+        If a value cannot be written as XML.
+    """
+    formats = list(ENCODERS if formats is None else formats)
+    unknown = [
+        report_format for report_format in formats if report_format not in ENCODERS
+    ]
+    if unknown:
+        raise ValueError(f"No encoder registered for {', '.join(unknown)}")
+    sync_room_stats()  # ensure room statistics are up to date
+    # ensures that reporting directories exist
+    for report_format in formats:
+        os.makedirs(f"reports/{report_format}", exist_ok=True)
+    encoders = {report_format: ENCODERS[report_format] for report_format in formats}
+    run_reports(cached_reports(encoders, fetch_json_agg, force), concurrency)
+
+
+def report_by_copy(
+    report_format: str, concurrency: int, compress: bool, force: bool
+) -> None:
+    sync_room_stats()  # ensure room statistics are up to date
+    # ensures that reporting directory exists
+    os.makedirs(f"reports/{report_format}", exist_ok=True)
+    writer = partial(write_copy_report, report_format=report_format, compress=compress)
+    # gzipped and plain files are cached apart
+    cache_format = report_format + (".gz" if compress else "")
+    run_reports(cached_report(cache_format, writer, force), concurrency)
+
+
+@logger
+def report_to_csv(
+    concurrency: int = REPORT_CONCURRENCY,
+    compress: bool = REPORT_GZIP,
+    force: bool = False,
+) -> None:
+    """
+    Generates CSV reports (with a header line) from SQL files in
+    `sql/reporting` into `reports/csv`.
+
+    Every query runs as `COPY (query) TO STDOUT (FORMAT CSV)` and the
+    server output is written to the file as it arrives (see
+    `write_copy_report`), gzipped with `compress`, so no Python objects
+    are built for the rows and memory does not grow with the report.
+
+    Reports whose query and input tables did not change since the last
+    written file are skipped (see `cached_report`), unless `force`.
+
+    Raises
+    ------
+    ConnectionError
+        If the database connection fails.
+    """
+    report_by_copy("csv", concurrency, compress, force)
+
+
+@logger
+def report_to_ndjson(
+    concurrency: int = REPORT_CONCURRENCY,
+    compress: bool = REPORT_GZIP,
+    force: bool = False,
+) -> None:
+    """
+    Generates newline-delimited JSON reports (one JSON object per row)
+    from SQL files in `sql/reporting` into `reports/ndjson`.
+
+    Rows are turned into JSON by `row_to_json` on the server and streamed
+    with `COPY ... TO STDOUT` straight into the file, like
+    `report_to_csv`.
+
+    Raises
+    ------
+    ConnectionError
+        If the database connection fails.
+    """
+    report_by_copy("ndjson", concurrency, compress, force)
@@ -1,15 +1,59 @@
-from scripts.connection import server_connect, server_disconnect
+from scripts.connection import close_pools, pooled_connection
 from dotenv import load_dotenv
-from psycopg import Connection, sql
+from psycopg import Cursor, sql
 import os
-import sqlparse
-import json
+from collections import Counter
+from operator import call, itemgetter
+from typing import Callable, NamedTuple
 from scripts.logger import logger
-from typing import Dict
+from scripts import catalog, manifest, metrics
+from scripts.deadletter import DeadLetter
+from scripts.keyindex import KEY_INDEX, KeyFilter
+from scripts.profiling import profiled
+from scripts.reader import JsonArrayReader, batched
 import logging
 
 load_dotenv()
 
+# number of dataset rows normalised and sent to the server at once
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 10000))
+
+# processes/connections insert_data uses, 1 keeps the serial path
+WORKERS = int(os.getenv("WORKERS", 1))
+
+# 1 overlaps reading, normalising and writing in the serial path (see
+# `pipelined_insert`), 0 runs them one after another
+PIPELINE = os.getenv("PIPELINE", "1") == "1"
+
+# ways insert_data can push normalised rows to the server
+INSERT_METHODS = ("copy", "executemany")
+
+# `sql/` scripts of the schema in dependency order (see `migrate`)
+SCHEMA_SCRIPTS = (
+    "tables.sql",
+    "functions.sql",
+    "room_stats.sql",
+    "report_cache.sql",
+    "ingest_manifest.sql",
+    "indexes.sql",
+)
+# pg_advisory_xact_lock key serialising concurrent `migrate` calls
+MIGRATION_LOCK = 7_402_110
+
+# information_schema data types psycopg can dump in binary COPY format
+# from the values produced by Normalisation
+BINARY_COPY_TYPES = {
+    "integer",
+    "smallint",
+    "bigint",
+    "real",
+    "double precision",
+    "text",
+    "character",
+    "character varying",
+    "date",
+}
+
 
 @logger
 def reset_parameters() -> None:
@@ -30,15 +74,9 @@ def reset_parameters() -> None:
         or if SQL execution fails.
     """
 
-    connection: Connection | None = server_connect(
-        admin=True, admin_db=True
-    )  # admin connection
-    if not connection:
-        raise ConnectionError("Cannot connect with admin parameters")
     role = os.getenv("DBUSER")
     password = os.getenv("PASSWORD")
     db_name = os.getenv("DBNAME")
-    connection.autocommit = True
     if not role:
         raise Exception("No such parameter as DBUSER in .env file")
     if not db_name:
@@ -72,18 +110,73 @@ def reset_parameters() -> None:
     create_db = sql.SQL("CREATE DATABASE ") + sql.Identifier(db_name)
 
     revoke_priveleges()
+    close_pools()  # pooled sessions of the dropped database would be killed
+    with pooled_connection(admin=True, admin_db=True) as connection:
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(query=sql_create_role)
+                cursor.execute(query=drop_db)
+                cursor.execute(query=create_db)
+
+        except Exception as _ex:
+            raise Exception(
+                f"Exception ocurred during resetting parametrs. Exception: {_ex}"
+            )
+
+
+@logger
+def ensure_database() -> bool:
+    """
+    Makes sure the app role and database exist without touching any data.
+
+    When the app credentials can already connect nothing else is done.
+    Otherwise the role is created (or its password reset) and the database
+    created if missing, through the admin connection, and privileges are
+    granted. `reset_parameters` is the destructive alternative.
+
+    Returns
+    -------
+    bool
+        True if the role or database had to be (re)created.
+
+    Raises
+    ------
+    ConnectionError
+        If neither the app nor the admin credentials can connect.
+    Exception
+        If required environment variables are missing.
+    """
+    from scripts.connection import get_pool
+
     try:
-        with connection.cursor() as cursor:
-            cursor.execute(query=sql_create_role)
-            cursor.execute(query=drop_db)
-            cursor.execute(query=create_db)
+        get_pool()  # probes the app credentials
+        return False
+    except ConnectionError:
+        logging.info("[SETUP] App database is not reachable, creating it")
 
-    except Exception as _ex:
-        raise Exception(
-            f"Exception ocurred during resetting parametrs. Exception: {_ex}"
-        )
-    finally:
-        server_disconnect(connection)
+    role = os.getenv("DBUSER")
+    password = os.getenv("PASSWORD")
+    db_name = os.getenv("DBNAME")
+    if not role or not db_name or not password:
+        raise Exception("DBUSER, PASSWORD and DBNAME are required in .env file")
+    with pooled_connection(admin=True, admin_db=True) as connection:
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_roles WHERE rolname=%s", (role,))
+            verb = "ALTER" if cursor.fetchone() else "CREATE"
+            cursor.execute(
+                sql.SQL(verb + " ROLE {} WITH LOGIN PASSWORD {}").format(
+                    sql.Identifier(role), sql.Literal(password)
+                )
+            )
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname=%s", (db_name,))
+            if not cursor.fetchone():
+                cursor.execute(
+                    sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db_name))
+                )
+    grant_priveleges()
+    return True
 
 
 @logger
@@ -101,16 +194,12 @@ def grant_priveleges(user: str | None = os.getenv("DBUSER")) -> None:
         If admin connection fails or no user is specified.
     """
 
-    connection: Connection | None = server_connect(admin=True, admin_db=False)
-    if not connection:
-        raise Exception("Cannot connect to postgres superuser")
     if not user:
         raise Exception("No DBUSER specified in .env file")
     query = sql.SQL("GRANT USAGE, CREATE ON SCHEMA public TO ") + sql.Identifier(user)
-    with connection.cursor() as cursor:
-        cursor.execute(query)
-        connection.commit()
-    server_disconnect(connection)
+    with pooled_connection(admin=True, admin_db=False) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(query)
 
 
 @logger
@@ -126,23 +215,86 @@ def revoke_priveleges(user: str | None = os.getenv("DBUSER")) -> None:
     Exception
         If admin connection fails or no user is specified.
     """
+    if not user:
+        raise EnvironmentError("No DBUSER specified in .env file")
+    query = sql.SQL("REVOKE ALL PRIVILEGES ON SCHEMA public FROM ") + sql.Identifier(
+        user
+    )
     try:
-        connection: Connection | None = server_connect(admin=True, admin_db=False)
+        with pooled_connection(admin=True, admin_db=False) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query)
     except ConnectionError:
         logging.info(
             "[ATTENTION] Previous WARNING is not a WARNING. Tried to revoke \
                      priveleges, however Database was not created at that moment."
         )
-        return
-    if not user or not connection:
-        raise EnvironmentError("No DBUSER specified in .env file")
-    query = sql.SQL("REVOKE ALL PRIVILEGES ON SCHEMA public FROM ") + sql.Identifier(
-        user
-    )
-    with connection.cursor() as cursor:
-        cursor.execute(query)
-        connection.commit()
-    server_disconnect(connection)
+
+
+def execute_script(cursor: Cursor, script: str) -> None:
+    """Executes every statement of `sql/<script>` (parsed once, see `catalog`)."""
+    for query in catalog.script_statements(f"sql/{script}"):
+        cursor.execute(query)  # type:ignore
+    catalog.clear_columns()  # the script may have changed tables
+
+
+@logger
+def migrate(scripts: tuple[str, ...] = SCHEMA_SCRIPTS) -> list[str]:
+    """
+    Applies the schema scripts of `sql/` that changed since they were last
+    applied.
+
+    The sha256 checksum of every applied script is stored in the
+    `schema_migrations` table. Scripts are checked in order and only the
+    ones that are new or changed are applied, so starting against an
+    up-to-date database costs one query. Every script is idempotent and
+    keeps the objects other scripts build on: tables holding data are
+    created `IF NOT EXISTS`, functions and views `OR REPLACE`, and the
+    derived `room_stats` is created again and rebuilt from `students`.
+    Everything runs in one transaction under an advisory lock, concurrent
+    starts do not apply a script twice.
+
+    Returns
+    -------
+    list[str]
+        The scripts applied.
+
+    Raises
+    ------
+    ConnectionError
+        If the database connection fails.
+    """
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK,))
+            cursor.execute(
+                """CREATE TABLE IF NOT EXISTS schema_migrations
+                (
+                    script TEXT PRIMARY KEY,
+                    checksum TEXT NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT now()
+                )"""
+            )
+            cursor.execute("SELECT script, checksum FROM schema_migrations")
+            applied = dict(cursor.fetchall())
+            pending: list[str] = []
+            for script in scripts:
+                checksum = catalog.script_checksum(f"sql/{script}")
+                if applied.get(script) == checksum:
+                    continue
+                logging.info("[MIGRATION] Applying %s", script)
+                execute_script(cursor, script)
+                cursor.execute(
+                    """INSERT INTO schema_migrations (script, checksum)
+                    VALUES (%s, %s)
+                    ON CONFLICT (script) DO UPDATE
+                    SET checksum=EXCLUDED.checksum, applied_at=now()""",
+                    (script, checksum),
+                )
+                pending.append(script)
+    if not pending:
+        logging.info("[MIGRATION] Schema is up-to-date")
+    return pending
 
 
 @logger
@@ -150,26 +302,17 @@ def create_tables() -> None:
     """
     Creates database tables from the `sql/tables.sql` script.
 
-    Reads and executes each SQL statement in the file sequentially,
-    committing after each execution.
+    Executes the statements of the file in one transaction. Applied by
+    `migrate` on setup; calling it directly re-runs it unconditionally.
 
     Raises
     ------
     Exception
         If the database connection fails.
     """
-    connection: Connection | None = server_connect()
-    if not connection:
-        raise Exception("Cannot connect to DB")
-    with open("sql/tables.sql", encoding="UTF-8") as file:
-        raw_sql = file.read()
+    with pooled_connection() as connection:
         with connection.cursor() as cursor:
-            for q in sqlparse.split(raw_sql):
-                query = q.strip()
-                if query:
-                    cursor.execute(query)  # type:ignore
-                    connection.commit()
-    server_disconnect(connection)
+            execute_script(cursor, "tables.sql")
 
 
 @logger
@@ -177,26 +320,17 @@ def load_functions() -> None:
     """
     Loads database functions from the `sql/functions.sql` script.
 
-    Reads and executes each SQL statement in the file sequentially,
-    committing after each execution.
+    Executes the statements of the file in one transaction. Applied by
+    `migrate` on setup; calling it directly re-runs it unconditionally.
 
     Raises
     ------
     ConnectionError
         If the database connection fails.
     """
-    connection: Connection | None = server_connect()
-    if not connection:
-        raise ConnectionError
-    with open("sql/functions.sql", encoding="UTF-8") as file:
-        raw_sql = file.read()
-        for q in sqlparse.split(raw_sql):
-            with connection.cursor() as cursor:
-                query = q.strip()
-                if query:
-                    cursor.execute(query)  # type:ignore
-                    connection.commit()
-    server_disconnect(connection)
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            execute_script(cursor, "functions.sql")
 
 
 @logger
@@ -205,142 +339,435 @@ def refresh_view(view_name: str = "ages") -> None:
     Refreshes the specified materialized view (default: `ages`).
 
     Ensures the view exists by calling `create_ages_view()`, then runs
-    `REFRESH MATERIALIZED VIEW` to update its contents. Used after each
-    data insertion to maintain data consistency.
+    `REFRESH MATERIALIZED VIEW` to update its contents. Recomputes every
+    student, so it is not run on insertion anymore: reports read the
+    incrementally maintained `room_stats` instead.
 
     Raises
     ------
     ConnectionError
         If the database connection fails.
     """
-    connection: Connection | None = server_connect()
-    if not connection:
-        raise ConnectionError
-    with connection.cursor() as cursor:
-        from scripts.report import create_ages_view
+    from scripts.report import create_ages_view
 
-        create_ages_view()  # ensure view exist
-        cursor.execute("""REFRESH MATERIALIZED VIEW "ages" """)
-        connection.commit()
-    server_disconnect(connection)
+    create_ages_view()  # ensure view exist
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("""REFRESH MATERIALIZED VIEW "ages" """)
+            # refreshes fire no trigger, record the change for the report cache
+            cursor.execute(
+                """INSERT INTO table_changes (table_name) VALUES ('ages')
+                ON CONFLICT DO NOTHING"""
+            )
+
+
+@logger
+def create_room_stats() -> None:
+    """
+    Creates the incrementally maintained `room_stats` summary from the
+    `sql/room_stats.sql` script.
+
+    Every insert, update and delete on `students` appends its per-room
+    delta (counts, age sum/min/max, male/female counts; removed rows count
+    negative) to `room_stats_delta` through statement triggers;
+    `sync_room_stats` folds the deltas into `room_stats`.
+    The summary is rebuilt from `students` every time the script runs.
+
+    Raises
+    ------
+    ConnectionError
+        If the database connection fails.
+    """
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            execute_script(cursor, "room_stats.sql")
+
+
+@logger
+def create_report_cache() -> None:
+    """
+    Creates the persistent report cache from the `sql/report_cache.sql`
+    script.
+
+    Statement triggers on `rooms`, `students` and `room_stats` record each
+    committing transaction that changed them in `table_changes`; the
+    `table_versions` view counts them per table. `report_cache` remembers
+    which data versions every written report was computed from.
+
+    Raises
+    ------
+    ConnectionError
+        If the database connection fails.
+    """
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            execute_script(cursor, "report_cache.sql")
+
+
+@logger
+def sync_room_stats() -> None:
+    """
+    Brings `room_stats` up to date.
+
+    Folds the pending per-statement deltas into `room_stats`, which costs
+    in the number of rooms touched since the last call; the age min/max of
+    rooms students were updated or deleted in are read back from
+    `students`. Once a day, when the stored ages are outdated, or when
+    `room_stats` is empty while `students` is not, rebuilds the summary
+    from `students`.
+
+    Raises
+    ------
+    ConnectionError
+        If the database connection fails.
+    """
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT room_stats_sync()")
 
 
 @logger
 def load_indexes() -> None:
-    connection: Connection | None = server_connect()
-    if not connection:
-        raise ConnectionError
-    with connection.cursor() as cursor:
-        with open("sql/indexes.sql", encoding="UTF-8") as file:
-            queries = sqlparse.split(file.read())
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
             try:
-                for query in queries:
-                    if query:
-                        cursor.execute(query.strip())  # type:ignore
+                execute_script(cursor, "indexes.sql")
                 connection.commit()
-            except Exception:
+            except Exception as _ex:
                 connection.rollback()
-            finally:
-                server_disconnect(connection)
+                logging.warning("[INDEXES] sql/indexes.sql rolled back: %s", _ex)
+
+
+def insert_statement(name: str, columns: list[str]) -> sql.Composed:
+    """Returns the per-row `INSERT` of `insert_rows` for table `name`."""
+    return sql.SQL(
+        """INSERT INTO {} ({}) VALUES({})
+                  ON CONFLICT ({}) DO UPDATE
+                  SET {}=DEFAULT --DUMMY VALUE (Won't be executed)
+                  WHERE conflict_resolution(EXCLUDED.{})"""
+    ).format(
+        sql.Identifier(name),
+        sql.SQL(",").join(map(sql.Identifier, columns)),
+        sql.SQL(",").join(sql.Placeholder() * len(columns)),
+        sql.Identifier(columns[0]),
+        sql.Identifier(columns[0]),
+        sql.Identifier(columns[0]),
+    )
+
+
+@logger
+def insert_rows(
+    cursor: Cursor, name: str, columns: list[str], rows: list[tuple]
+) -> None:
+    """
+    Inserts rows into table `name` one statement per row.
+
+    Every duplicate primary key goes through `conflict_resolution`, which
+    raises a NOTICE and skips the row. Kept as a fallback for `copy_rows`
+    so both paths can be compared.
+    """
+    cursor.executemany(insert_statement(name, columns), params_seq=rows)
+    metrics.count("rows_written", cursor.rowcount)
+
+
+class CopyStatements(NamedTuple):
+    """Statements `copy_rows` runs for one table, in order."""
+
+    create: sql.Composed  # staging table of the transaction
+    copy: sql.Composed
+    merge: sql.Composed
+    truncate: sql.Composed
+    types: list[str] | None  # binary COPY types, None for text format
+
+
+def copy_statements(
+    name: str, column_parameters: list[tuple[str, str, str]]
+) -> CopyStatements:
+    """Builds the `copy_rows` statements for table `name`."""
+    columns = [parameter[0] for parameter in column_parameters]
+    data_types = [parameter[1].casefold() for parameter in column_parameters]
+    stage = sql.Identifier(f"{name}_stage")
+    fields = sql.SQL(",").join(map(sql.Identifier, columns))
+    key = sql.Identifier(columns[0])
+    binary = all(data_type in BINARY_COPY_TYPES for data_type in data_types)
+    return CopyStatements(
+        # _ord keeps the file order so the first duplicate wins on merge;
+        # dropped on commit, so it never outlives a change of the table
+        create=sql.SQL(
+            "CREATE TEMP TABLE IF NOT EXISTS {} (LIKE {}, _ord BIGSERIAL)"
+            " ON COMMIT DROP"
+        ).format(stage, sql.Identifier(name)),
+        copy=sql.SQL("COPY {} ({}) FROM STDIN (FORMAT {})").format(
+            stage, fields, sql.SQL("BINARY" if binary else "TEXT")
+        ),
+        merge=sql.SQL(
+            """INSERT INTO {} ({})
+                SELECT DISTINCT ON ({}) {} FROM {} ORDER BY {}, _ord
+                ON CONFLICT ({}) DO NOTHING"""
+        ).format(sql.Identifier(name), fields, key, fields, stage, key, key),
+        truncate=sql.SQL("TRUNCATE {}").format(stage),
+        types=data_types if binary else None,
+    )
+
+
+def log_merged(name: str, rows: int, written: int) -> None:
+    """Counts the rows a `copy_rows` merge wrote and skipped."""
+    skipped = rows - written
+    metrics.count("rows_written", written)
+    metrics.count("rows_skipped", skipped)
+    if skipped:
+        logging.info(
+            "[PG-NOTICE] %s rows skipped: primary key already exist in %s",
+            skipped,
+            name,
+        )
 
 
 @logger
-def insert_data(name: str) -> None:
+def copy_rows(
+    cursor: Cursor,
+    name: str,
+    column_parameters: list[tuple[str, str, str]],
+    rows: list[tuple],
+) -> None:
+    """
+    Bulk loads rows into table `name` through `COPY FROM STDIN`.
+
+    Rows are streamed into a temporary staging table dropped at commit
+    (binary format when every column type allows it, text otherwise) and
+    merged into the target table with a single `INSERT ... SELECT`. Rows whose primary key
+    already exists are skipped; for duplicates inside the batch the first
+    occurrence wins, as with `insert_rows`.
+
+    Parameters
+    ----------
+    cursor : Cursor
+        Cursor of the connection that owns the transaction.
+    name : str
+        Target table name.
+    column_parameters : list[tuple[str, str, str]]
+        (column_name, data_type, is_nullable) rows from `information_schema`,
+        the first column being the primary key.
+    rows : list[tuple]
+        Normalised rows in `column_parameters` order.
+    """
+    statements = copy_statements(name, column_parameters)
+    cursor.execute(statements.create)
+    with cursor.copy(statements.copy) as copy:
+        if statements.types:
+            copy.set_types(statements.types)
+        for row in rows:
+            copy.write_row(row)
+    cursor.execute(statements.merge)
+    log_merged(name, len(rows), cursor.rowcount)
+    cursor.execute(statements.truncate)
+
+
+@logger
+def insert_data(
+    name: str,
+    method: str = "copy",
+    batch_size: int = BATCH_SIZE,
+    workers: int = WORKERS,
+    pipeline: bool = PIPELINE,
+    key_index: bool = KEY_INDEX,
+    files: list[str] | None = None,
+) -> Counter[str]:
     """
     Inserts data from matching JSON files in `datasets` into the
     specified table.
 
     Normalizes values based on table column definitions from
-    `information_schema`, skips rows with invalid values,
-    and uses `ON CONFLICT` to avoid duplicate inserts.
+    `information_schema` (see `RowNormaliser`, cached by
+    `catalog.table_columns`), skips rows with invalid values,
+    and skips rows whose primary key already exists.
     Moves processed files to `datasets/parsed` after insertion.
 
-    Ensures required SQL functions are loaded before inserting.
-    After each successful insertion batch, refreshes the `ages`
-    view to keep query results and reports in sync with the latest data.
+    Files are streamed with `JsonArrayReader` and sent in batches of
+    `batch_size` rows, so memory does not grow with the file size. Rows are
+    sent with `COPY` through a staging table (`method="copy"`, see
+    `copy_rows`) or statement by statement (`method="executemany"`, see
+    `insert_rows`).
+
+    Every file is recorded in `ingest_manifest` by the sha256 of its
+    content. Each batch commits together with a checkpoint (items and byte
+    offset loaded), so a load that was interrupted resumes after the last
+    committed batch, and a file whose content was fully loaded before,
+    under any name, is skipped without being parsed. Files with the same
+    content in one call are loaded once, from the first of them.
+
+    With `pipeline` (the default) the serial path is run by
+    `pipelined_insert`: the next batch is read and normalised in threads
+    while the current one is written through an async connection, with
+    the same batches, checkpoints and commits.
+
+    With `workers` above one the files are loaded by `parallel_insert`:
+    chunks are normalised in worker processes and written by several
+    connections at once. That path commits and checkpoints whole files
+    only, an interrupted file is read again from its start (rows already
+    there are skipped).
+
+    Rows with an invalid value are written to a dead-letter NDJSON file
+    per dataset file (see `DeadLetter`) with their offset, column and
+    reason, and summarised in one log line per file.
+
+    With `key_index` the keys of the table and of the tables its foreign
+    keys reference are loaded once and every batch is filtered before it
+    is sent (see `KeyFilter`): rows whose primary key is already loaded
+    are dropped client side, rows referencing a missing key are rejected
+    to the dead-letter file instead of failing their batch.
+
+    `files` limits the load to these names in `datasets` (see `watch`),
+    all matching files are loaded by default.
+
+    Relies on the SQL functions `migrate` installs at setup.
+    After insertion folds the new rows into `room_stats` (see
+    `sync_room_stats`) to keep reports in sync with the latest data.
+
+    Returns
+    -------
+    Counter[str]
+        Rejected rows per column (the first invalid column of each row).
 
     Raises
     ------
     ValueError
-        If no matching JSON files are found or if the table has no columns.
+        If no matching JSON files are found, if the table has no columns,
+        if `method` is unknown or if a file is not a JSON array.
     ConnectionError
         If the database connection fails.
     """
+    if method not in INSERT_METHODS:
+        raise ValueError(f"Unknown insert method {method}")
     matching_files = [
         file
-        for file in os.listdir("datasets")
+        for file in (os.listdir("datasets") if files is None else files)
         if name in file and file.endswith(".json")
     ]
     if not matching_files:
         raise FileNotFoundError("No such file in datasets directory")
 
-    connection = server_connect()
-    if not connection:
-        raise ConnectionError("No such file in datasets directory")
-
-    column_parameters = []
-    with connection.cursor() as cursor:
-        cursor.execute(
-            sql.SQL(
-                """SELECT column_name, data_type, is_nullable
-                            FROM information_schema.columns
-                            WHERE table_schema=%s and table_name=%s"""
-            ),
-            params=("public", name),
-        )
-        column_parameters = cursor.fetchall()
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            column_parameters = catalog.table_columns(cursor, name)
     if column_parameters == []:
         raise ValueError("No columns in the table")
 
-    norm_dict = {  # parameter[0] is column name
-        parameter[0]: Normalisation(parameter) for parameter in column_parameters
-    }
-    for file in matching_files:
-        with open("datasets/" + file, encoding="UTF-8") as f:
-            data: list[Dict] = json.load(f)
-            insertion_list = []
-            for dict in data:
-                fail = False
-                insertion_tuple = ()
-                for key in norm_dict.keys():
-                    try:
-                        value = norm_dict[key].normalise_value(dict[key])
-                        insertion_tuple += (value,)
-                    except (
-                        ValueError,
-                        TypeError,
-                    ):  # nothing really bad just incorrect value inserted
-                        logging.info(
-                            f"[WARNING] Value passed in file in {key} \
-                                column was incorrect."
-                        )
-                        fail = True
-                        break
-                if not fail:
-                    insertion_list.append(insertion_tuple)
-            with connection.cursor() as cursor:
-                load_functions()  # check wheather needed functionn is loaded
-                query = sql.SQL(
-                    """INSERT INTO {} ({}) VALUES({})
-                              ON CONFLICT ({}) DO UPDATE
-                              SET {}=DEFAULT --DUMMY VALUE (Won't be executed)
-                              WHERE conflict_resolution(EXCLUDED.{})"""
-                ).format(
-                    sql.Identifier(name),
-                    sql.SQL(",").join(map(sql.Identifier, norm_dict.keys())),
-                    sql.SQL(",").join(sql.Placeholder() * len(norm_dict.keys())),
-                    sql.Identifier(next(iter(norm_dict.keys()))),
-                    sql.Identifier(next(iter(norm_dict.keys()))),
-                    sql.Identifier(next(iter(norm_dict.keys()))),
+    # content already in the manifest is never parsed again
+    pending: dict[str, tuple[str, manifest.ManifestEntry]] = {}
+    # files whose content is loaded from another file of this call
+    duplicates: list[str] = []
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            loading = {}
+            for file in matching_files:
+                content_hash = manifest.file_hash("datasets/" + file)
+                if content_hash in loading:
+                    logging.info(
+                        "[MANIFEST] %s has the content of %s. Skip",
+                        file,
+                        loading[content_hash],
+                    )
+                    metrics.count("files_skipped")
+                    duplicates.append(file)
+                    continue
+                entry = manifest.start_file(
+                    cursor, content_hash, name, "datasets/" + file
                 )
-                cursor.executemany(query, params_seq=insertion_list)
-            connection.commit()
-        os.system("mkdir datasets/parsed")
-        os.system(f"mv datasets/'{file}' datasets/parsed")
-    refresh_view()  # every insertion we refresh view
-    insert_data.need_report_json = True  # type: ignore[attr-defined]
-    insert_data.need_report_xml = True  # type: ignore[attr-defined]
-    server_disconnect(connection)
+                if entry.done:
+                    logging.info(
+                        "[MANIFEST] %s was already loaded from %s. Skip",
+                        file,
+                        entry.file_name,
+                    )
+                    metrics.count("files_skipped")
+                    manifest.archive(file)
+                else:
+                    pending[file] = (content_hash, entry)
+                    loading[content_hash] = file
+
+    key_filter = None
+    if key_index and pending:
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                key_filter = KeyFilter(cursor, name, column_parameters)
+
+    rejects: Counter[str] = Counter()
+    if workers > 1 and pending:
+        from scripts.parallel import parallel_insert
+
+        rejects = parallel_insert(
+            name,
+            ["datasets/" + file for file in pending],
+            column_parameters,
+            workers,
+            batch_size,
+            method,
+            key_filter,
+        )
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                for content_hash, _ in pending.values():
+                    manifest.finish_file(cursor, content_hash)
+        for file in pending:
+            manifest.archive(file)
+    elif pending and pipeline:
+        from scripts.pipeline import pipelined_insert
+
+        rejects = pipelined_insert(
+            name, pending, column_parameters, batch_size, method, key_filter
+        )
+    elif pending:
+        normaliser = RowNormaliser(column_parameters)
+        with pooled_connection() as connection:
+            for file, (content_hash, entry) in pending.items():
+                if entry.byte_offset:
+                    logging.info(
+                        "[MANIFEST] Resuming %s after %s items", file, entry.items_done
+                    )
+                reader = JsonArrayReader("datasets/" + file, start=entry.byte_offset)
+                dead_letter = DeadLetter(file, resume=bool(entry.byte_offset))
+                with connection.cursor() as cursor:
+                    for batch in batched(reader.with_offsets(), batch_size):
+                        offsets, items = zip(*batch)
+                        insertion_list, rejected = normaliser.normalise_batch(
+                            list(items)
+                        )
+                        metrics.count("rows_parsed", len(batch))
+                        metrics.count("rows_rejected", len(rejected))
+                        if key_filter is not None:
+                            insertion_list, rejected = key_filter.filter(
+                                insertion_list, rejected, len(batch)
+                            )
+                        dead_letter.add(items, offsets, rejected)
+                        if not insertion_list:
+                            pass  # only the checkpoint is left to commit
+                        elif method == "copy":
+                            copy_rows(cursor, name, column_parameters, insertion_list)
+                        else:
+                            insert_rows(
+                                cursor, name, list(normaliser.columns), insertion_list
+                            )
+                        # the checkpoint commits together with the batch
+                        manifest.checkpoint(
+                            cursor, content_hash, len(batch), reader.position
+                        )
+                        connection.commit()
+                    manifest.finish_file(cursor, content_hash)
+                connection.commit()
+                manifest.archive(file)
+                rejects.update(dead_letter.summary())
+    # archived once their content is, a failed load leaves them for a retry
+    for file in duplicates:
+        manifest.archive(file)
+    if key_filter is not None and key_filter.skipped:
+        logging.info(
+            "[KEYINDEX] %s: %s rows skipped before sending, primary key already loaded",
+            name,
+            key_filter.skipped,
+        )
+    sync_room_stats()  # every insertion we update room statistics
+    return rejects
 
 
 class Normalisation:
@@ -386,6 +813,7 @@ class Normalisation:
     def __str__(self) -> str:  # for debag if needed
         return str(self._col_name) + str(self._data_type) + str(self._is_nullable)
 
+    @profiled
     def normalise_value(self, value):
         if value is None and not self._is_nullable:
             raise ValueError
@@ -397,3 +825,108 @@ class Normalisation:
             return self._data_type(value)
         except (ValueError, TypeError) as _err:
             raise _err
+
+
+class RowNormaliser:
+    """
+    Converts raw dataset rows of one table into typed tuples.
+
+    Built once from the `information_schema` column metadata: the column
+    converters of `Normalisation` are resolved up front, so a row is turned
+    into a tuple in a single pass without per-value type dispatch. Accepts
+    and rejects exactly the same values as `Normalisation.normalise_value`.
+
+    Raises
+    ------
+    TypeError
+        If a column SQL type is unsupported.
+    """
+
+    def __init__(self, column_parameters: list[tuple[str, str, str]]) -> None:
+        self._column_parameters = [tuple(parameter) for parameter in column_parameters]
+        self.columns = tuple(parameter[0] for parameter in self._column_parameters)
+        self._converters = tuple(
+            self._converter(Normalisation(parameter))  # type:ignore
+            for parameter in self._column_parameters
+        )
+        if len(self.columns) == 1:
+            column = self.columns[0]
+            self._values = lambda row: (row[column],)
+        else:
+            self._values = itemgetter(*self.columns)
+
+    def __reduce__(self):  # converters are closures, rebuild from metadata
+        return (RowNormaliser, (self._column_parameters,))
+
+    @staticmethod
+    def _converter(normalisation: "Normalisation") -> Callable:
+        convert = normalisation._data_type
+        if normalisation._is_nullable:
+            return convert
+
+        def not_null(value):
+            if value is None:
+                raise ValueError("Null value in not nullable column")
+            return convert(value)
+
+        return not_null
+
+    def normalise_row(self, row: dict) -> tuple:
+        """
+        Converts one raw row into a tuple in `columns` order.
+
+        Raises
+        ------
+        ValueError, TypeError
+            If a value cannot be converted for its column.
+        KeyError
+            If a column is missing from the row.
+        """
+        return tuple(map(call, self._converters, self._values(row)))
+
+    @profiled
+    def normalise_batch(
+        self, rows: list[dict]
+    ) -> tuple[list[tuple], list[tuple[int, str, Exception]]]:
+        """
+        Converts a batch of raw rows column by column.
+
+        Returns
+        -------
+        tuple[list[tuple], list[tuple[int, str, Exception]]]
+            Converted rows that passed every column, in input order, and
+            (row index, first failing column, error) for rejected rows.
+
+        Raises
+        ------
+        KeyError
+            If a column is missing from a row.
+        """
+        if not rows:
+            return [], []
+        rejected: dict[int, tuple[str, Exception]] = {}
+        columns = []
+        for name, convert, values in zip(
+            self.columns, self._converters, zip(*map(self._values, rows))
+        ):
+            try:
+                columns.append(list(map(convert, values)))
+                continue
+            except (ValueError, TypeError):
+                pass
+            column = []
+            for index, value in enumerate(values):
+                try:
+                    column.append(convert(value))
+                except (ValueError, TypeError) as _err:
+                    column.append(None)
+                    if index not in rejected:
+                        rejected[index] = (name, _err)
+            columns.append(column)
+        converted = list(zip(*columns))
+        if not rejected:
+            return converted, []
+        return (
+            [row for index, row in enumerate(converted) if index not in rejected],
+            [(index, *rejected[index]) for index in sorted(rejected)],
+        )
@@ -0,0 +1,226 @@
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+
+from scripts import metrics
+from scripts.logger import logger
+
+load_dotenv()
+
+# seconds between two scans of `datasets`
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", 1))
+
+# target seconds from a file landing in `datasets` to its reports being
+# written, files arriving within that window are loaded together
+WATCH_FRESHNESS = float(os.getenv("WATCH_FRESHNESS", 30))
+
+# seconds before a file that failed to load is tried again (unless changed)
+WATCH_RETRY = float(os.getenv("WATCH_RETRY", 300))
+
+# reports refreshed after every micro-batch (see `refresh_reports`)
+WATCH_REPORTS = os.getenv("WATCH_REPORTS", "json,xml")
+
+# tables loaded from `datasets`, in dependency order
+WATCH_TABLES = ("rooms", "students")
+
+
+class _Arrival(NamedTuple):
+    first_seen: float  # monotonic time the file was first listed
+    signature: tuple[int, int]  # size and mtime, a change means still written
+    stable: bool  # same signature on two scans in a row
+
+
+def table_of(file: str) -> str | None:
+    """Returns the table of WATCH_TABLES a dataset file name belongs to."""
+    if not file.endswith(".json"):
+        return None
+    return next((table for table in WATCH_TABLES if file.startswith(table)), None)
+
+
+class MicroBatcher:
+    """
+    Coalesces the dataset files landing in `directory` into micro-batches.
+
+    `poll` scans the directory; a file is ready once its size and mtime
+    did not change between two scans, so files still being copied are
+    left alone. `due` returns the ready files once the oldest of them has
+    waited `window` seconds, which gathers the files of a burst into one
+    load. Files that failed are held back for WATCH_RETRY seconds, or
+    until they change.
+    """
+
+    def __init__(self, directory: str = "datasets") -> None:
+        self.directory = directory
+        self.pending: dict[str, _Arrival] = {}
+        self._failed: dict[str, tuple[tuple[int, int], float]] = {}
+
+    def poll(self, now: float) -> None:
+        listed = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and table_of(entry.name):
+                    stat = entry.stat()
+                    listed[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        for file, signature in listed.items():
+            arrival = self.pending.get(file)
+            if arrival is None:
+                self.pending[file] = _Arrival(now, signature, False)
+            else:
+                stable = arrival.signature == signature
+                self.pending[file] = arrival._replace(
+                    signature=signature, stable=stable
+                )
+        # loaded files are moved to `parsed`
+        for file in self.pending.keys() - listed.keys():
+            del self.pending[file]
+            self._failed.pop(file, None)
+
+    def _ready(self, file: str, arrival: _Arrival, now: float) -> bool:
+        if not arrival.stable:
+            return False
+        failed = self._failed.get(file)
+        return failed is None or failed[0] != arrival.signature or failed[1] <= now
+
+    def due(self, now: float, window: float) -> list[str]:
+        ready = {
+            file: arrival
+            for file, arrival in self.pending.items()
+            if self._ready(file, arrival, now)
+        }
+        if not ready or now - min(a.first_seen for a in ready.values()) < window:
+            return []
+        return sorted(ready)
+
+    def loaded(self, files: list[str], now: float) -> list[str]:
+        """
+        Holds back the `files` of a load that are still in the directory
+        (a loaded file is moved to `parsed`) and returns them.
+        """
+        failed = [
+            file
+            for file in files
+            if file in self.pending
+            and os.path.exists(os.path.join(self.directory, file))
+        ]
+        for file in failed:
+            self._failed[file] = (self.pending[file].signature, now + WATCH_RETRY)
+        return failed
+
+
+def refresh_reports(reports: str = WATCH_REPORTS) -> None:
+    """
+    Writes the reports of the comma separated formats `reports`: json, xml
+    and the other registered encoders from one run of every query
+    (`report_to_formats`), csv and ndjson by `COPY`. Reports whose input
+    tables did not change are skipped by the report cache, so only the
+    ones a micro-batch touched are written again.
+    """
+    from scripts.report import (
+        ENCODERS,
+        report_to_csv,
+        report_to_formats,
+        report_to_ndjson,
+    )
+
+    formats = [report.strip() for report in reports.split(",") if report.strip()]
+    encoded = [report for report in formats if report in ENCODERS]
+    if encoded:
+        report_to_formats(encoded)
+    copied = {"csv": report_to_csv, "ndjson": report_to_ndjson}
+    for report in formats:
+        if report in copied:
+            copied[report]()
+
+
+@logger
+def ingest_batch(files: list[str], landed: float, reports: str = WATCH_REPORTS) -> None:
+    """
+    Loads one micro-batch of dataset files table by table in WATCH_TABLES
+    order (rooms before the students referencing them), then refreshes
+    the reports.
+
+    A table whose load fails is logged and the following ones are still
+    loaded; its files stay in `datasets`. `landed` is the
+    `time.monotonic` the oldest file of the batch was seen at, the
+    seconds from then to the reports being written are counted as
+    `lag_seconds`.
+
+    Raises
+    ------
+    ConnectionError
+        If the reports cannot be written.
+    """
+    from scripts.setup_db import insert_data
+
+    for table in WATCH_TABLES:
+        table_files = [file for file in files if table_of(file) == table]
+        if not table_files:
+            continue
+        try:
+            insert_data(table, files=table_files)
+        except Exception as _ex:
+            logging.error("[WATCH] Loading %s failed: %s", ", ".join(table_files), _ex)
+    refresh_reports(reports)
+    metrics.count("files", len(files))
+    metrics.count("lag_seconds", time.monotonic() - landed)
+
+
+def watch(
+    stop: threading.Event | None = None,
+    freshness: float = WATCH_FRESHNESS,
+    interval: float = WATCH_INTERVAL,
+    reports: str = WATCH_REPORTS,
+) -> None:
+    """
+    Loads the dataset files landing in `datasets` until `stop` is set.
+
+    The directory is scanned every `interval` seconds (polling, no
+    platform specific notifications) and arriving `rooms*`/`students*`
+    files are coalesced into micro-batches by `MicroBatcher`. A batch is
+    loaded by `ingest_batch` once its oldest file has waited the part of
+    `freshness` the previous load did not take, so a file is in the
+    reports about `freshness` seconds after it landed while a burst of
+    files costs one load and one report refresh. A batch that ends later
+    than `freshness` after its first file is logged as a warning.
+
+    Raises
+    ------
+    FileNotFoundError
+        If `datasets` does not exist.
+    """
+    stop = stop or threading.Event()
+    batcher = MicroBatcher()
+    last_cycle = 0.0
+    logging.info(
+        "[WATCH] Watching datasets every %ss, freshness %ss", interval, freshness
+    )
+    while not stop.is_set():
+        now = time.monotonic()
+        batcher.poll(now)
+        # a file is seen ready one scan after it landed, and due on a scan
+        window = max(0.0, freshness - last_cycle - 2 * interval)
+        files = batcher.due(now, window)
+        if files:
+            landed = min(batcher.pending[file].first_seen for file in files)
+            try:
+                ingest_batch(files, landed, reports)
+            except Exception as _ex:
+                # the files still in datasets are held back and tried again
+                logging.error("[WATCH] Micro-batch failed: %s", _ex)
+            lag = time.monotonic() - landed
+            failed = batcher.loaded(files, time.monotonic())
+            last_cycle = time.monotonic() - now
+            log = logging.warning if lag > freshness else logging.info
+            log(
+                "[WATCH] %s of %s files loaded in %.3fs, %.3fs after the first landed",
+                len(files) - len(failed),
+                len(files),
+                last_cycle,
+                lag,
+            )
+            continue
+        stop.wait(interval)
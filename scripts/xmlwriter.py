@@ -0,0 +1,120 @@
+from functools import lru_cache
+from numbers import Number
+from typing import IO, Any, Iterable
+
+XML_DECLARATION = '<?xml version="1.0" ?>'
+ITEM_NAME = "row"
+
+
+def _escape(text: str) -> str:
+    # what minidom writes for text read back by expat (line ends normalised)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+@lru_cache(maxsize=4096)
+def element_name(key: str) -> tuple[str, str]:
+    """
+    Returns the tag and the attribute string `dicttoxml` gives a dict key:
+    the key itself when it is a valid XML name, `n<key>` for numbers, `_`
+    for spaces and `<key name="...">` otherwise.
+    """
+    from dicttoxml import make_valid_xml_name
+
+    tag, attributes = make_valid_xml_name(key, {})
+    if not attributes:
+        return tag, ""
+    # the attribute value as expat normalises it
+    value = key.replace("\r\n", " ").translate({ord("\r"): " ", ord("\n"): " "})
+    return tag, ' name="{}"'.format(_escape(value.replace("\t", " ")))
+
+
+def _text(value: Any, listed: bool) -> str:
+    # dicttoxml lowercases booleans of dicts but not of lists
+    if isinstance(value, bool) and not listed:
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return _escape(value)
+    if isinstance(value, Number):
+        return str(value)
+    if hasattr(value, "isoformat"):
+        return _escape(value.isoformat())
+    raise TypeError(f"Unsupported data type: {value} ({type(value).__name__})")
+
+
+def _write_element(
+    parts: list[str],
+    tag: str,
+    attributes: str,
+    value: Any,
+    listed: bool,
+    pad: str,
+    indent: str,
+) -> None:
+    newline = "\n" if indent else ""
+    if isinstance(value, dict):
+        children = [(*element_name(key), child, False) for key, child in value.items()]
+    elif isinstance(value, (list, tuple)):
+        children = [(ITEM_NAME, "", child, True) for child in value]
+    else:
+        text = "" if value is None else _text(value, listed)
+        if text:
+            parts.append(f"{pad}<{tag}{attributes}>{text}</{tag}>{newline}")
+        else:
+            parts.append(f"{pad}<{tag}{attributes}/>{newline}")
+        return
+    if not children:
+        parts.append(f"{pad}<{tag}{attributes}/>{newline}")
+        return
+    parts.append(f"{pad}<{tag}{attributes}>{newline}")
+    for child in children:
+        _write_element(parts, *child, pad + indent, indent)
+    parts.append(f"{pad}</{tag}>{newline}")
+
+
+def write_xml_rows(
+    w_file: IO[str],
+    root: str,
+    rows: Iterable[Any] | None,
+    indent: str | None = "   ",
+) -> None:
+    """
+    Writes `rows` as an XML document one row at a time.
+
+    The document is the one `report_to_xml` used to build with
+    `dicttoxml(rows, custom_root=root, item_func=lambda _: "row",
+    attr_type=False)` and `minidom.toprettyxml(indent="   ")`: a `root`
+    element with one `row` element per row, dict keys as child elements
+    (renamed like `dicttoxml` does when they are not valid XML names),
+    lists as nested `row` elements, booleans as true/false (True/False
+    inside lists), empty values as self-closing elements and no type
+    attributes. With the default
+    `indent` the output is identical, byte for byte; `indent=None` writes
+    the same elements without indentation or line breaks.
+
+    No rows (or None) give a single empty `row`, as `dicttoxml` does for
+    `json_agg` over an empty result (null).
+
+    Raises
+    ------
+    TypeError
+        If a value is not a JSON type, a number or a date.
+    """
+    indent = indent or ""
+    newline = "\n" if indent else ""
+    w_file.write(f"{XML_DECLARATION}\n<{root}>{newline}")
+    empty = True
+    for row in rows or ():
+        parts: list[str] = []
+        _write_element(parts, ITEM_NAME, "", row, True, indent, indent)
+        w_file.write("".join(parts))
+        empty = False
+    if empty:
+        w_file.write(f"{indent}<{ITEM_NAME}/>{newline}")
+    w_file.write(f"</{root}>\n")
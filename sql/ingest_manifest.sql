@@ -0,0 +1,13 @@
+-- one row per distinct dataset file content, whatever its file name
+CREATE TABLE IF NOT EXISTS ingest_manifest
+(
+	content_hash TEXT PRIMARY KEY, -- sha256 of the file bytes
+	table_name TEXT NOT NULL,
+	file_name TEXT NOT NULL, -- name the content was first loaded from
+	file_size BIGINT NOT NULL,
+	items_done BIGINT NOT NULL DEFAULT 0, -- array items committed so far
+	byte_offset BIGINT NOT NULL DEFAULT 0, -- file offset right after them
+	done BOOLEAN NOT NULL DEFAULT FALSE,
+	started_at TIMESTAMP NOT NULL DEFAULT now(),
+	updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
\ No newline at end of file
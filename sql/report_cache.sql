@@ -0,0 +1,70 @@
+-- one row per table per committed transaction that changed it:
+-- appends never block each other and only show up once committed
+CREATE TABLE IF NOT EXISTS table_changes
+(
+	table_name TEXT NOT NULL,
+	txid BIGINT NOT NULL DEFAULT txid_current(),
+	PRIMARY KEY (table_name, txid)
+);
+
+CREATE OR REPLACE VIEW table_versions AS
+(
+	SELECT table_name, COUNT(*) AS version
+	FROM table_changes
+	GROUP BY table_name
+);
+
+CREATE TABLE IF NOT EXISTS report_cache
+(
+	report TEXT NOT NULL,
+	format TEXT NOT NULL,
+	query_hash TEXT NOT NULL,
+	versions JSONB NOT NULL, -- table_versions of the tables the query reads
+	path TEXT NOT NULL,
+	created_at TIMESTAMP NOT NULL DEFAULT now(),
+	PRIMARY KEY (report, format)
+);
+
+CREATE OR REPLACE FUNCTION table_changed()
+RETURNS TRIGGER
+LANGUAGE PLPGSQL
+AS $$
+BEGIN
+	IF TG_OP<>'TRUNCATE' THEN
+		-- statement triggers also fire when no row was touched
+		IF NOT EXISTS (SELECT 1 FROM changed_rows) THEN
+			RETURN NULL;
+		END IF;
+	END IF;
+	INSERT INTO table_changes (table_name) VALUES (TG_TABLE_NAME)
+	ON CONFLICT DO NOTHING;
+	RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION track_table_changes(name TEXT)
+RETURNS VOID
+LANGUAGE PLPGSQL
+AS $$
+BEGIN
+	EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', name || '_inserted', name);
+	EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I
+		REFERENCING NEW TABLE AS changed_rows
+		FOR EACH STATEMENT EXECUTE FUNCTION table_changed()', name || '_inserted', name);
+	EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', name || '_updated', name);
+	EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I
+		REFERENCING NEW TABLE AS changed_rows
+		FOR EACH STATEMENT EXECUTE FUNCTION table_changed()', name || '_updated', name);
+	EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', name || '_deleted', name);
+	EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I
+		REFERENCING OLD TABLE AS changed_rows
+		FOR EACH STATEMENT EXECUTE FUNCTION table_changed()', name || '_deleted', name);
+	EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', name || '_truncated', name);
+	EXECUTE format('CREATE TRIGGER %I AFTER TRUNCATE ON %I
+		FOR EACH STATEMENT EXECUTE FUNCTION table_changed()', name || '_truncated', name);
+END
+$$;
+
+SELECT track_table_changes('rooms');
+SELECT track_table_changes('students');
+SELECT track_table_changes('room_stats');
\ No newline at end of file
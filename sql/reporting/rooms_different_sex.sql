@@ -1,17 +1,5 @@
-SELECT * FROM
-(
-    SELECT r.name,s.room,
-    COUNT(
-        CASE WHEN sex='M' THEN 1
-        END
-    ) AS male_count,
-    COUNT(
-        CASE WHEN sex='F' THEN 1
-        END
-    ) AS female_count
-    FROM rooms r
-    JOIN students s
-    ON r.id=s.room
-    GROUP BY r.name,s.room
-)
-WHERE male_count>0 AND female_count>0
\ No newline at end of file
+SELECT r.name,rs.room,rs.male_count,rs.female_count
+FROM rooms r
+JOIN room_stats rs
+ON r.id=rs.room
+WHERE rs.male_count>0 AND rs.female_count>0
\ No newline at end of file
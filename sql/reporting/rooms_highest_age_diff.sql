@@ -1,6 +1,6 @@
-SELECT r.*,(MAX(a.age)-MIN(a.age)) AS age_difference
+SELECT r.*,(rs.age_max-rs.age_min) AS age_difference
 FROM rooms r
-JOIN ages a ON r.id=a.room
-GROUP BY r.id,r.name
+JOIN room_stats rs ON r.id=rs.room
+WHERE rs.student_count>0
 ORDER BY age_difference DESC
 LIMIT 5
\ No newline at end of file
@@ -1,7 +1,7 @@
-        SELECT r.id,r.name,AVG(a.age) AS average_age
-        FROM ages a
+        SELECT r.id,r.name,rs.age_sum::NUMERIC/NULLIF(rs.aged_count,0) AS average_age
+        FROM room_stats rs
         JOIN rooms r
-        ON a.room=r.id
-        GROUP BY r.id,r.name
+        ON rs.room=r.id
+        WHERE rs.student_count>0
         ORDER BY average_age
         LIMIT 5
\ No newline at end of file
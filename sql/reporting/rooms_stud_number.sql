@@ -1,5 +1,5 @@
-SELECT r.*,COUNT(*)
+SELECT r.*,rs.student_count AS count
 FROM rooms r
-JOIN students s ON r.id=s.room
-GROUP BY r.id,r.name
+JOIN room_stats rs ON r.id=rs.room
+WHERE rs.student_count>0
 ORDER BY count DESC
\ No newline at end of file
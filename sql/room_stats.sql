@@ -0,0 +1,199 @@
+-- derived from students: dropped, created again and rebuilt at the end
+-- whenever the script is applied
+DROP TABLE IF EXISTS room_stats;
+CREATE TABLE room_stats
+(
+	room INT PRIMARY KEY,
+	student_count INT NOT NULL DEFAULT 0,
+	aged_count INT NOT NULL DEFAULT 0, -- students with a known birthday
+	age_sum BIGINT NOT NULL DEFAULT 0,
+	age_min INT,
+	age_max INT,
+	male_count INT NOT NULL DEFAULT 0,
+	female_count INT NOT NULL DEFAULT 0,
+	as_of DATE NOT NULL DEFAULT CURRENT_DATE -- ages are computed on this day
+);
+
+-- append-only log of per-statement deltas, folded into room_stats by room_stats_sync
+DROP TABLE IF EXISTS room_stats_delta;
+CREATE TABLE room_stats_delta
+(
+	room INT NOT NULL,
+	student_count INT NOT NULL,
+	aged_count INT NOT NULL,
+	age_sum BIGINT NOT NULL,
+	age_min INT,
+	age_max INT,
+	male_count INT NOT NULL,
+	female_count INT NOT NULL,
+	as_of DATE NOT NULL DEFAULT CURRENT_DATE,
+	removed BOOLEAN NOT NULL DEFAULT FALSE -- students left: min/max to recompute
+);
+
+-- deltas of the rows a statement on students inserted (new_students) and
+-- updated or deleted (old_students, counted negative)
+CREATE OR REPLACE FUNCTION room_stats_change()
+RETURNS TRIGGER
+LANGUAGE PLPGSQL
+AS $$
+BEGIN
+	IF TG_OP IN ('UPDATE', 'DELETE') THEN
+		INSERT INTO room_stats_delta
+		SELECT room, -COUNT(*), -COUNT(age), -COALESCE(SUM(age), 0), NULL, NULL,
+			-COUNT(*) FILTER (WHERE sex='M'), -COUNT(*) FILTER (WHERE sex='F'),
+			CURRENT_DATE, TRUE
+		FROM (
+			SELECT room, sex, (CURRENT_DATE-birthday)/365 AS age
+			FROM old_students
+		) s
+		GROUP BY room;
+	END IF;
+	IF TG_OP IN ('INSERT', 'UPDATE') THEN
+		INSERT INTO room_stats_delta
+		SELECT room, COUNT(*), COUNT(age), COALESCE(SUM(age), 0), MIN(age), MAX(age),
+			COUNT(*) FILTER (WHERE sex='M'), COUNT(*) FILTER (WHERE sex='F'),
+			CURRENT_DATE, FALSE
+		FROM (
+			SELECT room, sex, (CURRENT_DATE-birthday)/365 AS age
+			FROM new_students
+		) s
+		GROUP BY room;
+	END IF;
+	RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS room_stats_add ON students;
+DROP FUNCTION IF EXISTS room_stats_add();
+CREATE TRIGGER room_stats_add
+	AFTER INSERT ON students
+	REFERENCING NEW TABLE AS new_students
+	FOR EACH STATEMENT
+	EXECUTE FUNCTION room_stats_change();
+
+DROP TRIGGER IF EXISTS room_stats_update ON students;
+CREATE TRIGGER room_stats_update
+	AFTER UPDATE ON students
+	REFERENCING OLD TABLE AS old_students NEW TABLE AS new_students
+	FOR EACH STATEMENT
+	EXECUTE FUNCTION room_stats_change();
+
+DROP TRIGGER IF EXISTS room_stats_remove ON students;
+CREATE TRIGGER room_stats_remove
+	AFTER DELETE ON students
+	REFERENCING OLD TABLE AS old_students
+	FOR EACH STATEMENT
+	EXECUTE FUNCTION room_stats_change();
+
+CREATE OR REPLACE FUNCTION room_stats_clear()
+RETURNS TRIGGER
+LANGUAGE PLPGSQL
+AS $$
+BEGIN
+	DELETE FROM room_stats_delta;
+	DELETE FROM room_stats;
+	RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS room_stats_clear ON students;
+CREATE TRIGGER room_stats_clear
+	AFTER TRUNCATE ON students
+	FOR EACH STATEMENT
+	EXECUTE FUNCTION room_stats_clear();
+
+-- recomputes room_stats from students, dropping the pending deltas
+CREATE OR REPLACE FUNCTION room_stats_rebuild()
+RETURNS VOID
+LANGUAGE PLPGSQL
+AS $$
+BEGIN
+	-- one statement, so the deltas dropped are exactly the ones it counts
+	WITH dropped AS (
+		DELETE FROM room_stats_delta
+	)
+	INSERT INTO room_stats AS rs
+	SELECT room, COUNT(*), COUNT(age), COALESCE(SUM(age), 0), MIN(age), MAX(age),
+		COUNT(*) FILTER (WHERE sex='M'), COUNT(*) FILTER (WHERE sex='F'),
+		CURRENT_DATE
+	FROM (
+		SELECT room, sex, (CURRENT_DATE-birthday)/365 AS age
+		FROM students
+	) s
+	GROUP BY room
+	ON CONFLICT (room) DO UPDATE
+	SET student_count=EXCLUDED.student_count,
+		aged_count=EXCLUDED.aged_count,
+		age_sum=EXCLUDED.age_sum,
+		age_min=EXCLUDED.age_min,
+		age_max=EXCLUDED.age_max,
+		male_count=EXCLUDED.male_count,
+		female_count=EXCLUDED.female_count,
+		as_of=EXCLUDED.as_of;
+	DELETE FROM room_stats rs
+	WHERE NOT EXISTS (SELECT 1 FROM students s WHERE s.room=rs.room);
+END
+$$;
+
+CREATE OR REPLACE FUNCTION room_stats_sync()
+RETURNS VOID
+LANGUAGE PLPGSQL
+AS $$
+DECLARE
+	dirty INT[];
+BEGIN
+	IF EXISTS (SELECT 1 FROM room_stats WHERE as_of<CURRENT_DATE)
+		OR EXISTS (SELECT 1 FROM room_stats_delta WHERE as_of<CURRENT_DATE)
+		OR (NOT EXISTS (SELECT 1 FROM room_stats) AND EXISTS (SELECT 1 FROM students))
+	THEN
+		-- ages moved on since the stats were computed, or they were never
+		-- computed for the students there are: rebuild from students
+		PERFORM room_stats_rebuild();
+		RETURN;
+	END IF;
+	WITH folded AS (
+		DELETE FROM room_stats_delta RETURNING *
+	), merged AS (
+		INSERT INTO room_stats AS rs
+		SELECT room, SUM(student_count), SUM(aged_count), SUM(age_sum),
+			MIN(age_min), MAX(age_max), SUM(male_count), SUM(female_count),
+			CURRENT_DATE
+		FROM folded
+		GROUP BY room
+		ON CONFLICT (room) DO UPDATE
+		SET student_count=rs.student_count+EXCLUDED.student_count,
+			aged_count=rs.aged_count+EXCLUDED.aged_count,
+			age_sum=rs.age_sum+EXCLUDED.age_sum,
+			age_min=LEAST(rs.age_min, EXCLUDED.age_min),
+			age_max=GREATEST(rs.age_max, EXCLUDED.age_max),
+			male_count=rs.male_count+EXCLUDED.male_count,
+			female_count=rs.female_count+EXCLUDED.female_count
+	)
+	SELECT array_agg(DISTINCT room) INTO dirty FROM folded WHERE removed;
+	IF dirty IS NOT NULL THEN
+		-- students left these rooms: min/max cannot be folded, read them
+		-- back (taking rows inserted since twice into account is harmless)
+		UPDATE room_stats rs
+		SET age_min=a.age_min, age_max=a.age_max
+		FROM (
+			SELECT d.room, MIN((CURRENT_DATE-s.birthday)/365) AS age_min,
+				MAX((CURRENT_DATE-s.birthday)/365) AS age_max
+			FROM unnest(dirty) AS d(room)
+			LEFT JOIN students s ON s.room=d.room
+			GROUP BY d.room
+		) a
+		WHERE rs.room=a.room;
+	END IF;
+END
+$$;
+
+-- the table was created again: track its changes for the report cache
+-- (once report_cache.sql installed the tracking) and fill it
+DO $$
+BEGIN
+	IF to_regprocedure('track_table_changes(text)') IS NOT NULL THEN
+		PERFORM track_table_changes('room_stats');
+	END IF;
+END
+$$;
+SELECT room_stats_rebuild();
@@ -1,12 +1,10 @@
-DROP TABLE IF EXISTS rooms CASCADE;
-CREATE TABLE rooms
+CREATE TABLE IF NOT EXISTS rooms
 (
 	id INT PRIMARY KEY,
 	name TEXT NOT NULL
 );
 
-DROP TABLE IF EXISTS students ;
-CREATE TABLE students
+CREATE TABLE IF NOT EXISTS students
 (
 	id INT PRIMARY KEY,
 	birthday DATE,
@@ -0,0 +1,69 @@
+from scripts import advisor
+from scripts.advisor import Candidate, explain, measure, plan_findings
+from scripts.connection import pooled_connection
+from scripts.setup_db import migrate
+import logging
+import pytest
+
+
+def test_plan_findings() -> None:
+    logging.info("[TEST] test_plan_findings started")
+    plan = {
+        "Plan": {
+            "Node Type": "Sort",
+            "Sort Key": ["s.room"],
+            "Sort Space Type": "Disk",
+            "Sort Space Used": 2048,
+            "Plans": [
+                {
+                    "Node Type": "Seq Scan",
+                    "Relation Name": "students",
+                    "Actual Rows": 6000,
+                    "Rows Removed by Filter": 5000,
+                    "Actual Loops": 1,
+                },
+                {
+                    "Node Type": "Seq Scan",
+                    "Relation Name": "rooms",
+                    "Actual Rows": 1000,
+                    "Actual Loops": 1,
+                },
+            ],
+        }
+    }
+    assert plan_findings(plan) == [
+        "Sort on s.room spills 2048 kB to disk",
+        "Seq Scan on students reads 11000 rows",
+    ]
+    assert (
+        Candidate("students", ("room", "sex")).ddl()
+        == "CREATE INDEX ON students (room, sex)"
+    )
+    logging.info("[TEST] test_plan_findings finished")
+
+
+def test_measure_keeps_the_table_indexes(monkeypatch) -> None:
+    logging.info("[TEST] test_measure_keeps_the_table_indexes started")
+    migrate()
+    plans = []
+
+    def explain_and_keep(cursor, query):
+        plans.append(explain(cursor, query))
+        return plans[-1]
+
+    monkeypatch.setattr(advisor, "explain", explain_and_keep)
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM students")
+            if cursor.fetchone()[0] < 1000:  # type:ignore
+                pytest.skip("the planner scans small tables")
+            result = measure(
+                cursor,
+                "SELECT name FROM students WHERE id=42",
+                Candidate("students", ("name",)),
+            )
+    # the copy has the primary key: the "before" plan is an index scan too
+    before = plans[0]["Plan"]
+    assert "Index" in before["Node Type"]
+    assert not result["index_used"]
+    logging.info("[TEST] test_measure_keeps_the_table_indexes finished")
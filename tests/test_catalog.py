@@ -0,0 +1,23 @@
+from scripts import catalog
+import logging
+import os
+
+
+def test_script_cache_follows_file_changes(tmp_path) -> None:
+    logging.info("[TEST] test_script_cache_follows_file_changes started")
+    path = tmp_path / "script.sql"
+    path.write_text("SELECT 1;\n\nSELECT 2;", encoding="UTF-8")
+    statements = catalog.script_statements(str(path))
+    assert statements == ("SELECT 1;", "SELECT 2;")
+    checksum = catalog.script_checksum(str(path))
+
+    # touched without changes: the parsed statements are reused
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert catalog.script_statements(str(path)) is statements
+
+    path.write_text("SELECT 3", encoding="UTF-8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+    assert catalog.script_statements(str(path)) == ("SELECT 3",)
+    assert catalog.script_checksum(str(path)) != checksum
+    logging.info("[TEST] test_script_cache_follows_file_changes finished")
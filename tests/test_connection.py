@@ -1,7 +1,17 @@
-from scripts.setup_db import server_connect, server_disconnect
-from psycopg import Connection
+from scripts import connection as routing
+from scripts.connection import (
+    close_pools,
+    connection_parameters,
+    get_pool,
+    pooled_connection,
+    read_connection,
+    server_connect,
+    server_disconnect,
+)
+from psycopg import Connection, errors
 import pytest
 import logging
+import time
 
 
 def test_connection_failure_on_invalid_db(monkeypatch) -> None:
@@ -37,3 +47,67 @@ def test_root_connection(monkeypatch) -> None:
             raise
     server_disconnect(connection)
     logging.info("[TEST] test_root_connection finished")
+
+
+def test_pooled_connection_reuses_session(monkeypatch) -> None:
+    logging.info("[TEST] test_pooled_connection_reuses_session started")
+    monkeypatch.setenv("HOST", "localhost")
+    close_pools()
+    get_pool(admin=True, admin_db=True).wait()
+    backend_pids = []
+    for _ in range(3):
+        with pooled_connection(admin=True, admin_db=True) as connection:
+            assert isinstance(connection, Connection)
+            backend_pids.append(connection.info.backend_pid)
+    assert len(set(backend_pids)) == 1
+    close_pools()
+    logging.info("[TEST] test_pooled_connection_reuses_session finished")
+
+
+def test_pooled_connection_failure_on_invalid_db(monkeypatch) -> None:
+    logging.info("[TEST] test_pooled_connection_failure_on_invalid_db started")
+    monkeypatch.setenv("DBNAME", "fake_db")
+    monkeypatch.setenv("DBUSER", "fake_user")
+    monkeypatch.setenv("HOST", "localhost")
+    close_pools()
+    with pytest.raises(ConnectionError):
+        with pooled_connection():
+            pass
+    logging.info("[TEST] test_pooled_connection_failure_on_invalid_db finished")
+
+
+def test_read_connection_round_robin_and_fallback(monkeypatch) -> None:
+    logging.info("[TEST] test_read_connection_round_robin_and_fallback started")
+    monkeypatch.setenv("HOST", "localhost")
+    assert connection_parameters(host="replica:5433")["port"] == "5433"
+    assert connection_parameters(host="replica")["host"] == "replica"
+    assert "connect_timeout" in connection_parameters(host="replica")
+    assert "connect_timeout" not in connection_parameters()
+    monkeypatch.setattr(routing, "READ_HOSTS", ["a", "b", "c"])
+    monkeypatch.setattr(routing, "_read_down", {})
+    turns = [routing._read_hosts()[0] for _ in range(4)]
+    assert turns[:3] in (["a", "b", "c"], ["b", "c", "a"], ["c", "a", "b"])
+    assert turns[3] == turns[0]
+    # a host that failed lately is left out until READ_HOST_RETRY is over
+    routing._read_down["b"] = time.monotonic() + 60
+    assert all("b" not in routing._read_hosts() for _ in range(3))
+    routing._read_down["b"] = time.monotonic() - 1
+    assert "b" in routing._read_hosts()
+    # nothing listens on port 1: the primary serves the read
+    monkeypatch.setattr(routing, "READ_HOSTS", ["localhost:1"])
+    close_pools()
+    with read_connection() as connection:
+        assert connection.info.port == 5432
+    assert "localhost:1" in routing._read_down
+    # any server error while checking the host falls back to the primary
+    monkeypatch.setattr(routing, "READ_HOSTS", ["localhost"])
+
+    def missing_view(connection, host):
+        raise errors.UndefinedTable('relation "table_versions" does not exist')
+
+    monkeypatch.setattr(routing, "_caught_up", missing_view)
+    with read_connection() as connection:
+        connection.execute("SELECT 1")
+    assert "localhost" in routing._read_down
+    close_pools()
+    logging.info("[TEST] test_read_connection_round_robin_and_fallback finished")
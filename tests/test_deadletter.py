@@ -0,0 +1,33 @@
+from scripts import deadletter
+from scripts.deadletter import DeadLetter
+import json
+import logging
+
+
+def test_dead_letter(tmp_path, monkeypatch) -> None:
+    logging.info("[TEST] test_dead_letter started")
+    monkeypatch.setattr(deadletter, "DEAD_LETTER_DIR", str(tmp_path / "rejected"))
+    rows = [{"id": 1}, {"id": "x"}, {"id": None}]
+    rejected = [
+        (1, "id", ValueError("invalid literal for int()")),
+        (2, "id", ValueError("Null value in not nullable column")),
+    ]
+    dead_letter = DeadLetter("rooms (1).json")
+    dead_letter.add(rows, [1, 20, 40], rejected)
+    dead_letter.add(rows, [60, 80, 100], rejected[1:])
+    with open(dead_letter.path, encoding="UTF-8") as file:
+        records = [json.loads(line) for line in file]
+    assert [(record["offset"], record["row"]) for record in records] == [
+        (20, {"id": "x"}),
+        (40, {"id": None}),
+        (100, {"id": None}),
+    ]
+    assert records[0]["reason"] == "ValueError: invalid literal for int()"
+    assert dead_letter.summary() == {"id": 3}
+    # a resumed load appends, a new one starts over
+    DeadLetter("rooms (1).json", resume=True).add(rows, [0, 1, 2], rejected)
+    with open(dead_letter.path, encoding="UTF-8") as file:
+        assert len(file.readlines()) == 5
+    DeadLetter("rooms (1).json")
+    assert not (tmp_path / "rejected" / "rooms (1).json.ndjson").exists()
+    logging.info("[TEST] test_dead_letter finished")
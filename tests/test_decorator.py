@@ -1,4 +1,5 @@
-from scripts.logger import logger
+from scripts.logger import RateLimitFilter, logger
+import logging
 import pytest
 from datetime import datetime
 
@@ -54,3 +55,20 @@ def test_logger_exception_catching() -> None:
                     break
                 if datetime.strptime(line[0:23], "%Y-%m-%d %H:%M:%S,%f") < start_time:
                     pytest.fail("No mention in loggger.log")
+
+
+def test_rate_limit_filter() -> None:
+    log_filter = RateLimitFilter(2)
+
+    def record(msg: str, *args, created: float = 1000.0) -> logging.LogRecord:
+        made = logging.LogRecord("root", logging.INFO, __file__, 0, msg, args, None)
+        made.created = created
+        return made
+
+    template = "[WARNING] Value passed in file in %s column was incorrect (%s rows)"
+    passed = [log_filter.filter(record(template, "room", n)) for n in range(5)]
+    assert passed == [True, True, False, False, False]
+    # other first argument, other window
+    assert log_filter.filter(record(template, "birthday", 1))
+    assert log_filter.filter(record(template, "room", 1, created=1001.0))
+    assert RateLimitFilter(0).filter(record(template, "room", 1))
@@ -0,0 +1,42 @@
+from benchmarks.bench_pipeline import compare
+from benchmarks.generate import generate, student_rows
+from scripts.reader import JsonArrayReader
+import logging
+
+
+def test_generate_is_deterministic(tmp_path) -> None:
+    logging.info("[TEST] test_generate_is_deterministic started")
+    first = generate(str(tmp_path / "a"), 500, rooms=20, seed=3, files=2)
+    second = generate(str(tmp_path / "b"), 500, rooms=20, seed=3, files=2)
+    for path_a, path_b in zip(first, second):
+        with open(path_a, "rb") as file_a, open(path_b, "rb") as file_b:
+            assert file_a.read() == file_b.read()
+    assert [len(list(JsonArrayReader(path))) for path in first] == [20, 250, 250]
+    logging.info("[TEST] test_generate_is_deterministic finished")
+
+
+def test_student_rows_ratios() -> None:
+    logging.info("[TEST] test_student_rows_ratios started")
+    rows = list(student_rows(10_000, 50, duplicate_ratio=0.1, invalid_ratio=0.05))
+    duplicates = len(rows) - len({row["id"] for row in rows})
+    invalid = sum(
+        row["birthday"] == "not a date"
+        or row["room"] is None
+        or row["id"] == "not a number"
+        or row["name"] is None
+        for row in rows
+    )
+    assert 900 < duplicates < 1100
+    assert 400 < invalid < 600
+    assert all(0 <= row["room"] < 50 for row in rows if row["room"] is not None)
+    logging.info("[TEST] test_student_rows_ratios finished")
+
+
+def test_compare_flags_regressions() -> None:
+    logging.info("[TEST] test_compare_flags_regressions started")
+    baseline = [{"scale": "10k", "stage": "ingest", "seconds": 1.0}]
+    assert compare([{"scale": "10k", "stage": "ingest", "seconds": 1.1}], baseline, 0.2)
+    assert not compare(
+        [{"scale": "10k", "stage": "ingest", "seconds": 1.5}], baseline, 0.2
+    )
+    logging.info("[TEST] test_compare_flags_regressions finished")
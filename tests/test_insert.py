@@ -0,0 +1,73 @@
+from scripts.connection import pooled_connection
+from scripts.setup_db import copy_rows, copy_statements, insert_rows, migrate
+from decimal import Decimal
+import logging
+
+# text that needs escaping in COPY text format, NULLs and a duplicate key
+ROWS = [
+    (1, "tab\there", None),
+    (2, "new\nline\r\n", Decimal("1.5")),
+    (3, "back\\slash \\N \\.", Decimal("-2")),
+    (4, "", None),
+    (5, "quotes ' \" , ; ünïcödé", Decimal("0.125")),
+    (1, "duplicate, the first row wins", Decimal("9")),
+    (6, None, Decimal("3")),
+]
+
+
+def test_copy_rows_matches_insert_rows() -> None:
+    logging.info("[TEST] test_copy_rows_matches_insert_rows started")
+    migrate()  # conflict_resolution used by insert_rows
+    # numeric is not in BINARY_COPY_TYPES: both COPY formats are covered
+    for amount_type, binary in (("double precision", True), ("numeric", False)):
+        column_parameters = [
+            ("id", "integer", "NO"),
+            ("note", "text", "YES"),
+            ("amount", amount_type, "YES"),
+        ]
+        assert (copy_statements("copied", column_parameters).types is None) != binary
+        rows = ROWS
+        if binary:
+            rows = [(key, note, amount and float(amount)) for key, note, amount in ROWS]
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                for table in ("copied", "inserted"):
+                    cursor.execute(
+                        f"""CREATE TEMP TABLE {table}
+                        (id INT PRIMARY KEY, note TEXT, amount {amount_type})"""
+                    )
+                copy_rows(cursor, "copied", column_parameters, rows)
+                insert_rows(cursor, "inserted", ["id", "note", "amount"], rows)
+                tables = []
+                for table in ("copied", "inserted"):
+                    cursor.execute(f"SELECT * FROM {table} ORDER BY id")
+                    tables.append(cursor.fetchall())
+                # drops the tables, staging ones included
+                connection.rollback()
+        # the first row of a duplicate key wins
+        expected = sorted({row[0]: row for row in reversed(rows)}.values())
+        assert tables[0] == tables[1] == expected
+    logging.info("[TEST] test_copy_rows_matches_insert_rows finished")
+
+
+def test_copy_rows_follows_table_changes() -> None:
+    logging.info("[TEST] test_copy_rows_follows_table_changes started")
+    columns = [("id", "integer", "NO"), ("note", "text", "YES")]
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TEMP TABLE changing (id INT PRIMARY KEY, note TEXT)")
+            try:
+                copy_rows(cursor, "changing", columns, [(1, "a")])
+                connection.commit()
+                # as a migration would, between two loads of the session
+                cursor.execute("ALTER TABLE changing ADD COLUMN amount INT")
+                connection.commit()
+                columns.append(("amount", "integer", "YES"))
+                copy_rows(cursor, "changing", columns, [(2, "b", 3)])
+                connection.commit()
+                cursor.execute("SELECT * FROM changing ORDER BY id")
+                assert cursor.fetchall() == [(1, "a", None), (2, "b", 3)]
+            finally:
+                connection.rollback()
+                cursor.execute("DROP TABLE changing")
+    logging.info("[TEST] test_copy_rows_follows_table_changes finished")
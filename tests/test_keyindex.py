@@ -0,0 +1,38 @@
+from scripts.keyindex import KeyFilter, KeyIndex
+import logging
+
+
+def test_key_index() -> None:
+    logging.info("[TEST] test_key_index started")
+    keys = [0, 7, 8, 65_535, 65_536, 2**31 - 1, -1, -65_537]
+    index = KeyIndex(keys)
+    assert all(key in index for key in keys)
+    assert not any(key in index for key in (1, 6, 9, 65_534, 2**31 - 2, -2))
+    assert len(index) == len(keys)
+    assert index.add(8) is False and index.add(9) is True
+    assert len(index) == len(keys) + 1
+    # one 8 KiB bitmap per 2**16 keys in use
+    assert index.nbytes == 5 * 8192
+    logging.info("[TEST] test_key_index finished")
+
+
+def test_key_filter() -> None:
+    logging.info("[TEST] test_key_filter started")
+    key_filter = KeyFilter.__new__(KeyFilter)
+    key_filter.primary = KeyIndex([1, 2])
+    key_filter.foreign = [(2, "room", "rooms", KeyIndex([10]))]
+    key_filter.skipped = 0
+    # items 0..5, item 1 rejected by the normaliser
+    rows = [(1, "a", 10), (3, "b", 10), (4, "c", 99), (3, "d", 10), (4, "e", 10)]
+    rejected = [(1, "id", ValueError("bad"))]
+    kept, rejected = key_filter.filter(rows, rejected, 6)
+    # known and repeated keys are dropped, the orphan is rejected and its
+    # key stays free for a later row
+    assert kept == [(3, "b", 10), (4, "e", 10)]
+    assert [(index, column) for index, column, _ in rejected] == [
+        (1, "id"),
+        (3, "room"),
+    ]
+    assert str(rejected[1][2]) == "99 not in rooms"
+    assert key_filter.skipped == 2
+    logging.info("[TEST] test_key_filter finished")
@@ -0,0 +1,48 @@
+from scripts import manifest
+from scripts.connection import pooled_connection
+from scripts.setup_db import insert_data, migrate
+import json
+import logging
+import os
+
+ROOMS = [
+    {"id": 900_101, "name": "Room #900101"},
+    {"id": 900_102, "name": "Room #900102"},
+]
+
+
+def test_same_content_in_one_call_is_loaded_once(tmp_path, monkeypatch) -> None:
+    logging.info("[TEST] test_same_content_in_one_call_is_loaded_once started")
+    migrate()
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("datasets")
+    files = ["rooms (91).json", "rooms (92).json"]
+    content_hash = ""
+    for pipeline in (False, True):
+        for file in files:
+            with open(os.path.join("datasets", file), "w", encoding="UTF-8") as w_file:
+                json.dump(ROOMS, w_file)
+        content_hash = manifest.file_hash(os.path.join("datasets", files[0]))
+        try:
+            insert_data("rooms", files=files, pipeline=pipeline)
+            with pooled_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        """SELECT file_name, items_done, done FROM ingest_manifest
+                        WHERE content_hash=%s""",
+                        (content_hash,),
+                    )
+                    assert cursor.fetchone() == (files[0], 2, True)
+            # the duplicate was skipped, and archived with the loaded file
+            assert sorted(os.listdir(manifest.PARSED_DIR)) == files
+            assert not os.path.exists(os.path.join("datasets", files[1]))
+        finally:
+            with pooled_connection() as connection:
+                connection.execute(
+                    "DELETE FROM ingest_manifest WHERE content_hash=%s", (content_hash,)
+                )
+                connection.execute(
+                    "DELETE FROM rooms WHERE id = ANY(%s)",
+                    ([room["id"] for room in ROOMS],),
+                )
+    logging.info("[TEST] test_same_content_in_one_call_is_loaded_once finished")
@@ -0,0 +1,37 @@
+from scripts import metrics
+from scripts.logger import logger
+import json
+import logging
+
+
+@logger
+def counting_stage(rows: int) -> None:
+    metrics.count("rows_parsed", rows)
+    counting_step()
+
+
+@logger
+def counting_step() -> None:
+    metrics.count("rows_written", 2)
+
+
+def test_logger_records_metrics(tmp_path) -> None:
+    logging.info("[TEST] test_logger_records_metrics started")
+    metrics.reset()
+    counting_stage(5)
+    counting_stage(7)
+    recorded = metrics.snapshot()
+    assert recorded["counting_stage"]["calls"] == 2
+    assert recorded["counting_stage"]["buckets"]["+Inf"] == 2
+    assert recorded["counting_stage"]["counters"] == {"rows_parsed": 12}
+    assert recorded["counting_step"]["counters"] == {"rows_written": 4}
+
+    path = metrics.write_metrics(str(tmp_path / "metrics.json"))
+    with open(path, encoding="UTF-8") as file:
+        assert json.load(file) == recorded
+    path = metrics.write_metrics(str(tmp_path / "metrics.prom"))
+    with open(path, encoding="UTF-8") as file:
+        text = file.read()
+    assert 'pipeline_call_seconds_count{function="counting_stage"} 2' in text
+    assert 'pipeline_rows_parsed_total{function="counting_stage"} 12' in text
+    logging.info("[TEST] test_logger_records_metrics finished")
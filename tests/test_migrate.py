@@ -0,0 +1,37 @@
+from scripts.connection import pooled_connection
+from scripts.setup_db import SCHEMA_SCRIPTS, migrate
+import logging
+
+# rows that must survive a script being applied again
+COUNTED = ("students", "room_stats", "table_changes", "ingest_manifest")
+
+
+def counts() -> dict[str, int]:
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT room_stats_sync()")
+            result = {}
+            for table in COUNTED:
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")  # type:ignore
+                result[table] = cursor.fetchone()[0]  # type:ignore
+    return result
+
+
+def test_migrate_applies_changed_scripts_only() -> None:
+    logging.info("[TEST] test_migrate_applies_changed_scripts_only started")
+    migrate()
+    before = counts()
+    for script in SCHEMA_SCRIPTS:
+        # as if the script had changed since it was applied
+        with pooled_connection() as connection:
+            connection.execute(
+                "UPDATE schema_migrations SET checksum='changed' WHERE script=%s",
+                (script,),
+            )
+        assert migrate() == [script]
+        assert migrate() == []
+        after = counts()
+        # applying room_stats.sql records its rebuild as a change
+        assert after.pop("table_changes") >= before["table_changes"]
+        assert after == {k: v for k, v in before.items() if k != "table_changes"}
+    logging.info("[TEST] test_migrate_applies_changed_scripts_only finished")
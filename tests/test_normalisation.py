@@ -1,7 +1,8 @@
-from scripts.setup_db import Normalisation
+from scripts.setup_db import Normalisation, RowNormaliser
 from scripts.logger import logger
 import pytest
 import logging
+import pickle
 
 
 class test_class:
@@ -68,3 +69,48 @@ def test_normalisation() -> None:
         with pytest.raises((ValueError, TypeError)):
             test.normalise_value(str(value))
     logging.info("[TEST] test_normalisation finished")
+
+
+def test_row_normaliser_matches_normalisation() -> None:
+    logging.info("[TEST] test_row_normaliser_matches_normalisation started")
+    column_parameters = [
+        (f"column_{index}", some_type, nullable)
+        for index, some_type in enumerate(
+            ["integer", "numeric", "text", "character varying", "date"]
+        )
+        for nullable in ("YES", "NO")
+    ]
+    values = [None, 1, 1.7, True, "12", "1.5", "a", "", "2011-08-22T00:00:00.000000"]
+    values += [["list"], {"dict": 1}]
+    rows = [
+        {parameter[0]: value for parameter in column_parameters} for value in values
+    ]
+    mixed = dict(rows[1])  # valid up to the date columns
+    mixed.update(column_4=1, column_5=None, column_8="bad date")
+    rows += [mixed, dict(mixed, column_8=None, column_9=None)]
+    normaliser = RowNormaliser(column_parameters)
+    single = [Normalisation(parameter) for parameter in column_parameters]
+
+    expected_rows, expected_rejected = [], []
+    for index, row in enumerate(rows):
+        converted = ()
+        for parameter, norm in zip(column_parameters, single):
+            try:
+                converted += (norm.normalise_value(row[parameter[0]]),)
+            except (ValueError, TypeError):
+                expected_rejected.append((index, parameter[0]))
+                break
+        else:
+            expected_rows.append(converted)
+        try:
+            assert normaliser.normalise_row(row) == converted
+        except (ValueError, TypeError):
+            assert expected_rejected[-1][0] == index
+
+    batch_rows, rejected = normaliser.normalise_batch(rows)
+    assert batch_rows == expected_rows
+    assert [(index, column) for index, column, _ in rejected] == expected_rejected
+    assert pickle.loads(pickle.dumps(normaliser)).normalise_batch(rows)[0] == batch_rows
+    with pytest.raises(KeyError):
+        normaliser.normalise_batch([{}])
+    logging.info("[TEST] test_row_normaliser_matches_normalisation finished")
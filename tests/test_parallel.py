@@ -0,0 +1,84 @@
+from scripts import manifest, parallel
+from scripts.connection import pooled_connection
+from scripts.parallel import parallel_insert
+from scripts.setup_db import insert_data, migrate
+import json
+import logging
+import os
+import pytest
+import time
+
+
+def test_parallel_writers_commit_together(tmp_path, monkeypatch) -> None:
+    logging.info("[TEST] test_parallel_writers_commit_together started")
+    monkeypatch.setattr("scripts.deadletter.DEAD_LETTER_DIR", str(tmp_path))
+    path = tmp_path / "parallel_check.json"
+    path.write_text(json.dumps([{"id": key, "name": f"#{key}"} for key in range(40)]))
+    column_parameters = [("id", "integer", "NO"), ("name", "text", "NO")]
+    with pooled_connection() as connection:
+        connection.execute(
+            """DROP TABLE IF EXISTS parallel_check;
+            CREATE TABLE parallel_check (id INT PRIMARY KEY, name TEXT NOT NULL)"""
+        )
+    copy_rows = parallel.copy_rows
+
+    def failing_copy_rows(cursor, name, column_parameters, rows):
+        # odd keys go to the second writer, which fails at its last batch
+        # once the first one wrote all of its share
+        if any(row[0] == 39 for row in rows):
+            time.sleep(0.5)
+            raise RuntimeError("writer failed")
+        copy_rows(cursor, name, column_parameters, rows)
+
+    try:
+        monkeypatch.setattr(parallel, "copy_rows", failing_copy_rows)
+        with pytest.raises(RuntimeError):
+            parallel_insert("parallel_check", [str(path)], column_parameters, 2, 10)
+        with pooled_connection() as connection:
+            count = connection.execute("SELECT COUNT(*) FROM parallel_check")
+            assert count.fetchone() == (0,)
+        monkeypatch.setattr(parallel, "copy_rows", copy_rows)
+        parallel_insert("parallel_check", [str(path)], column_parameters, 2, 10)
+        with pooled_connection() as connection:
+            count = connection.execute("SELECT COUNT(*) FROM parallel_check")
+            assert count.fetchone() == (40,)
+    finally:
+        with pooled_connection() as connection:
+            connection.execute("DROP TABLE parallel_check")
+    logging.info("[TEST] test_parallel_writers_commit_together finished")
+
+
+def test_parallel_load_of_malformed_file_is_not_done(tmp_path, monkeypatch) -> None:
+    logging.info("[TEST] test_parallel_load_of_malformed_file_is_not_done started")
+    migrate()
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("datasets")
+    file = "rooms (93).json"
+    path = os.path.join("datasets", file)
+    with open(path, "w", encoding="UTF-8") as w_file:
+        # cut short after its first item
+        w_file.write('[{"id": 900201, "name": "Room #900201"}, {"id": 9')
+    content_hash = manifest.file_hash(path)
+    try:
+        with pytest.raises(json.JSONDecodeError):
+            parallel_insert("rooms", [path], [("id", "integer", "NO")], 2, 1)
+        # logged by insert_data, the file is neither done nor archived
+        assert insert_data("rooms", files=[file], workers=2) is None
+        assert os.path.exists(path)
+        assert not os.path.exists(manifest.PARSED_DIR) or not os.listdir(
+            manifest.PARSED_DIR
+        )
+        with pooled_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT done FROM ingest_manifest WHERE content_hash=%s",
+                    (content_hash,),
+                )
+                assert cursor.fetchone() in (None, (False,))
+    finally:
+        with pooled_connection() as connection:
+            connection.execute(
+                "DELETE FROM ingest_manifest WHERE content_hash=%s", (content_hash,)
+            )
+            connection.execute("DELETE FROM rooms WHERE id=900201")
+    logging.info("[TEST] test_parallel_load_of_malformed_file_is_not_done finished")
@@ -0,0 +1,51 @@
+from scripts.manifest import ManifestEntry
+from scripts.pipeline import _Busy, _normalise, _read
+from scripts.setup_db import RowNormaliser
+import asyncio
+import json
+import logging
+
+
+def test_read_and_normalise_stages(tmp_path, monkeypatch) -> None:
+    logging.info("[TEST] test_read_and_normalise_stages started")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "datasets").mkdir()
+    rooms = [{"id": i, "name": f"Room #{i}"} for i in range(5)]
+    rooms.insert(2, {"id": "not a number", "name": "bad"})
+    (tmp_path / "datasets" / "rooms (1).json").write_text(json.dumps(rooms))
+    (tmp_path / "datasets" / "rooms (2).json").write_text("[]")
+    files = {
+        "rooms (1).json": ("a", ManifestEntry("rooms (1).json", 0, 0, False)),
+        "rooms (2).json": ("b", ManifestEntry("rooms (2).json", 0, 0, False)),
+    }
+    normaliser = RowNormaliser(
+        [("id", "integer", "NO"), ("name", "character varying", "NO")]
+    )
+
+    async def run() -> list:
+        parsed: asyncio.Queue = asyncio.Queue(1)
+        normalised: asyncio.Queue = asyncio.Queue(1)
+        busy = _Busy()
+        stages = asyncio.gather(
+            _read(files, 4, parsed, busy),
+            _normalise(normaliser, parsed, normalised, busy),
+        )
+        batches = []
+        while (batch := await normalised.get()) is not None:
+            batches.append(batch)
+        await stages
+        return batches
+
+    batches = asyncio.run(run())
+    assert [(batch.file, batch.count, batch.rows) for batch in batches] == [
+        ("rooms (1).json", 4, [(0, "Room #0"), (1, "Room #1"), (2, "Room #2")]),
+        ("rooms (1).json", 2, [(3, "Room #3"), (4, "Room #4")]),
+        ("rooms (1).json", 0, None),
+        ("rooms (2).json", 0, None),
+    ]
+    assert [(index, column) for index, column, _ in batches[0].rejected] == [(2, "id")]
+    assert batches[0].items[2] == rooms[2]
+    assert batches[0].offsets[2] == json.dumps(rooms).index('{"id": "not')
+    # the end of file marker carries the offset after the last item
+    assert batches[1].position == batches[2].position == len(json.dumps(rooms)) - 1
+    logging.info("[TEST] test_read_and_normalise_stages finished")
@@ -0,0 +1,86 @@
+from scripts import profiling
+import cProfile
+import logging
+import os
+import threading
+
+
+def test_profiled(tmp_path, monkeypatch) -> None:
+    logging.info("[TEST] test_profiled started")
+
+    def build(count: int) -> list[str]:
+        return [str(number) * 10 for number in range(count)]
+
+    monkeypatch.setattr(profiling, "PROFILE", set())
+    # not named: the function itself, nothing wraps it
+    assert profiling.profiled(build) is build
+    monkeypatch.setattr(profiling, "PROFILE", {"build"})
+    monkeypatch.setattr(profiling, "PROFILE_INTERVAL", 0.001)
+    monkeypatch.setenv("PROFILE_RUN_DIR", str(tmp_path))
+    wrapped = profiling.profiled(build)
+    assert wrapped is not build
+    for _ in range(3):
+        assert len(wrapped(20_000)) == 20_000
+    assert profiling.write_profiles() == str(tmp_path)
+    base = os.path.join(tmp_path, f"{build.__qualname__}.{os.getpid()}")
+    with open(base + ".txt") as summary:
+        assert "3 calls" in summary.read()
+    assert os.path.getsize(base + ".prof")
+    with open(base + ".collapsed") as collapsed:
+        lines = collapsed.read().splitlines()
+    assert lines
+    for line in lines:
+        stack, samples = line.rsplit(" ", 1)
+        assert stack.startswith("build (test_profiling.py:") and int(samples) > 0
+    # written once, the next call starts over
+    assert profiling.write_profiles() is None
+    logging.info("[TEST] test_profiled finished")
+
+
+def test_profiled_in_concurrent_threads(tmp_path, monkeypatch) -> None:
+    logging.info("[TEST] test_profiled_in_concurrent_threads started")
+    active = []
+
+    class SingleProfile(cProfile.Profile):
+        # as on Python 3.12 and later, one active profiler per process
+        def enable(self, *args, **kwargs) -> None:
+            if active:
+                raise ValueError("Another profiling tool is already active")
+            active.append(self)
+            super().enable(*args, **kwargs)
+
+        def disable(self) -> None:
+            super().disable()
+            if self in active:  # pstats disables it again
+                active.remove(self)
+
+    both = threading.Barrier(2, timeout=5)
+
+    def build(count: int) -> list[str]:
+        both.wait()  # both calls run at once
+        values = [str(number) * 10 for number in range(count)]
+        both.wait()
+        return values
+
+    monkeypatch.setattr(profiling.cProfile, "Profile", SingleProfile)
+    monkeypatch.setattr(profiling, "PROFILE", {"build"})
+    monkeypatch.setenv("PROFILE_RUN_DIR", str(tmp_path))
+    wrapped = profiling.profiled(build)
+    results: list = []
+    threads = [
+        threading.Thread(target=lambda: results.append(wrapped(10_000)))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [len(result) for result in results] == [10_000, 10_000]
+    assert not active
+    assert profiling.write_profiles() == str(tmp_path)
+    base = os.path.join(tmp_path, f"{build.__qualname__}.{os.getpid()}")
+    with open(base + ".txt") as summary:
+        assert "2 calls" in summary.read()
+    # the call holding the cProfile gathered its stats
+    assert os.path.getsize(base + ".prof")
+    logging.info("[TEST] test_profiled_in_concurrent_threads finished")
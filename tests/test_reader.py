@@ -0,0 +1,89 @@
+from scripts.reader import JsonArrayReader, batched
+import json
+import pytest
+import logging
+
+
+def test_reader_matches_json_load(tmp_path) -> None:
+    logging.info("[TEST] test_reader_matches_json_load started")
+    data = [
+        {"id": 1, "name": "Room #1", "nested": {"list": [1, 2.5, None]}},
+        12345678901234567890,
+        "ünïcödé ✓",
+        True,
+        [],
+        {"id": 2, "name": 'quote " and , bracket ]'},
+    ]
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(data, indent=4, ensure_ascii=False), encoding="UTF-8")
+    for chunk_size in (1, 3, 7, 64, 1 << 16):
+        assert list(JsonArrayReader(str(path), chunk_size=chunk_size)) == data
+    logging.info("[TEST] test_reader_matches_json_load finished")
+
+
+def test_reader_resumes_from_position(tmp_path) -> None:
+    logging.info("[TEST] test_reader_resumes_from_position started")
+    data = [{"id": i, "name": f"Röom #{i}"} for i in range(10)]
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="UTF-8")
+    raw = path.read_bytes()
+    decoder = json.JSONDecoder()
+    for offset, item in JsonArrayReader(str(path), chunk_size=5).with_offsets():
+        assert decoder.raw_decode(raw[offset:].decode())[0] == item
+    reader = JsonArrayReader(str(path), chunk_size=5)
+    head = [item for _, item in zip(range(4), reader)]
+    rest = list(JsonArrayReader(str(path), chunk_size=5, start=reader.position))
+    assert head + rest == data
+    logging.info("[TEST] test_reader_resumes_from_position finished")
+
+
+def test_reader_numbers_split_by_chunks(tmp_path) -> None:
+    logging.info("[TEST] test_reader_numbers_split_by_chunks started")
+    data = [1.5, -2.25e-3, 10e2, 2, -7, 0.5]
+    text = json.dumps(data)
+    path = tmp_path / "data.json"
+    path.write_text(text, encoding="UTF-8")
+    # every chunk boundary, in particular inside each number
+    for chunk_size in range(1, len(text) + 1):
+        assert list(JsonArrayReader(str(path), chunk_size=chunk_size)) == data
+    for offset in range(1, 8):
+        path.write_text("[" + " " * offset + "-12.5e+3]", encoding="UTF-8")
+        for chunk_size in range(1, 14):
+            reader = JsonArrayReader(str(path), chunk_size=chunk_size)
+            assert list(reader) == [-12.5e3]
+    logging.info("[TEST] test_reader_numbers_split_by_chunks finished")
+
+
+def test_reader_rejects_malformed_files(tmp_path) -> None:
+    logging.info("[TEST] test_reader_rejects_malformed_files started")
+    for content in ('{"id": 1}', "[1, 2", "[1 2]", "[1,]", ""):
+        path = tmp_path / "bad.json"
+        path.write_text(content, encoding="UTF-8")
+        with pytest.raises(ValueError):
+            list(JsonArrayReader(str(path), chunk_size=2))
+    path.write_text("[ ]", encoding="UTF-8")
+    assert list(JsonArrayReader(str(path))) == []
+    logging.info("[TEST] test_reader_rejects_malformed_files finished")
+
+
+def test_batched() -> None:
+    assert list(batched(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(batched([], 3)) == []
+    with pytest.raises(ValueError):
+        list(batched(range(3), 0))
+
+
+def test_reader_position_after_last_item(tmp_path) -> None:
+    logging.info("[TEST] test_reader_position_after_last_item started")
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps([{"id": 1}, {"id": 2}], indent=4), encoding="UTF-8")
+    reader = JsonArrayReader(str(path))
+    assert list(reader) == [{"id": 1}, {"id": 2}]
+    # resuming a fully read file yields nothing instead of failing
+    assert list(JsonArrayReader(str(path), start=reader.position)) == []
+    empty = tmp_path / "empty.json"
+    empty.write_text("[ ]", encoding="UTF-8")
+    reader = JsonArrayReader(str(empty))
+    assert list(reader) == []
+    assert list(JsonArrayReader(str(empty), start=reader.position)) == []
+    logging.info("[TEST] test_reader_position_after_last_item finished")
@@ -0,0 +1,73 @@
+from scripts.report import ENCODERS, copy_statement, register_encoder, write_json_array
+from scripts.cache import _relations, query_hash
+import io
+import json
+import logging
+import pytest
+
+
+def test_write_json_array_matches_json_dumps() -> None:
+    logging.info("[TEST] test_write_json_array_matches_json_dumps started")
+    rows = [
+        {"id": 1, "name": "Room #1", "count": 3},
+        {"id": 2, "name": 'line\nbreak "quoted"', "average_age": 21.5},
+        {"nested": {"list": [1, None, True]}, "empty": {}},
+    ]
+    for some_rows in (rows, rows[:1]):
+        w_file = io.StringIO()
+        write_json_array(w_file, iter(some_rows))
+        assert w_file.getvalue() == json.dumps(some_rows, indent=4)
+    w_file = io.StringIO()
+    write_json_array(w_file, iter([]))
+    assert w_file.getvalue() == json.dumps(None)  # json_agg of no rows
+    logging.info("[TEST] test_write_json_array_matches_json_dumps finished")
+
+
+def test_query_tables_from_plan() -> None:
+    logging.info("[TEST] test_query_tables_from_plan started")
+    plan = [
+        {
+            "Plan": {
+                "Node Type": "Hash Join",
+                "Plans": [
+                    {"Node Type": "Seq Scan", "Relation Name": "room_stats"},
+                    {
+                        "Node Type": "Hash",
+                        "Plans": [{"Node Type": "Seq Scan", "Relation Name": "rooms"}],
+                    },
+                ],
+            }
+        }
+    ]
+    assert _relations(plan) == {"room_stats", "rooms"}
+    assert query_hash("SELECT 1") != query_hash("SELECT 2")
+    logging.info("[TEST] test_query_tables_from_plan finished")
+
+
+def test_copy_statement() -> None:
+    logging.info("[TEST] test_copy_statement started")
+    assert (
+        copy_statement("SELECT 1", "csv").as_string(None)
+        == "COPY (SELECT 1) TO STDOUT (FORMAT CSV, HEADER)"
+    )
+    # CSV framing with control characters JSON text never holds raw
+    assert "QUOTE E'\\x01'" in copy_statement("SELECT 1", "ndjson").as_string(None)
+    with pytest.raises(ValueError):
+        copy_statement("SELECT 1", "xml")
+    logging.info("[TEST] test_copy_statement finished")
+
+
+def test_register_encoder() -> None:
+    logging.info("[TEST] test_register_encoder started")
+    assert {"json", "xml"} <= set(ENCODERS)
+
+    @register_encoder("test")
+    def encode_test(name, rows) -> str:
+        return f"{name}:{len(rows)}"
+
+    try:
+        assert ENCODERS["test"] is encode_test
+        assert encode_test("report", [{}, {}]) == "report:2"
+    finally:
+        del ENCODERS["test"]
+    logging.info("[TEST] test_register_encoder finished")
@@ -0,0 +1,93 @@
+from scripts.connection import pooled_connection
+from scripts.setup_db import migrate
+from datetime import date, timedelta
+from decimal import Decimal
+import logging
+import os
+import re
+
+# the reporting queries before room_stats, over students and `ages`
+AGES = "(SELECT s.*, (CURRENT_DATE-s.birthday)/365 AS age FROM students s)"
+BASELINE = {
+    "rooms_different_sex.sql": """SELECT * FROM (
+        SELECT r.name, s.room,
+        COUNT(CASE WHEN sex='M' THEN 1 END) AS male_count,
+        COUNT(CASE WHEN sex='F' THEN 1 END) AS female_count
+        FROM rooms r JOIN students s ON r.id=s.room
+        GROUP BY r.name, s.room
+    ) WHERE male_count>0 AND female_count>0""",
+    "rooms_highest_age_diff.sql": f"""SELECT r.*, (MAX(a.age)-MIN(a.age))
+        FROM rooms r JOIN {AGES} a ON r.id=a.room GROUP BY r.id, r.name""",
+    "rooms_lowest_avg_age.sql": f"""SELECT r.id, r.name, AVG(a.age)
+        FROM {AGES} a JOIN rooms r ON a.room=r.id GROUP BY r.id, r.name""",
+    "rooms_stud_number.sql": """SELECT r.*, COUNT(*)
+        FROM rooms r JOIN students s ON r.id=s.room GROUP BY r.id, r.name""",
+}
+
+ROOMS = [
+    (900_001, "Room #900001"),
+    (900_002, "Room #900002"),
+    (900_003, "Room #900003"),
+]
+
+
+def born(years: int) -> date:
+    return date.today() - timedelta(days=365 * years + 30)
+
+
+def report_rows(cursor, query: str) -> list[tuple]:
+    # every row of the report: LIMIT would cut ties differently
+    cursor.execute(re.sub(r"\bLIMIT\s+\d+", "", query))
+    rows = [
+        tuple(round(value, 9) if isinstance(value, Decimal) else value for value in row)
+        for row in cursor.fetchall()
+    ]
+    return sorted(rows, key=repr)
+
+
+def assert_matches_baseline(cursor) -> None:
+    cursor.execute("SELECT room_stats_sync()")
+    for script, baseline in BASELINE.items():
+        with open(os.path.join("sql/reporting", script), encoding="UTF-8") as file:
+            query = file.read()
+        assert report_rows(cursor, query) == report_rows(cursor, baseline), script
+
+
+def test_room_stats_matches_per_room_aggregates() -> None:
+    logging.info("[TEST] test_room_stats_matches_per_room_aggregates started")
+    migrate()
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.executemany("INSERT INTO rooms (id, name) VALUES (%s, %s)", ROOMS)
+            cursor.executemany(
+                """INSERT INTO students (id, birthday, name, room, sex)
+                VALUES (%s, %s, %s, %s, %s)""",
+                [
+                    (900_001, born(20), "a", 900_001, "M"),
+                    (900_002, born(31), "b", 900_001, "F"),
+                    (900_003, None, "c", 900_001, "F"),
+                    (900_004, born(18), "d", 900_002, "M"),
+                    (900_005, born(44), "e", 900_002, "M"),
+                    (900_006, born(25), "f", 900_003, "F"),
+                ],
+            )
+            assert_matches_baseline(cursor)
+            # the oldest of a room moves to another one, a birthday is set
+            cursor.execute("UPDATE students SET room=900_003 WHERE id=900_005")
+            cursor.execute(
+                "UPDATE students SET birthday=%s WHERE id=900_003", (born(60),)
+            )
+            assert_matches_baseline(cursor)
+            # the youngest of a room and every student of another one leave
+            cursor.execute("DELETE FROM students WHERE id IN (900_001, 900_004)")
+            assert_matches_baseline(cursor)
+            cursor.execute(
+                "SELECT student_count, age_min, age_max FROM room_stats WHERE room=%s",
+                (900_002,),
+            )
+            assert cursor.fetchone() == (0, None, None)
+            # an empty summary next to loaded students is rebuilt
+            cursor.execute("DELETE FROM room_stats")
+            assert_matches_baseline(cursor)
+            connection.rollback()
+    logging.info("[TEST] test_room_stats_matches_per_room_aggregates finished")
@@ -0,0 +1,34 @@
+from scripts.watch import MicroBatcher, table_of
+import logging
+import os
+
+
+def test_micro_batcher(tmp_path) -> None:
+    logging.info("[TEST] test_micro_batcher started")
+    assert [table_of(name) for name in ("rooms (3).json", "students.json")] == [
+        "rooms",
+        "students",
+    ]
+    assert table_of("students.csv") is None and table_of("teachers.json") is None
+    (tmp_path / "students (3).json").write_text("[]")
+    (tmp_path / "notes.txt").write_text("")
+    batcher = MicroBatcher(str(tmp_path))
+    batcher.poll(0.0)
+    # a file is ready once it did not change between two scans
+    assert batcher.due(0.0, 0.0) == []
+    (tmp_path / "rooms (3).json").write_text("[]")
+    batcher.poll(1.0)
+    assert batcher.due(1.0, 0.0) == ["students (3).json"]
+    batcher.poll(2.0)
+    # the window counts from the oldest ready file
+    assert batcher.due(2.0, 5.0) == []
+    assert batcher.due(5.0, 5.0) == ["rooms (3).json", "students (3).json"]
+    # loaded files are moved away, the others are held back
+    os.remove(tmp_path / "rooms (3).json")
+    assert batcher.loaded(["rooms (3).json", "students (3).json"], 5.0) == [
+        "students (3).json"
+    ]
+    batcher.poll(6.0)
+    assert batcher.due(6.0, 0.0) == []
+    assert list(batcher.pending) == ["students (3).json"]
+    logging.info("[TEST] test_micro_batcher finished")
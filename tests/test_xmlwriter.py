@@ -0,0 +1,45 @@
+from scripts.xmlwriter import write_xml_rows
+from dicttoxml import dicttoxml
+from xml.dom.minidom import parseString
+import io
+import logging
+
+
+def test_write_xml_rows_matches_dicttoxml() -> None:
+    logging.info("[TEST] test_write_xml_rows_matches_dicttoxml started")
+    cases = [
+        [{"id": 1, "name": "Room #1", "average_age": 13.0, "big": 1e20}],
+        [
+            {
+                "text": "a \"q\" 'ap' <t> & ünï ✓",
+                "empty": "",
+                "null": None,
+                "flags": [True, False],
+                "blank": "  ",
+                "lines": "a\nb\r\nc\rd",
+            }
+        ],
+        [{"nested": {"x": 1, "y": [1, None, {"z": 2}], "none": {}}, "list": [[1], []]}],
+        [{"1abc": 1, "123": 2, "has space": 3, "a:b": 4, "a&b": 5}],
+        None,
+    ]
+    for rows in cases:
+        expected = parseString(
+            dicttoxml(
+                rows,
+                custom_root="report",
+                item_func=lambda _: "row",
+                attr_type=False,
+                return_bytes=False,
+            )
+        ).toprettyxml(indent="   ")
+        w_file = io.StringIO()
+        write_xml_rows(w_file, "report", iter(rows or []))
+        assert w_file.getvalue() == expected
+    w_file = io.StringIO()
+    write_xml_rows(w_file, "report", [{"id": 1, "tags": ["a"]}], indent=None)
+    assert w_file.getvalue() == (
+        '<?xml version="1.0" ?>\n'
+        "<report><row><id>1</id><tags><row>a</row></tags></row></report>\n"
+    )
+    logging.info("[TEST] test_write_xml_rows_matches_dicttoxml finished")